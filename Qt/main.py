@@ -1,9 +1,13 @@
 import sys
+import multiprocessing
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QFont
 from login import LoginWindow
 
 if __name__ == "__main__":
+    # 打包后VIT推理使用DataLoader解码子进程时需要
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
     
     # 设置全局字体
@@ -138,8 +138,10 @@ class InferenceThread(QThread):
                         if not os.path.isabs(tif_folder):
                             tif_folder = os.path.join(project_root, tif_folder)
                         
-                        # 标签文件夹是固定的runs/detect/predict/labels
-                        labels_folder = os.path.join(project_root, "runs", "detect", "predict", "labels")
+                        # 标签直接写入该步骤的输出目录
+                        labels_folder = current_step.get("params", {}).get("output", "")
+                        if not os.path.isabs(labels_folder):
+                            labels_folder = os.path.join(project_root, labels_folder)
                         
                         # 发出YOLO步骤开始信号
                         self.log_message.emit(f"开始监控YOLO检测结果: {labels_folder}")
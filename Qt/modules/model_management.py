@@ -1,9 +1,40 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                               QListWidget, QListWidgetItem, QTextEdit, 
-                              QPushButton, QGroupBox, QGridLayout)
-from PySide6.QtCore import Qt
+                              QPushButton, QGroupBox, QGridLayout, QLineEdit,
+                              QComboBox, QFileDialog)
+from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QIcon, QPixmap
 
+
+class YoloExportThread(QThread):
+    """YOLO模型导出线程（导出并与.pt对比，耗时较长）"""
+    export_finished = Signal(bool, str)  # 是否成功，结果说明
+
+    def __init__(self, model_path, fmt, sample_source=""):
+        super().__init__()
+        self.model_path = model_path
+        self.fmt = fmt
+        self.sample_source = sample_source
+
+    def run(self):
+        try:
+            from utils.yolo_export import ensure_exported
+            exported, report = ensure_exported(self.model_path, self.fmt, sample_source=self.sample_source or None)
+            if report is None:
+                message = f"导出模型: {exported}"
+                if not self.sample_source:
+                    message += "\n(未指定样例图像，或已有缓存，未做一致性对比)"
+            else:
+                message = (f"导出模型: {exported}\n"
+                           f"样例图像 {report['images']} 张: pt {report['torch_ips']:.1f} 张/秒, "
+                           f"导出 {report['exported_ips']:.1f} 张/秒, 加速比 {report['speedup']:.2f}x\n"
+                           f"检测框 pt {report['torch_boxes']} / 导出 {report['exported_boxes']}, "
+                           f"匹配率 {report['match_rate']:.2%}, 坐标最大差 {report['max_coord_diff']:.2f} px")
+            self.export_finished.emit(True, message)
+        except Exception as e:
+            self.export_finished.emit(False, f"导出失败: {str(e)}")
+
+
 class ModelManagementModule(QWidget):
     def __init__(self):
         super().__init__()
@@ -63,10 +94,42 @@ class ModelManagementModule(QWidget):
         self.example_layout.addWidget(self.example_text)
         self.example_group.setLayout(self.example_layout)
         
+        # YOLO模型导出区域（仅在选择YOLO推理时显示）
+        self.export_group = QGroupBox("YOLO模型导出 (ONNX / OpenVINO)")
+        export_layout = QGridLayout()
+        self.export_model_edit = QLineEdit("config/happy.pt")
+        model_browse = QPushButton("浏览...")
+        model_browse.clicked.connect(self.browse_export_model)
+        self.export_format_combo = QComboBox()
+        self.export_format_combo.addItems(["onnx", "openvino"])
+        self.export_sample_edit = QLineEdit()
+        self.export_sample_edit.setPlaceholderText("可选，用于一致性与吞吐对比的图像文件夹")
+        sample_browse = QPushButton("浏览...")
+        sample_browse.clicked.connect(self.browse_export_samples)
+        self.export_button = QPushButton("导出")
+        self.export_button.clicked.connect(self.export_yolo_model)
+        self.export_result = QTextEdit()
+        self.export_result.setReadOnly(True)
+        self.export_result.setMaximumHeight(90)
+        export_layout.addWidget(QLabel("模型(.pt):"), 0, 0)
+        export_layout.addWidget(self.export_model_edit, 0, 1)
+        export_layout.addWidget(model_browse, 0, 2)
+        export_layout.addWidget(QLabel("格式:"), 1, 0)
+        export_layout.addWidget(self.export_format_combo, 1, 1)
+        export_layout.addWidget(self.export_button, 1, 2)
+        export_layout.addWidget(QLabel("样例图像:"), 2, 0)
+        export_layout.addWidget(self.export_sample_edit, 2, 1)
+        export_layout.addWidget(sample_browse, 2, 2)
+        export_layout.addWidget(self.export_result, 3, 0, 1, 3)
+        self.export_group.setLayout(export_layout)
+        self.export_group.setVisible(False)
+        self.export_thread = None
+
         self.right_layout.addWidget(self.tool_title)
         self.right_layout.addWidget(self.tool_description)
         self.right_layout.addWidget(self.params_group)
         self.right_layout.addWidget(self.example_group)
+        self.right_layout.addWidget(self.export_group)
         
         # 设置左右布局比例
         main_layout.addWidget(left_widget, 1)
@@ -81,6 +144,7 @@ class ModelManagementModule(QWidget):
         tool_data = current.data(Qt.UserRole)
         self.tool_title.setText(tool_data["name"])
         self.tool_description.setText(tool_data["desc"])
+        self.export_group.setVisible("yolo_predict_cli" in tool_data["name"])
         
         # 清除旧的参数说明
         while self.params_layout.count():
@@ -99,23 +163,60 @@ class ModelManagementModule(QWidget):
             
         elif "vit_predict_cli" in tool_data["name"]:
             params = [
-                ("--img-dir, -i", "输入图像文件夹路径", "必需"),
-                ("--txt-dir, -t", "输入TXT文件夹路径", "必需"),
-                ("--output, -o", "输出标签文件夹路径", "必需"),
+                ("--tif-dir, -i", "输入图像文件夹路径", "必需"),
+                ("--output, -o", "输出文件夹路径(判定表vit_verdicts.csv、保留块图层vit_keep.shp)", "必需"),
+                ("--txt-dir, -t", "旧流程TXT文件夹路径，给定时移动健康树对应的txt", "可选"),
+                ("--keep-class", "写入vit_keep.shp的类别", "可选，默认0(病树)"),
+                ("--verbose, -v", "逐块打印推理结果", "可选"),
                 ("--json-path, -j", "类别索引JSON文件路径", "必需"),
                 ("--model-path, -m", "模型权重文件路径", "必需"),
-                ("--use-cuda, -c", "是否使用CUDA", "可选，默认不使用")
+                ("--batch-size, -b", "推理批大小", "可选，默认取本机调优结果，否则64"),
+                ("--intra-op-threads", "算子内线程数(torch/onnxruntime)", "可选，默认取本机调优结果(onnx后端需autotune_cli.py --vit-onnx)"),
+                ("--inter-op-threads", "torch算子间线程数", "可选，默认取本机调优结果"),
+                ("--no-autotune", "不加载本机调优结果", "可选"),
+                ("--num-workers, -w", "图像解码子进程数", "可选，默认0"),
+                ("--decode-processes", "onnx后端解码子进程数，批数据经共享内存环形缓冲区传回", "可选，默认0"),
+                ("--prefetch-factor", "每个解码子进程预取的批数", "可选，默认2"),
+                ("--persistent-workers", "保持解码子进程常驻", "可选"),
+                ("--pin-memory", "使用锁页内存", "可选，默认仅CUDA下开启"),
+                ("--fused-attn", "注意力使用融合实现", "可选"),
+                ("--precision, -p", "推理精度 fp32/int8(INT8仅CPU)", "可选，默认fp32"),
+                ("--img-size", "模型输入分辨率(16的倍数，如112/160)，位置编码插值", "可选，默认224"),
+                ("--buckets", "按尺寸分桶，每桶独立输入分辨率", "可选，不带值时为80:112,140:160,224"),
+                ("--cache", "逐块结果缓存文件(SQLite)，命中的块跳过推理", "可选，默认不缓存"),
+                ("--cache-max-entries", "结果缓存最多条目数(LRU淘汰)", "可选，默认1000000"),
+                ("--merge-ratio", "token合并(ToMe)比例，每个block后合并的patch token比例", "可选，默认0(关闭)"),
+                ("--optimize", "模型优化 eager/frozen(TorchScript冻结图)/compile", "可选，默认eager"),
+                ("--backend", "推理后端 torch/onnx(onnxruntime，不加载torch)", "可选，默认torch"),
+                ("--use-cuda, -c", "是否使用CUDA", "可选，默认不使用"),
+                ("--server / --no-server", "常驻推理服务地址(infer_server_cli.py)/不使用服务，仅torch后端", "可选，默认自动查找本机服务")
             ]
-            example = "python cli/vit_predict_cli.py --img-dir data/images --txt-dir data/labels --output data/results --json-path config/classes.json --model-path models/vit_model.pth --use-cuda"
+            example = "python cli/vit_predict_cli.py --tif-dir data/images --output data/results --json-path config/classes.json --model-path models/vit_model.pth --use-cuda"
             
         elif "yolo_predict_cli" in tool_data["name"]:
             params = [
-                ("--input, -i", "输入图像文件夹路径", "必需"),
+                ("--input, -i", "输入图像文件夹路径，或单个大图(滑窗推理)", "必需"),
                 ("--model, -m", "YOLO模型路径", "必需"),
                 ("--output, -o", "输出标签文件夹路径", "必需"),
                 ("--conf, -c", "置信度阈值", "可选，默认0.3"),
                 ("--iou", "IOU阈值", "可选，默认0.01"),
-                ("--img-size, -s", "图像大小", "可选，默认640")
+                ("--img-size, -s", "图像大小", "可选，默认640"),
+                ("--buckets", "按尺寸分桶，每桶独立输入尺寸并组批", "可选，不带值时为160:192,320:352,640"),
+                ("--batch-size, -b", "每批图像数(批量流式推理)", "可选，默认取本机调优结果，否则16"),
+                ("--prefetch", "预先准备好的批数(就绪批队列容量)", "可选，默认2"),
+                ("--readers", "解码并letterbox的读取线程数，0为单个后台线程只解码；结束时打印各阶段耗时", "可选，默认2"),
+                ("--reader-processes", "读取改用子进程，批数据经共享内存环形缓冲区传回", "可选"),
+                ("--backend", "推理后端 torch/onnx/openvino(导出模型缓存在.pt旁，首次使用时导出)", "可选，默认torch"),
+                ("--save-candidates", "保存NMS前候选框(yolo_candidates.npz)，用yolo_rethreshold_cli.py改阈值", "可选"),
+                ("--candidate-conf", "保存候选框的置信度下限", "可选，默认0.05"),
+                ("--format", "输出格式 txt(YOLO标签)/shp(地理坐标检测框图层)", "可选，文件夹输入默认txt，大图输入为shp"),
+                ("--tile-size / --overlap", "大图滑窗的窗口大小与重叠像素", "可选，默认640/64"),
+                ("--merge-thr", "滑窗跨窗口去重阈值(交集/较小框面积)", "可选，默认0.5"),
+                ("--no-conf", "txt标签不写置信度列", "可选"),
+                ("--geo-dir", "shp格式时的tfw文件或crop_manifest.csv所在文件夹", "可选，默认为输入文件夹"),
+                ("--intra-op-threads / --inter-op-threads", "torch线程数", "可选，默认取本机调优结果"),
+                ("--no-autotune", "不加载本机调优结果", "可选"),
+                ("--server / --no-server", "常驻推理服务地址(infer_server_cli.py)/不使用服务，大图滑窗始终进程内推理", "可选，默认自动查找本机服务")
             ]
             example = "python cli/yolo_predict_cli.py --input data/images --model models/yolo_model.pt --output data/results --conf 0.4 --img-size 640"
         
@@ -129,4 +230,32 @@ class ModelManagementModule(QWidget):
             self.params_layout.addWidget(req_label, row, 2)
         
         # 设置示例
-        self.example_text.setText(example)
\ No newline at end of file
+        self.example_text.setText(example)
+
+    def browse_export_model(self):
+        """选择要导出的YOLO模型"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择YOLO模型", "", "模型文件 (*.pt)")
+        if file_path:
+            self.export_model_edit.setText(file_path)
+
+    def browse_export_samples(self):
+        """选择样例图像文件夹"""
+        folder_path = QFileDialog.getExistingDirectory(self, "选择样例图像文件夹")
+        if folder_path:
+            self.export_sample_edit.setText(folder_path)
+
+    def export_yolo_model(self):
+        """导出YOLO模型（已有缓存时直接返回缓存路径）"""
+        if self.export_thread is not None and self.export_thread.isRunning():
+            return
+        self.export_button.setEnabled(False)
+        self.export_result.setText("正在导出，请稍候...")
+        self.export_thread = YoloExportThread(self.export_model_edit.text(), self.export_format_combo.currentText(),
+                                              self.export_sample_edit.text())
+        self.export_thread.export_finished.connect(self.on_export_finished)
+        self.export_thread.start()
+
+    def on_export_finished(self, success, message):
+        """导出完成"""
+        self.export_button.setEnabled(True)
+        self.export_result.setText(message)
@@ -177,7 +177,10 @@ class PipelineModule(QWidget):
             # 推理模型
             {"name": "HSV颜色检测", "script": "cli/hsv_batch_cli.py", "category": "推理模型", "icon": "hsv.png"},
             {"name": "VIT推理", "script": "cli/vit_predict_cli.py", "category": "推理模型", "icon": "vit.png"},
+            {"name": "裁剪+VIT分类", "script": "cli/crop_classify_cli.py", "category": "推理模型", "icon": "vit.png"},
             {"name": "YOLO推理", "script": "cli/yolo_predict_cli.py", "category": "推理模型", "icon": "yolo.png"},
+            {"name": "YOLO重新筛选", "script": "cli/yolo_rethreshold_cli.py", "category": "后处理工具", "icon": "yolo.png"},
+            {"name": "置信度分流", "script": "cli/cascade_route_cli.py", "category": "后处理工具", "icon": "vit.png"},
             
             # 后处理工具
             {"name": "TXT转SHP", "script": "cli/txt_to_shp_cli.py", "category": "后处理工具", "icon": "convert.png"},
@@ -63,9 +63,8 @@ class PipelineRunnerThread(QThread):
                 else:
                     env['PYTHONPATH'] = project_root
                 
-                command = [sys.executable, script_path]
-                for k, v in step["params"].items():
-                    command.extend([f"--{k}", str(v)])
+                from utils.pipeline_args import build_cli_args
+                command = [sys.executable, script_path] + build_cli_args(step["params"])
                 
                 self.log_message.emit(f"执行命令: {' '.join(command)}")
                 
@@ -80,7 +80,10 @@ class StepConfigDialog(QDialog):
             {"name": "文件提取", "script": "cli/tiqu_cli.py"},
             {"name": "创建TXT文件", "script": "cli/create_txt_cli.py"},
             {"name": "VIT推理", "script": "cli/vit_predict_cli.py"},
-            {"name": "YOLO推理", "script": "cli/yolo_predict_cli.py"}
+            {"name": "裁剪+VIT分类", "script": "cli/crop_classify_cli.py"},
+            {"name": "YOLO推理", "script": "cli/yolo_predict_cli.py"},
+            {"name": "YOLO重新筛选", "script": "cli/yolo_rethreshold_cli.py"},
+            {"name": "置信度分流", "script": "cli/cascade_route_cli.py"}
         ]
         
         for script in scripts:
@@ -112,8 +115,14 @@ class StepConfigDialog(QDialog):
             self.add_create_txt_params()
         elif "vit_predict_cli.py" in script:
             self.add_vit_predict_params()
+        elif "crop_classify_cli.py" in script:
+            self.add_crop_classify_params()
         elif "yolo_predict_cli.py" in script:
             self.add_yolo_predict_params()
+        elif "yolo_rethreshold_cli.py" in script:
+            self.add_yolo_rethreshold_params()
+        elif "cascade_route_cli.py" in script:
+            self.add_cascade_route_params()
     
     def clear_params_form(self):
         """清除参数表单"""
@@ -149,6 +158,7 @@ class StepConfigDialog(QDialog):
         self.add_param("input", "包含Shapefile的文件夹路径:", "folder")
         self.add_param("output", "输出合并后的Shapefile路径:", "text")
         self.add_param("crs", "目标坐标参考系统:", "text", default="EPSG:4326")
+        self.add_param("extra", "额外并入的Shapefile(如cascade_accept.shp，可留空):", "text", default="")
     
     def add_shp_kuang_cut_params(self):
         """添加SHP框裁剪参数表单"""
@@ -156,6 +166,8 @@ class StepConfigDialog(QDialog):
         self.add_param("shapefile", "用于裁剪的Shapefile路径:", "file", filter="Shapefile (*.shp)")
         self.add_param("output", "输出裁剪后图像的文件夹路径:", "folder")
         self.add_param("scale", "缩放因子:", "number", default=1.0)
+        self.add_param("followup-scale", "后续裁剪缩放因子(可选):", "number")
+        self.add_param("flat", "平铺输出(免提取):", "checkbox", default=False)
     
     def add_tiqu_params(self):
         """添加文件提取参数表单"""
@@ -170,13 +182,37 @@ class StepConfigDialog(QDialog):
     
     def add_vit_predict_params(self):
         """添加VIT推理参数表单"""
-        self.add_param("img-dir", "输入图像文件夹路径:", "folder")
-        self.add_param("txt-dir", "输入TXT文件夹路径:", "folder")
-        self.add_param("output", "输出标签文件夹路径:", "folder")
+        self.add_param("tif-dir", "输入图像文件夹路径:", "folder")
+        self.add_param("output", "输出文件夹路径(判定表与保留块图层):", "folder")
+        self.add_param("keep-class", "保留类别(0为病树):", "number", default=0)
         self.add_param("json-path", "类别索引JSON文件路径:", "file", filter="JSON文件 (*.json)")
         self.add_param("model-path", "模型权重文件路径:", "file", filter="模型文件 (*.pth)")
+        self.add_param("batch-size", "推理批大小(0为本机调优值):", "number", default=0)
+        self.add_param("num-workers", "图像解码子进程数:", "number", default=0)
+        self.add_param("decode-processes", "onnx后端解码子进程数(共享内存传输):", "number", default=0)
+        self.add_param("fused-attn", "融合注意力:", "checkbox", default=False)
+        self.add_param("precision", "推理精度(fp32/int8):", "text", default="fp32")
+        self.add_param("img-size", "模型输入分辨率(16的倍数):", "number", default=224)
+        self.add_param("buckets", "尺寸分桶规则(如80:112,140:160,224，留空关闭):", "text", default="")
+        self.add_param("cache", "结果缓存文件(SQLite，留空关闭):", "text", default="data/vit_cache.sqlite")
+        self.add_param("merge-ratio", "Token合并比例(0为关闭):", "number", default=0.0)
+        self.add_param("optimize", "模型优化(eager/frozen/compile):", "text", default="eager")
+        self.add_param("backend", "推理后端(torch/onnx):", "text", default="torch")
+        self.add_param("intra-op-threads", "算子内线程数(0为本机调优值):", "number", default=0)
         self.add_param("use-cuda", "是否使用CUDA:", "checkbox", default=True)
     
+    def add_crop_classify_params(self):
+        """添加裁剪+VIT分类参数表单"""
+        self.add_param("input", "输入栅格图像路径:", "file", filter="栅格图像 (*.tif *.tiff)")
+        self.add_param("shapefile", "用于裁剪的Shapefile路径:", "file", filter="Shapefile (*.shp)")
+        self.add_param("output", "输出文件夹路径:", "folder")
+        self.add_param("scale", "缩放因子:", "number", default=1.0)
+        self.add_param("json-path", "类别索引JSON文件路径:", "file", filter="JSON文件 (*.json)")
+        self.add_param("model-path", "模型权重文件路径:", "file", filter="模型文件 (*.pth)")
+        self.add_param("batch-size", "推理批大小:", "number", default=64)
+        self.add_param("no-chips", "不保存图像(仅判定图层):", "checkbox", default=False)
+        self.add_param("use-cuda", "是否使用CUDA:", "checkbox", default=False)
+    
     def add_yolo_predict_params(self):
         """添加YOLO推理参数表单"""
         self.add_param("input", "输入图像文件夹路径:", "folder")
@@ -185,6 +221,33 @@ class StepConfigDialog(QDialog):
         self.add_param("conf", "置信度阈值:", "number", default=0.3)
         self.add_param("iou", "IOU阈值:", "number", default=0.01)
         self.add_param("img-size", "图像大小:", "number", default=640)
+        self.add_param("buckets", "尺寸分桶规则(如160:192,320:352,640，留空关闭):", "text", default="")
+        self.add_param("batch-size", "推理批大小(0为本机调优值):", "number", default=0)
+        self.add_param("readers", "读取线程数(解码与letterbox):", "number", default=2)
+        self.add_param("reader-processes", "读取改用子进程(共享内存传输):", "checkbox", default=False)
+        self.add_param("backend", "推理后端(torch/onnx/openvino):", "text", default="torch")
+        self.add_param("format", "输出格式(txt或shp，留空按输入自动):", "text", default="")
+        self.add_param("tile-size", "大图滑窗窗口大小:", "number", default=640)
+        self.add_param("overlap", "大图滑窗重叠像素:", "number", default=64)
+        self.add_param("save-candidates", "保存候选框(可重新筛选阈值):", "checkbox", default=False)
+    
+    def add_yolo_rethreshold_params(self):
+        """添加YOLO重新筛选参数表单"""
+        self.add_param("candidates", "候选框所在文件夹:", "folder")
+        self.add_param("output", "输出文件夹路径:", "folder")
+        self.add_param("conf", "置信度阈值:", "number", default=0.3)
+        self.add_param("iou", "IOU阈值:", "number", default=0.01)
+        self.add_param("format", "输出格式(txt或shp，留空按候选框自动):", "text", default="")
+        self.add_param("no-conf", "txt标签不写置信度:", "checkbox", default=False)
+    
+    def add_cascade_route_params(self):
+        """添加置信度分流参数表单"""
+        self.add_param("vit-dir", "VIT推理输出文件夹:", "folder")
+        self.add_param("chips", "VIT输入的平铺裁剪文件夹:", "folder")
+        self.add_param("output", "输出文件夹路径:", "folder")
+        self.add_param("keep-class", "保留类别(0为病树):", "number", default=0)
+        self.add_param("accept-prob", "直接接受的概率阈值:", "number", default=0.95)
+        self.add_param("reject-prob", "直接丢弃的概率阈值:", "number", default=0.5)
     
     def add_param(self, name, label, type, default=None, filter=None):
         """添加参数表单项"""
@@ -67,6 +67,10 @@ class QtPipelineRunnerThread(QThread):
         except Exception as e:
             self.log_message.emit(f"流程运行异常: {str(e)}")
             self.pipeline_completed.emit(False)
+        finally:
+            # 区域缓存只在一次流程运行内复用，结束后释放内存
+            if "utils.shp_kuang_cut" in sys.modules:
+                sys.modules["utils.shp_kuang_cut"].REGION_CACHE.clear()
     
     def _is_progress_supported_step(self, script_path):
         """检查步骤是否支持进度条"""
@@ -100,12 +104,14 @@ class QtPipelineRunnerThread(QThread):
                 return True
                 
             elif "shp_kuang_cut_cli.py" in script_path:
-                from utils.shp_kuang_cut import crop_and_save_raster
+                from utils.shp_kuang_cut import crop_and_save_raster, REGION_CACHE
                 
                 input_tif = params.get("input", "")
                 shapefile = params.get("shapefile", "")
                 output_dir = params.get("output", "")
                 scale = params.get("scale", 1.0)
+                flat = params.get("flat", False)
+                followup_scale = params.get("followup-scale") or None
                 
                 self.log_message.emit(f"使用进度条执行图像裁剪: {input_tif} -> {output_dir}")
                 
@@ -117,8 +123,12 @@ class QtPipelineRunnerThread(QThread):
                     scale,
                     progress_bar=self.progress_bar,
                     progress_signal=self.progress_updated,
-                    log_signal=self.log_message
+                    log_signal=self.log_message,
+                    flat=flat,
+                    cache=REGION_CACHE,  # 同一进程中的多次裁剪共享已解码的区域
+                    followup_scale=followup_scale
                 )
+                self.log_message.emit(f"区域缓存: 命中 {REGION_CACHE.hits} 次，未命中 {REGION_CACHE.misses} 次")
                 
                 return True
             
@@ -160,9 +170,8 @@ class QtPipelineRunnerThread(QThread):
                     sub_dir = os.path.join(project_root, v)
                     os.makedirs(os.path.dirname(sub_dir), exist_ok=True)
             
-            command = [sys.executable, script_path]
-            for k, v in params.items():
-                command.extend([f"--{k}", str(v)])
+            from utils.pipeline_args import build_cli_args
+            command = [sys.executable, script_path] + build_cli_args(params)
             
             self.log_message.emit(f"执行命令: {' '.join(command)}")
             
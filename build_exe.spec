@@ -36,7 +36,25 @@ a = Analysis(
         'utils.tiqu',
         'utils.txt_to_shp',
         'utils.vit_model',
+        'utils.vit_export',
+        'utils.vit_io',
+        'utils.vit_onnx',
+        'utils.bucketing',
+        'utils.vit_cache',
+        'utils.autotune',
+        'utils.yolo_predict',
+        'utils.yolo_tiled',
+        'utils.yolo_export',
+        'utils.yolo_candidates',
+        'utils.cascade',
+        'utils.shm_ring',
+        'utils.infer_client',
+        'utils.infer_server',
+        'onnxruntime',
+        'openvino',
         'utils.qt_tqdm',
+        'utils.benchmark',
+        'utils.pipeline_args',
         # 添加所有cli模块
         'cli.cutting_cli',
         'cli.hsv_batch_cli',
@@ -44,7 +62,13 @@ a = Analysis(
         'cli.shp_kuang_cut_cli',
         'cli.txt_to_shp_cli',
         'cli.yolo_predict_cli',
+        'cli.yolo_rethreshold_cli',
+        'cli.cascade_route_cli',
+        'cli.infer_server_cli',
         'cli.vit_predict_cli',
+        'cli.crop_classify_cli',
+        'cli.benchmark_cli',
+        'cli.autotune_cli',
     ],
     hookspath=[],
     hooksconfig={},
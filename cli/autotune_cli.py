@@ -0,0 +1,39 @@
+import argparse
+from utils import autotune
+
+def main():
+    parser = argparse.ArgumentParser(description='在本机上自动调优VIT/YOLO推理的批大小与线程数')
+    parser.add_argument('--vit-model', default="config/vit_gq.pth", help='VIT模型权重文件路径')
+    parser.add_argument('--yolo-model', default="config/happy.pt", help='YOLO模型路径')
+    parser.add_argument('--skip-vit', action='store_true', help='不调优VIT')
+    parser.add_argument('--skip-yolo', action='store_true', help='不调优YOLO')
+    parser.add_argument('--vit-onnx', action='store_true', help='同时调优VIT的onnxruntime后端(--backend onnx时使用)')
+    parser.add_argument('--vit-img-size', type=int, default=224, help='VIT输入分辨率')
+    parser.add_argument('--yolo-img-size', type=int, default=640, help='YOLO输入尺寸')
+    parser.add_argument('--vit-batch-sizes', type=int, nargs='+', default=[8, 16, 32, 64, 128], help='VIT候选批大小')
+    parser.add_argument('--yolo-batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16, 32], help='YOLO候选批大小')
+    parser.add_argument('--intra-threads', type=int, nargs='+', default=None,
+                        help='候选intra-op线程数(默认CPU核数的1/4、1/2和全部)')
+    parser.add_argument('--inter-threads', type=int, nargs='+', default=[1, 2], help='候选inter-op线程数')
+    parser.add_argument('--min-time', type=float, default=2.0, help='每个组合的最短测量时间(秒)')
+    parser.add_argument('--output', '-o', default=None, help='调优结果文件(默认 config/autotune_<主机名>.json)')
+
+    args = parser.parse_args()
+
+    results = {}
+    if not args.skip_vit:
+        results['vit'] = autotune.tune('vit', args.vit_model, args.vit_img_size, args.vit_batch_sizes,
+                                       args.intra_threads, args.inter_threads, args.min_time)
+    if args.vit_onnx:
+        results['vit_onnx'] = autotune.tune('vit_onnx', args.vit_model, args.vit_img_size, args.vit_batch_sizes,
+                                            args.intra_threads, args.inter_threads, args.min_time)
+    if not args.skip_yolo:
+        results['yolo'] = autotune.tune('yolo', args.yolo_model, args.yolo_img_size, args.yolo_batch_sizes,
+                                        args.intra_threads, args.inter_threads, args.min_time)
+    if not results:
+        parser.error('--skip-vit 与 --skip-yolo 不能同时指定')
+
+    autotune.save_profile(results, args.output)
+
+if __name__ == "__main__":
+    main()
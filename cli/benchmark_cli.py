@@ -0,0 +1,111 @@
+import argparse
+from utils import benchmark
+
+def main():
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rect_parser = subparsers.add_parser('rotated-rect', help='最小外接矩形：逐要素与向量化实现对比')
+    rect_parser.add_argument('--count', '-n', type=int, default=100000, help='多边形数量')
+    rect_parser.add_argument('--scale', '-sc', type=float, default=1.5, help='缩放因子')
+
+    chip_parser = subparsers.add_parser('chip-stream', help='检查流式裁剪与全部读入后裁剪的结果一致（不一致时报错）')
+    chip_parser.add_argument('--count', '-n', type=int, default=2000, help='合成多边形数量')
+    chip_parser.add_argument('--scales', '-sc', type=float, nargs='+', default=[1.0, 1.5], help='检查的缩放因子')
+    chip_parser.add_argument('--chunk-size', type=int, default=97, help='流式读取的每批要素数')
+
+    attn_parser = subparsers.add_parser('vit-attention', help='ViT-B/16 eager注意力与融合注意力对比')
+    attn_parser.add_argument('--batch-sizes', '-b', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64, 128],
+                             help='测试的批大小')
+    attn_parser.add_argument('--repeat', '-r', type=int, default=3, help='每个批大小重复次数(取最快)')
+    attn_parser.add_argument('--threads', '-t', type=int, default=None, help='torch计算线程数')
+    attn_parser.add_argument('--atol', type=float, default=1e-4, help='两种注意力输出允许的最大绝对误差')
+
+    int8_parser = subparsers.add_parser('vit-int8', help='动态INT8量化VIT与fp32的准确率与吞吐对比')
+    int8_parser.add_argument('--data-dir', '-d', required=True, help='带标签图像文件夹(子文件夹名为类别名)')
+    int8_parser.add_argument('--json-path', '-j', default="config/class_indices.json", help='类别索引JSON文件路径')
+    int8_parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径')
+    int8_parser.add_argument('--batch-size', '-b', type=int, default=64, help='推理批大小')
+    int8_parser.add_argument('--limit', '-n', type=int, default=None, help='最多使用的图像数')
+    int8_parser.add_argument('--threads', '-t', type=int, default=None, help='torch计算线程数')
+
+    tome_parser = subparsers.add_parser('vit-tome', help='扫描token合并(ToMe)比例，对比准确率与吞吐')
+    tome_parser.add_argument('--data-dir', '-d', required=True, help='带标签图像文件夹(子文件夹名为类别名)')
+    tome_parser.add_argument('--json-path', '-j', default="config/class_indices.json", help='类别索引JSON文件路径')
+    tome_parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径')
+    tome_parser.add_argument('--ratios', type=float, nargs='+', default=[0., 0.05, 0.1, 0.15, 0.2],
+                             help='扫描的合并比例(第一个作为参考)')
+    tome_parser.add_argument('--batch-size', '-b', type=int, default=64, help='推理批大小')
+    tome_parser.add_argument('--limit', '-n', type=int, default=None, help='最多使用的图像数')
+    tome_parser.add_argument('--threads', '-t', type=int, default=None, help='torch计算线程数')
+    tome_parser.add_argument('--use-cuda', '-c', action='store_true', help='是否使用CUDA')
+
+    res_parser = subparsers.add_parser('vit-resolution', help='不同输入分辨率下VIT的准确率与吞吐表')
+    res_parser.add_argument('--data-dir', '-d', required=True, help='带标签图像文件夹(子文件夹名为类别名)')
+    res_parser.add_argument('--json-path', '-j', default="config/class_indices.json", help='类别索引JSON文件路径')
+    res_parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径')
+    res_parser.add_argument('--img-sizes', type=int, nargs='+', default=[224, 192, 160, 128, 112],
+                            help='测试的输入分辨率(16的倍数，第一个作为参考)')
+    res_parser.add_argument('--batch-size', '-b', type=int, default=64, help='推理批大小')
+    res_parser.add_argument('--limit', '-n', type=int, default=None, help='最多使用的图像数')
+    res_parser.add_argument('--threads', '-t', type=int, default=None, help='torch计算线程数')
+    res_parser.add_argument('--use-cuda', '-c', action='store_true', help='是否使用CUDA')
+
+    onnx_parser = subparsers.add_parser('vit-onnx', help='VIT torch后端与onnxruntime后端的一致性与吞吐对比')
+    onnx_parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径')
+    onnx_parser.add_argument('--batch-sizes', '-b', type=int, nargs='+', default=[1, 8, 32, 64], help='测试的批大小')
+    onnx_parser.add_argument('--repeat', '-r', type=int, default=3, help='每个批大小重复次数(取最快)')
+    onnx_parser.add_argument('--threads', '-t', type=int, default=None, help='torch/onnxruntime计算线程数')
+    onnx_parser.add_argument('--img-dir', '-i', default=None, help='可选，用真实图像检查两条预处理路径的一致性')
+
+    parity_parser = subparsers.add_parser('vit-onnx-parity',
+                                          help='同一批块经torch与onnxruntime两条预处理/推理路径的一致性检查（不一致时报错）')
+    parity_parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径')
+    parity_parser.add_argument('--img-dir', '-i', default=None, help='检查用的块文件夹(不指定时生成不同尺寸的随机块)')
+    parity_parser.add_argument('--img-sizes', type=int, nargs='+', default=[224], help='检查的输入分辨率')
+    parity_parser.add_argument('--atol', type=float, default=1e-3, help='softmax概率允许的最大绝对误差')
+
+    yolo_parser = subparsers.add_parser('yolo-batch', help='YOLO逐张循环与批量流式推理的吞吐对比')
+    yolo_parser.add_argument('--model-path', '-m', default="config/happy.pt", help='YOLO模型路径')
+    yolo_parser.add_argument('--img-dir', '-i', default=None, help='瓦片文件夹(不指定时生成随机瓦片)')
+    yolo_parser.add_argument('--count', '-n', type=int, default=10000, help='推理的瓦片数(不足时循环使用)')
+    yolo_parser.add_argument('--batch-sizes', '-b', type=int, nargs='+', default=[8, 16, 32], help='测试的批大小')
+    yolo_parser.add_argument('--img-size', '-s', type=int, default=640, help='YOLO输入尺寸')
+    yolo_parser.add_argument('--tile-size', type=int, default=640, help='随机瓦片边长')
+    yolo_parser.add_argument('--threads', '-t', type=int, default=None, help='torch计算线程数')
+
+    ipc_parser = subparsers.add_parser('ipc', help='解码子进程到推理进程的批数据传输：pickle队列与共享内存环形缓冲区对比')
+    ipc_parser.add_argument('--count', '-n', type=int, default=4096, help='传输的块数')
+    ipc_parser.add_argument('--batch-size', '-b', type=int, default=16, help='每批块数')
+    ipc_parser.add_argument('--workers', '-w', type=int, default=2, help='子进程数')
+    ipc_parser.add_argument('--repeat', '-r', type=int, default=3, help='重复次数(取最快)')
+
+    args = parser.parse_args()
+
+    if args.command == 'rotated-rect':
+        benchmark.bench_rotated_rect(args.count, args.scale)
+    elif args.command == 'chip-stream':
+        benchmark.check_chip_stream(args.count, args.scales, args.chunk_size)
+    elif args.command == 'vit-attention':
+        benchmark.bench_vit_attention(args.batch_sizes, args.repeat, args.threads, args.atol)
+    elif args.command == 'vit-int8':
+        benchmark.bench_vit_int8(args.data_dir, args.json_path, args.model_path, args.batch_size, args.limit,
+                                 args.threads)
+    elif args.command == 'vit-tome':
+        benchmark.bench_vit_tome(args.data_dir, args.json_path, args.model_path, args.ratios, args.batch_size,
+                                 args.limit, args.threads, args.use_cuda)
+    elif args.command == 'vit-resolution':
+        benchmark.bench_vit_resolution(args.data_dir, args.json_path, args.model_path, args.img_sizes,
+                                       args.batch_size, args.limit, args.threads, args.use_cuda)
+    elif args.command == 'vit-onnx':
+        benchmark.bench_vit_onnx(args.model_path, args.batch_sizes, args.repeat, args.threads, args.img_dir)
+    elif args.command == 'vit-onnx-parity':
+        benchmark.check_vit_onnx_parity(args.model_path, args.img_dir, args.img_sizes, args.atol)
+    elif args.command == 'yolo-batch':
+        benchmark.bench_yolo_batch(args.model_path, args.img_dir, args.count, args.batch_sizes, args.img_size,
+                                   args.tile_size, num_threads=args.threads)
+    elif args.command == 'ipc':
+        benchmark.bench_ipc(args.count, args.batch_size, args.workers, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import os
+from utils.cascade import ACCEPT_LAYER_NAME, YOLO_LAYER_NAME, print_report, route_chips
+from utils.shp_kuang_cut import FLAT_LAYER_NAME
+from utils import autotune
+
+def main():
+    parser = argparse.ArgumentParser(description='按VIT判定的置信度分流：高置信病树直接输出，高置信健康树丢弃，其余送入YOLO')
+    parser.add_argument('--vit-dir', '-i', required=True, help='VIT推理输出文件夹(包含vit_verdicts.csv)')
+    parser.add_argument('--chips', '-c', required=True,
+                        help=f'VIT输入的平铺裁剪文件夹(包含{FLAT_LAYER_NAME})或块图层路径')
+    parser.add_argument('--output', '-o', required=True,
+                        help=f'输出文件夹，写入 {ACCEPT_LAYER_NAME}(直接接受)、{YOLO_LAYER_NAME}(送入YOLO)、分流表与报告')
+    parser.add_argument('--keep-class', type=int, default=0, help='保留类别(默认0，病树)')
+    parser.add_argument('--accept-prob', type=float, default=0.95,
+                        help='判定为保留类别且概率不低于该值的块直接接受，不经过YOLO；大于1时全部送入YOLO')
+    parser.add_argument('--reject-prob', type=float, default=0.5,
+                        help='判定为其他类别且概率不低于该值的块丢弃，其余送入YOLO复核；0.5为全部丢弃(与原流程一致)')
+    parser.add_argument('--yolo-ips', type=float, default=None,
+                        help='YOLO每秒处理的块数，用于估算节省的时间(默认取本机调优结果)')
+
+    args = parser.parse_args()
+    chips_shp = os.path.join(args.chips, FLAT_LAYER_NAME) if os.path.isdir(args.chips) else args.chips
+    yolo_ips = args.yolo_ips or autotune.load_profile('yolo').get('ips')
+
+    report = route_chips(args.vit_dir, chips_shp, args.output, args.keep_class, args.accept_prob,
+                         args.reject_prob, yolo_ips)
+    print_report(report)
+
+    print(f"置信度分流完成。结果保存在: {args.output}")
+
+if __name__ == "__main__":
+    main()
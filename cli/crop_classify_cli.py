@@ -0,0 +1,57 @@
+import argparse
+import os
+import torch
+from utils.predect import crop_and_classify
+
+def main():
+    parser = argparse.ArgumentParser(description='SHP框裁剪与VIT分类融合，裁剪块不落盘直接推理')
+    parser.add_argument('--input', '-i', required=True, help='输入栅格图像路径')
+    parser.add_argument('--shapefile', '-s', required=True, help='用于裁剪的Shapefile路径')
+    parser.add_argument('--output', '-o', required=True, help='输出文件夹路径')
+    parser.add_argument('--scale', '-sc', type=float, default=1.0, help='缩放因子')
+
+    parser.add_argument('--json-path', '-j', default="config/class_indices.json", help='类别索引JSON文件路径(默认: class_indices.json)')
+    parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径(默认: vit_gq.pth)')
+    parser.add_argument('--batch-size', '-b', type=int, default=64, help='推理批大小')
+    parser.add_argument('--queue-size', '-q', type=int, default=256, help='裁剪与推理之间的队列长度')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='每批流式读取并向量化处理的要素数')
+    parser.add_argument('--keep-class', '-k', type=int, default=0, help='需要保留的类别(默认0: 病树)')
+    parser.add_argument('--no-chips', action='store_true', help='不保存保留块的图像，只输出判定图层')
+    parser.add_argument('--followup-scale', type=float, default=None, help='保留块的二次裁剪比例(如1.5)，与首次裁剪共用一次读取')
+    parser.add_argument('--followup-output', default=None, help='二次裁剪结果的输出文件夹路径')
+
+    parser.add_argument('--fused-attn', action='store_true', help='注意力使用融合的scaled_dot_product_attention实现')
+    parser.add_argument('--precision', '-p', choices=['fp32', 'int8'], default='fp32',
+                        help='推理精度，int8为nn.Linear动态量化(仅CPU，量化权重缓存在权重文件旁)')
+    parser.add_argument('--img-size', type=int, default=224,
+                        help='模型输入分辨率(16的倍数，如112、160)，位置编码由224插值，分辨率越低越快')
+    parser.add_argument('--merge-ratio', type=float, default=0.,
+                        help='token合并(ToMe)比例，每个block后合并该比例的patch token，0为关闭')
+    parser.add_argument('--optimize', choices=['eager', 'frozen', 'compile'], default='eager',
+                        help='模型优化方式：frozen为TorchScript冻结图(缓存在权重旁边)，compile为torch.compile，失败时退回eager')
+    parser.add_argument('--use-cuda', '-c', action='store_true', help='是否使用CUDA')
+
+    args = parser.parse_args()
+    if args.img_size % 16 != 0:
+        parser.error('--img-size 必须是16的倍数')
+    if (args.followup_scale is None) != (args.followup_output is None):
+        parser.error('--followup-scale 与 --followup-output 需要同时指定')
+
+    # 确保输出目录存在
+    os.makedirs(args.output, exist_ok=True)
+
+    # 设置设备
+    device = torch.device("cuda:0" if args.use_cuda and torch.cuda.is_available() else "cpu")
+
+    # 执行裁剪与推理
+    crop_and_classify(args.input, args.shapefile, args.output, args.json_path, args.model_path, device,
+                      scale_factor=args.scale, batch_size=args.batch_size, queue_size=args.queue_size,
+                      keep_class=args.keep_class, save_chips=not args.no_chips,
+                      followup_scale=args.followup_scale, followup_dir=args.followup_output, chunk_size=args.chunk_size,
+                      fused_attn=args.fused_attn, precision=args.precision, optimize=args.optimize,
+                      merge_ratio=args.merge_ratio, img_size=args.img_size)
+
+    print(f"裁剪分类完成。结果保存在: {args.output}")
+
+if __name__ == "__main__":
+    main()
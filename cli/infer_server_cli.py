@@ -0,0 +1,49 @@
+import argparse
+import os
+from utils import autotune
+from utils.infer_client import DEFAULT_HOST, DEFAULT_PORT, server_info_path
+
+def main():
+    parser = argparse.ArgumentParser(description='启动常驻推理服务：VIT与YOLO模型常驻内存，供多次流水线运行共用')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='监听地址(服务没有鉴权，只能是本机回环地址，如127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--vit-model', default=None, help='启动时预加载的VIT权重(如config/vit_gq.pth)，其余模型在首次请求时加载')
+    parser.add_argument('--vit-img-size', type=int, default=224, help='预加载VIT的输入分辨率')
+    parser.add_argument('--yolo-model', default=None, help='启动时预加载的YOLO模型(如config/happy.pt)')
+    parser.add_argument('--yolo-backend', choices=['torch', 'onnx', 'openvino'], default='torch', help='预加载YOLO的推理后端')
+    parser.add_argument('--model-root', nargs='+', default=['config'],
+                        help='允许按请求加载模型的目录(默认config/)，预加载模型所在目录自动加入')
+    parser.add_argument('--decode-threads', type=int, default=4, help='服务端解码图像的线程数')
+    parser.add_argument('--use-cuda', '-c', action='store_true', help='VIT使用CUDA')
+    parser.add_argument('--intra-op-threads', type=int, default=None, help='torch算子内线程数(默认取本机VIT调优结果)')
+    parser.add_argument('--inter-op-threads', type=int, default=None, help='torch算子间线程数(默认取本机VIT调优结果)')
+    parser.add_argument('--no-autotune', action='store_true', help='不加载本机调优结果(cli/autotune_cli.py生成)')
+
+    args = parser.parse_args()
+
+    import torch
+    from utils.infer_server import InferenceService, is_loopback, serve
+
+    if not is_loopback(args.host):
+        parser.error('--host 只能是本机回环地址(如127.0.0.1、localhost)：服务没有鉴权，加载模型会反序列化权重文件')
+
+    _, intra_op_threads, inter_op_threads = autotune.resolve(
+        'vit', None, args.intra_op_threads, args.inter_op_threads, use_profile=not args.no_autotune)
+    autotune.apply_threads(intra_op_threads, inter_op_threads)
+    device = 'cuda:0' if args.use_cuda and torch.cuda.is_available() else 'cpu'
+    roots = [os.path.join(autotune.base_dir(), root) if not os.path.isabs(root) else root for root in args.model_root]
+    service = InferenceService(device, args.decode_threads, roots)
+
+    # 预加载并预热，首个请求不再等待加载；路径在服务内规范为绝对路径，与客户端请求的键一致
+    for model_path in (args.vit_model, args.yolo_model):
+        if model_path:
+            service.allow_model_dir(model_path)
+    if args.vit_model:
+        service.vit_model(args.vit_model, args.vit_img_size)
+    if args.yolo_model:
+        service.yolo_model(args.yolo_model, args.yolo_backend)
+
+    serve(args.host, args.port, service, server_info_path())
+
+if __name__ == "__main__":
+    main()
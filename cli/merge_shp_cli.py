@@ -7,6 +7,8 @@ def main():
     parser.add_argument('--input', '-i', required=True, help='包含Shapefile的文件夹路径')
     parser.add_argument('--output', '-o', required=True, help='输出合并后的Shapefile路径')
     parser.add_argument('--crs', default='EPSG:4326', help='目标坐标参考系统')
+    parser.add_argument('--extra', nargs='*', default=None,
+                        help='额外并入的Shapefile路径，如置信度分流直接接受的块图层cascade_accept.shp')
     
     args = parser.parse_args()
     
@@ -15,7 +17,7 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
     
     # 执行合并
-    merge_shp(args.input, args.output, args.crs)
+    merge_shp(args.input, args.output, args.crs, args.extra)
     
     print(f"合并完成。合并后的Shapefile保存在: {args.output}")
 
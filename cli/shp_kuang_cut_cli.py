@@ -1,13 +1,18 @@
 import argparse
 import os
-from utils.shp_kuang_cut import crop_and_save_raster
+from utils.shp_kuang_cut import crop_and_save_raster, REGION_CACHE
 
 def main():
     parser = argparse.ArgumentParser(description='根据Shapefile裁剪栅格图像')
     parser.add_argument('--input', '-i', required=True, help='输入栅格图像路径')
     parser.add_argument('--shapefile', '-s', required=True, help='用于裁剪的Shapefile路径')
     parser.add_argument('--output', '-o', required=True, help='输出裁剪后图像的文件夹路径')
-    parser.add_argument('--scale', '-sc', type=float, default=1.0, help='缩放因子')
+    parser.add_argument('--scale', '-sc', type=float, nargs='+', default=[1.0],
+                        help='缩放因子，给出多个时每个区域只读取一次，各比例结果写入 scale_<比例> 子文件夹')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='每批流式读取并向量化处理的要素数')
+    parser.add_argument('--followup-scale', type=float, default=None,
+                        help='后续裁剪步骤的缩放因子：区域按它读取并缓存，同一进程中的后续裁剪直接复用')
+    parser.add_argument('--flat', action='store_true', help='平铺输出：裁剪块直接写入输出文件夹，外接矩形合并为一个SHP，地理变换写入清单')
     
     args = parser.parse_args()
     
@@ -15,7 +20,12 @@ def main():
     os.makedirs(args.output, exist_ok=True)
     
     # 执行裁剪
-    crop_and_save_raster(args.input, args.shapefile, args.output, args.scale, progress_bar=None, progress_signal=None, log_signal=None)
+    scale = args.scale if len(args.scale) > 1 else args.scale[0]
+    crop_and_save_raster(args.input, args.shapefile, args.output, scale, progress_bar=None, progress_signal=None, log_signal=None,
+                         flat=args.flat, chunk_size=args.chunk_size, cache=REGION_CACHE,
+                         followup_scale=args.followup_scale)
+    if REGION_CACHE.hits:
+        print(f"区域缓存命中 {REGION_CACHE.hits} 次，未命中 {REGION_CACHE.misses} 次")
     
     print(f"裁剪完成。裁剪后的图像保存在: {args.output}")
 
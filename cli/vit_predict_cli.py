@@ -1,29 +1,112 @@
 import argparse
 import os
-import torch
-from utils.predect import predict_and_move
+from utils.bucketing import DEFAULT_VIT_BUCKETS
+from utils.vit_cache import DEFAULT_MAX_ENTRIES
+from utils import autotune
+from utils import infer_client
 
 def main():
     parser = argparse.ArgumentParser(description='使用VIT模型进行推理')
     parser.add_argument('--tif-dir', '-i', required=True, help='输入图像文件夹路径')
-    parser.add_argument('--txt-dir', '-t', required=True, help='输入TXT文件夹路径')
-    parser.add_argument('--output', '-o', required=True, help='输出标签文件夹路径')
+    parser.add_argument('--output', '-o', required=True,
+                        help='输出文件夹路径，写入判定表vit_verdicts.csv；输入为平铺裁剪结果时同时写入保留块图层vit_keep.shp')
+    parser.add_argument('--txt-dir', '-t', default=None,
+                        help='可选，旧流程的TXT文件夹路径，给定时将健康树对应的txt移动到输出文件夹')
+    parser.add_argument('--keep-class', type=int, default=0, help='写入vit_keep.shp的类别(默认0，病树)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='逐块打印推理结果')
 
     parser.add_argument('--json-path', '-j', default="config/class_indices.json", help='类别索引JSON文件路径(默认: class_indices.json)')
     parser.add_argument('--model-path', '-m', default="config/vit_gq.pth", help='模型权重文件路径(默认: vit_gq.pth)')
 
+    parser.add_argument('--batch-size', '-b', type=int, default=None, help='推理批大小(不指定或0时取本机调优结果，否则64)')
+    parser.add_argument('--num-workers', '-w', type=int, default=0, help='图像解码子进程数(0表示在主进程中解码)')
+    parser.add_argument('--prefetch-factor', type=int, default=2, help='每个解码子进程预取的批数')
+    parser.add_argument('--persistent-workers', action='store_true', help='保持解码子进程常驻')
+    parser.add_argument('--pin-memory', action='store_true', help='使用锁页内存(默认仅在CUDA下开启)')
+    parser.add_argument('--decode-processes', type=int, default=0,
+                        help='onnx后端的解码子进程数，批数据经共享内存环形缓冲区传回(0表示不使用子进程；'
+                             'torch后端的--num-workers已通过torch共享内存传递张量)')
+
+    parser.add_argument('--fused-attn', action='store_true', help='注意力使用融合的scaled_dot_product_attention实现')
+    parser.add_argument('--precision', '-p', choices=['fp32', 'int8'], default='fp32',
+                        help='推理精度，int8为nn.Linear动态量化(仅CPU，量化权重缓存在权重文件旁)')
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch',
+                        help='推理后端，onnx使用onnxruntime(首次运行时导出ONNX并缓存在权重文件旁，不加载torch)')
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help='算子内线程数(torch/onnxruntime，默认取本机调优结果，否则torch默认值/CPU核数)')
+    parser.add_argument('--inter-op-threads', type=int, default=None, help='torch算子间线程数(默认取本机调优结果)')
+    parser.add_argument('--no-autotune', action='store_true', help='不加载本机调优结果(cli/autotune_cli.py生成)')
+    parser.add_argument('--img-size', type=int, default=224,
+                        help='模型输入分辨率(16的倍数，如112、160)，位置编码由224插值，分辨率越低越快')
+    parser.add_argument('--buckets', nargs='?', const=DEFAULT_VIT_BUCKETS, default=None,
+                        help=f'按图像尺寸分桶推理，每个桶使用自己的输入分辨率(忽略--img-size)；'
+                             f'不带值时使用 "{DEFAULT_VIT_BUCKETS}"，即最长边<=80用112，<=140用160，其余224')
+    parser.add_argument('--cache', default=None,
+                        help='逐块结果缓存文件(SQLite)，按块内容与模型权重/配置哈希命中，命中的块跳过推理')
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help='结果缓存最多保留的条目数，超出时按最近使用淘汰')
+    parser.add_argument('--merge-ratio', type=float, default=0.,
+                        help='token合并(ToMe)比例，每个block后合并该比例的patch token，0为关闭')
+    parser.add_argument('--optimize', choices=['eager', 'frozen', 'compile'], default='eager',
+                        help='模型优化方式：frozen为TorchScript冻结图(缓存在权重旁边)，compile为torch.compile，失败时退回eager')
     parser.add_argument('--use-cuda', '-c', action='store_true', help='是否使用CUDA')
+    parser.add_argument('--server', default=None,
+                        help='常驻推理服务地址(cli/infer_server_cli.py)，默认自动查找本机已启动的服务(仅torch后端)')
+    parser.add_argument('--no-server', action='store_true', help='不使用常驻推理服务，始终在进程内推理')
     
     args = parser.parse_args()
+    if args.img_size % 16 != 0:
+        parser.error('--img-size 必须是16的倍数')
     
     # 确保输出目录存在
     os.makedirs(args.output, exist_ok=True)
     
-    # 设置设备
-    device = torch.device("cuda:0" if args.use_cuda and torch.cuda.is_available() else "cpu")
-    
-    # 执行推理
-    predict_and_move(args.tif_dir, args.txt_dir, args.output, args.json_path, args.model_path, device)
+    # torch后端优先使用常驻推理服务，省去导入torch与加载权重；onnx后端本身启动快，始终在进程内推理
+    client = None if args.no_server or args.backend != 'torch' else infer_client.connect(args.server)
+    if client is not None:
+        batch_size, _, _ = autotune.resolve('vit', args.batch_size, use_profile=not args.no_autotune)
+        infer_client.predict_and_move_remote(client, args.tif_dir, args.txt_dir, args.output, args.json_path,
+                                             args.model_path, batch_size=batch_size or 64, img_size=args.img_size,
+                                             buckets=args.buckets, cache_path=args.cache,
+                                             cache_max_entries=args.cache_max_entries, keep_class=args.keep_class,
+                                             verbose=args.verbose, precision=args.precision,
+                                             fused_attn=args.fused_attn, merge_ratio=args.merge_ratio,
+                                             optimize=args.optimize)
+    elif args.backend == 'onnx':
+        # onnxruntime后端不导入torch，节省启动时间和内存
+        from utils.vit_onnx import predict_and_move_onnx
+        # torch后端的调优结果不适用于onnxruntime，使用单独调优的 vit_onnx 部分（autotune_cli.py --vit-onnx）
+        batch_size, intra_op_threads, _ = autotune.resolve('vit_onnx', args.batch_size, args.intra_op_threads,
+                                                           use_profile=not args.no_autotune)
+        predict_and_move_onnx(args.tif_dir, args.txt_dir, args.output, args.json_path, args.model_path,
+                              batch_size=batch_size or 64, intra_op_threads=intra_op_threads,
+                              num_workers=args.num_workers, img_size=args.img_size, buckets=args.buckets,
+                              cache_path=args.cache, cache_max_entries=args.cache_max_entries,
+                              keep_class=args.keep_class, verbose=args.verbose,
+                              decode_processes=args.decode_processes)
+    else:
+        import torch
+        from utils.predect import predict_and_move
+
+        # 设置设备
+        device = torch.device("cuda:0" if args.use_cuda and torch.cuda.is_available() else "cpu")
+
+        # 调优结果针对CPU推理，使用CUDA时不加载
+        batch_size, intra_op_threads, inter_op_threads = autotune.resolve(
+            'vit', args.batch_size, args.intra_op_threads, args.inter_op_threads,
+            use_profile=not args.no_autotune and device.type == 'cpu')
+        autotune.apply_threads(intra_op_threads, inter_op_threads)
+
+        # 执行推理
+        predict_and_move(args.tif_dir, args.txt_dir, args.output, args.json_path, args.model_path, device,
+                         batch_size=batch_size or 64, num_workers=args.num_workers,
+                         prefetch_factor=args.prefetch_factor, persistent_workers=args.persistent_workers,
+                         pin_memory=True if args.pin_memory else None, fused_attn=args.fused_attn,
+                         precision=args.precision, optimize=args.optimize,
+                         merge_ratio=args.merge_ratio, img_size=args.img_size,
+                         buckets=args.buckets, cache_path=args.cache,
+                         cache_max_entries=args.cache_max_entries, keep_class=args.keep_class,
+                         verbose=args.verbose)
     
     print(f"VIT推理完成。结果保存在: {args.output}")
 
@@ -1,72 +1,133 @@
 import argparse
 import os
 import shutil
-from ultralytics import YOLO
+from utils import autotune
+from utils.bucketing import (DEFAULT_YOLO_BUCKETS, parse_buckets, check_bucket_sizes, assign_buckets,
+                             print_bucket_summary)
+from utils.yolo_predict import (DETECTION_LAYER_NAME, list_images, predict_batched, predict_remote, print_stats,
+                                TxtLabelWriter, GeoLayerWriter, image_crs)
+from utils.yolo_tiled import predict_mosaic, print_mosaic_stats
+from utils.yolo_export import BACKENDS, load_model
+from utils.yolo_candidates import CANDIDATE_STORE_NAME, DEFAULT_STORE_CONF, CandidateStore
+from utils import infer_client
+
+def make_store(args, mode, **meta):
+    """--save-candidates 时创建候选框存储，否则返回 None"""
+    if not args.save_candidates:
+        return None
+    return CandidateStore(os.path.join(args.output, CANDIDATE_STORE_NAME), args.candidate_conf, mode=mode,
+                          source=os.path.abspath(args.input), model=args.model, img_size=args.img_size, **meta)
 
 def main():
     parser = argparse.ArgumentParser(description='使用YOLO模型进行预测')
-    parser.add_argument('--input', '-i', required=True, help='输入图像文件夹路径')
+    parser.add_argument('--input', '-i', required=True,
+                        help='输入图像文件夹路径；为单个大图(tif)时在大图上滑窗推理，结果写为shp')
     parser.add_argument('--model', '-m', required=True, help='YOLO模型路径')
     parser.add_argument('--output', '-o', required=True, help='输出标签文件夹路径')
     parser.add_argument('--conf', '-c', type=float, default=0.3, help='置信度阈值')
     parser.add_argument('--iou', type=float, default=0.01, help='IOU阈值')
     parser.add_argument('--img-size', '-s', type=int, default=640, help='图像大小')
+    parser.add_argument('--buckets', nargs='?', const=DEFAULT_YOLO_BUCKETS, default=None,
+                        help=f'按图像尺寸分桶推理，每个桶使用自己的输入尺寸(32的倍数，忽略--img-size)并在桶内组批；'
+                             f'不带值时使用 "{DEFAULT_YOLO_BUCKETS}"')
+    parser.add_argument('--batch-size', '-b', type=int, default=None, help='每批图像数(默认取本机调优结果，否则16)')
+    parser.add_argument('--prefetch', type=int, default=2, help='预先准备好的批数(就绪批队列的容量)')
+    parser.add_argument('--readers', type=int, default=2,
+                        help='文件夹输入时解码并letterbox的读取线程数(letterbox方式与ultralytics相同，检测结果与0一致)；'
+                             '0 为单个后台线程只解码、letterbox在推理线程中完成。结束时打印各阶段耗时，据此调整')
+    parser.add_argument('--reader-processes', action='store_true',
+                        help='读取改在子进程中进行(不受GIL限制)，批数据经共享内存环形缓冲区传回，不经过pickle')
+    parser.add_argument('--format', choices=['txt', 'shp'], default=None,
+                        help=f'输出格式：txt 每张图像一个YOLO标签；shp 检测框映射到地理坐标写入 {DETECTION_LAYER_NAME}。'
+                             f'默认文件夹输入为txt，大图输入为shp')
+    parser.add_argument('--no-conf', action='store_true', help='txt标签不写置信度列')
+    parser.add_argument('--geo-dir', default=None,
+                        help='shp格式时查找地理变换的文件夹(tfw文件或crop_manifest.csv)，默认为输入文件夹')
+    parser.add_argument('--tile-size', type=int, default=640, help='滑窗推理的窗口大小(像素)')
+    parser.add_argument('--overlap', type=int, default=64, help='滑窗推理相邻窗口的重叠像素，应大于目标尺寸')
+    parser.add_argument('--merge-thr', type=float, default=0.5,
+                        help='滑窗推理跨窗口去重阈值(交集/较小框面积)')
+    parser.add_argument('--save-candidates', action='store_true',
+                        help=f'同时保存NMS前的低阈值候选框到输出目录的 {CANDIDATE_STORE_NAME}，'
+                             f'之后可用 cli/yolo_rethreshold_cli.py 按新的 conf/iou 重新生成结果')
+    parser.add_argument('--candidate-conf', type=float, default=DEFAULT_STORE_CONF,
+                        help='保存候选框的置信度下限，重新筛选时 conf 不能低于该值')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help='推理后端：torch 直接使用.pt；onnx/openvino 使用导出的模型(与.pt同目录缓存，首次运行时导出并打印对比)')
+    parser.add_argument('--intra-op-threads', type=int, default=None, help='torch算子内线程数(默认取本机调优结果)')
+    parser.add_argument('--inter-op-threads', type=int, default=None, help='torch算子间线程数(默认取本机调优结果)')
+    parser.add_argument('--no-autotune', action='store_true', help='不加载本机调优结果(cli/autotune_cli.py生成)')
+    parser.add_argument('--server', default=None,
+                        help='常驻推理服务地址(cli/infer_server_cli.py)，默认自动查找本机已启动的服务')
+    parser.add_argument('--no-server', action='store_true', help='不使用常驻推理服务，始终在进程内推理')
     
     args = parser.parse_args()
+    mosaic = os.path.isfile(args.input)
+    if mosaic and args.format == 'txt':
+        parser.error('大图滑窗推理只支持 --format shp')
     
-    # 确保输出目录存在
-    os.makedirs(args.output, exist_ok=True)
-    
-    # 加载模型
-    model = YOLO(args.model)
+    # 未指定的批大小与线程数取本机调优结果
+    batch_size, intra_op_threads, inter_op_threads = autotune.resolve(
+        'yolo', args.batch_size, args.intra_op_threads, args.inter_op_threads, use_profile=not args.no_autotune)
+    args.batch_size = batch_size or 16
+
+    # 文件夹输入时优先使用常驻推理服务（模型已加载），没有服务时在进程内加载模型；大图滑窗始终在进程内推理
+    client = None if args.no_server or mosaic else infer_client.connect(args.server)
+    if client is None:
+        autotune.apply_threads(intra_op_threads, inter_op_threads)
+        # 加载模型（onnx/openvino 首次使用时导出，并在输入的样例图像上与.pt对比）
+        model = load_model(args.model, args.backend, args.img_size, sample_source=args.input, conf=args.conf,
+                           iou=args.iou)
     
+    # 清空输出目录，避免残留上次的结果
+    if os.path.exists(args.output):
+        shutil.rmtree(args.output)
+
+    if mosaic:
+        # 大图滑窗推理：直接读取窗口，检测框映射到地理坐标并跨窗口去重
+        crs = image_crs(args.input)
+        store = make_store(args, 'mosaic', crs=str(crs), tile_size=args.tile_size, overlap=args.overlap)
+        with GeoLayerWriter(args.output, crs) as writer:
+            stats = predict_mosaic(model, args.input, writer, args.tile_size, args.overlap, args.img_size,
+                                   args.batch_size, args.conf, args.iou, args.merge_thr, args.prefetch, store)
+        print_mosaic_stats(stats)
+        if store:
+            store.save()
+        print(f"YOLO预测完成。结果保存在: {os.path.join(args.output, DETECTION_LAYER_NAME)}")
+        return
+
     # 获取图像文件列表
-    image_files = [f for f in os.listdir(args.input) if f.endswith(('.jpg', '.png', '.tif', '.jpeg'))]
-    
-    # 执行预测
-    for i, image in enumerate(image_files, start=1):
-        image_file_path = os.path.join(args.input, image)
-        model.predict(source=image_file_path, save_txt=True, conf=args.conf, iou=args.iou, imgsz=args.img_size)
-        print(f"处理进度: {i}/{len(image_files)}")
-    
-    # 复制标签文件到输出目录
-    # 在打包环境中，需要使用绝对路径
-    import sys
-    if getattr(sys, 'frozen', False):
-        # 打包后的环境，使用exe所在目录
-        base_dir = os.path.dirname(sys.executable)
+    image_paths = list_images(args.input)
+    if args.buckets:
+        # 按尺寸分桶，小图像不再letterbox到640
+        buckets = parse_buckets(args.buckets)
+        check_bucket_sizes(buckets, 32)
+        groups = assign_buckets(image_paths, buckets)
+        print_bucket_summary(groups)
     else:
-        # 开发环境，使用当前工作目录
-        base_dir = os.getcwd()
-    
-    src_folder = os.path.join(base_dir, 'runs/detect/predict/labels')
-    if os.path.exists(src_folder):
-        if os.path.exists(args.output):
-            shutil.rmtree(args.output)
-            print(f"目标文件夹 {args.output} 已删除。")
-        shutil.copytree(src_folder, args.output)
-        print(f"文件夹 {src_folder} 已成功复制到 {args.output}。")
+        groups = {args.img_size: image_paths}
+
+    # 批量流式推理：读取线程解码并letterbox下一批，结果直接写入输出目录
+    if args.format == 'shp':
+        crs = image_crs(image_paths[0]) if image_paths else 'EPSG:4326'
+        writer = GeoLayerWriter(args.output, crs, args.geo_dir or args.input)
     else:
-        print(f"源文件夹 {src_folder} 不存在。")
-        # 尝试查找其他可能的路径
-        possible_paths = [
-            os.path.join(os.getcwd(), 'runs/detect/predict/labels'),
-            os.path.join(os.path.dirname(__file__), '../runs/detect/predict/labels'),
-            'runs/detect/predict/labels'
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                print(f"找到标签文件夹: {path}")
-                if os.path.exists(args.output):
-                    shutil.rmtree(args.output)
-                    print(f"目标文件夹 {args.output} 已删除。")
-                shutil.copytree(path, args.output)
-                print(f"文件夹 {path} 已成功复制到 {args.output}。")
-                break
+        crs = None
+        writer = TxtLabelWriter(args.output, save_conf=not args.no_conf)
+    store = make_store(args, 'images', crs=str(crs) if crs else None, geo_dir=args.geo_dir or args.input)
+    with writer:
+        if client is not None:
+            stats = predict_remote(client, args.model, args.backend, groups, writer, args.batch_size, args.conf,
+                                   args.iou, args.prefetch, store)
         else:
-            print("未找到任何标签文件夹。")
-    
+            stats = predict_batched(model, groups, writer, args.batch_size, args.conf, args.iou,
+                                    prefetch=args.prefetch, store=store, readers=args.readers,
+                                    reader_processes=args.reader_processes, backend=args.backend)
+    print_stats(stats)
+    if store:
+        store.save()
+
     print(f"YOLO预测完成。结果保存在: {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import time
+from utils.yolo_candidates import CANDIDATE_STORE_NAME, load_candidates, rethreshold
+from utils.yolo_predict import DETECTION_LAYER_NAME, TxtLabelWriter, GeoLayerWriter, image_crs
+
+def main():
+    parser = argparse.ArgumentParser(description='按新的置信度/IOU阈值从保存的YOLO候选框重新生成结果，无需重新推理')
+    parser.add_argument('--candidates', '-i', required=True,
+                        help=f'候选框文件({CANDIDATE_STORE_NAME})或其所在文件夹(yolo_predict_cli.py --save-candidates 的输出)')
+    parser.add_argument('--output', '-o', required=True, help='输出文件夹路径')
+    parser.add_argument('--conf', '-c', type=float, default=0.3, help='置信度阈值')
+    parser.add_argument('--iou', type=float, default=0.01, help='IOU阈值')
+    parser.add_argument('--max-det', type=int, default=300, help='每张图像最多保留的检测框数')
+    parser.add_argument('--format', choices=['txt', 'shp'], default=None,
+                        help=f'输出格式：txt YOLO标签；shp 地理坐标检测框图层 {DETECTION_LAYER_NAME}。'
+                             f'默认文件夹推理的候选框为txt，大图滑窗推理的候选框为shp')
+    parser.add_argument('--no-conf', action='store_true', help='txt标签不写置信度列')
+    parser.add_argument('--geo-dir', default=None, help='shp格式时查找地理变换的文件夹，默认取推理时的设置')
+    parser.add_argument('--merge-thr', type=float, default=None, help='大图滑窗的跨窗口去重阈值，默认取推理时的设置')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = load_candidates(args.candidates)
+    meta = store['meta']
+    mosaic = meta['mode'] == 'mosaic'
+    if mosaic and args.format == 'txt':
+        parser.error('大图滑窗推理的候选框只支持 --format shp')
+    print(f"读取候选框: {len(store['names'])} 张图像, {len(store['conf'])} 个候选框 "
+          f"(存储阈值 {meta['store_conf']}, {time.perf_counter() - start:.2f} s)")
+
+    # 只清除本命令会写出的结果（候选框中各图像同名的txt与检测框图层），文件夹中的其他文件保留
+    os.makedirs(args.output, exist_ok=True)
+    stale = {os.path.splitext(os.path.basename(str(name)))[0] + '.txt' for name in store['names']}
+    layer_stem = os.path.splitext(DETECTION_LAYER_NAME)[0]
+    for name in os.listdir(args.output):
+        if name in stale or os.path.splitext(name)[0] == layer_stem:
+            os.remove(os.path.join(args.output, name))
+
+    if mosaic or args.format == 'shp':
+        crs = meta.get('crs') or (image_crs(str(store['names'][0])) if len(store['names']) else 'EPSG:4326')
+        writer = GeoLayerWriter(args.output, crs, args.geo_dir or meta.get('geo_dir'))
+    else:
+        writer = TxtLabelWriter(args.output, save_conf=not args.no_conf)
+    with writer:
+        count = rethreshold(store, writer, args.conf, args.iou, args.max_det, args.merge_thr)
+
+    print(f"重新筛选完成: conf {args.conf}, iou {args.iou}, 检测框 {count} 个, 用时 {time.perf_counter() - start:.2f} s")
+    print(f"结果保存在: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import json
 import os
 import sys
 from typing import List, Dict, Any
+from utils.pipeline_args import build_cli_args
 
 class PipelineRunner:
     def __init__(self, config_path: str, input_image: str = None):
@@ -62,9 +63,7 @@ class PipelineRunner:
             else:
                 env['PYTHONPATH'] = project_root
                 
-            command = [sys.executable, script_path]
-            for k, v in step['params'].items():
-                command.extend([f"--{k}", str(v)])
+            command = [sys.executable, script_path] + build_cli_args(step['params'])
             return command, env
     
     def _execute_module_directly(self, step: Dict[str, Any]):
@@ -87,9 +86,7 @@ class PipelineRunner:
         
         # 设置命令行参数
         old_argv = sys.argv
-        sys.argv = ['script']
-        for k, v in step['params'].items():
-            sys.argv.extend([f"--{k}", str(v)])
+        sys.argv = ['script'] + build_cli_args(step['params'])
         
         try:
             # 执行模块
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import socket
+import multiprocessing
+import numpy as np
+"""
+CPU推理参数自动调优：在本机上对 VIT 与 YOLO 按 批大小 × 算子内线程数(intra-op) × 算子间线程数(inter-op)
+的网格测量吞吐，把最优组合保存到本机专属的 config/autotune_<主机名>.json。
+vit_predict_cli 与 yolo_predict_cli 在未显式指定这些参数时自动加载该文件。
+VIT的onnxruntime后端单独测量并保存在 'vit_onnx' 部分，两种后端的最优线程数并不相同。
+
+torch 的 inter-op 线程数只能在进程内第一次并行计算前设置一次，因此每个线程组合在单独的子进程中测量。
+"""
+
+PROFILE_DIR = 'config'
+
+
+def base_dir():
+    """打包后为exe所在目录，开发环境为当前工作目录（与 config/ 下其他文件的相对路径一致）"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.getcwd()
+
+
+def profile_path(host=None):
+    """本机调优结果文件路径"""
+    host = host or socket.gethostname()
+    return os.path.join(base_dir(), PROFILE_DIR, f'autotune_{host}.json')
+
+
+def load_profile(section=None, path=None):
+    """读取本机调优结果，section 为 'vit'、'vit_onnx' 或 'yolo' 时只返回该部分；没有调优结果时返回空字典"""
+    path = path or profile_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    if profile.get('cpu_count') != os.cpu_count():
+        print(f"调优结果 {path} 的CPU核数({profile.get('cpu_count')})与本机({os.cpu_count()})不一致，已忽略")
+        return {}
+    return profile.get(section, {}) if section else profile
+
+
+def save_profile(results, path=None):
+    """合并写入调优结果（保留文件中其他模型的部分）"""
+    import torch
+
+    path = path or profile_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profile = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    profile.update(results)
+    profile.update({'host': socket.gethostname(), 'cpu_count': os.cpu_count(),
+                    'torch_version': str(torch.__version__), 'updated': time.strftime('%Y-%m-%d %H:%M:%S')})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=4)
+    print(f"调优结果已保存: {path}")
+    return path
+
+
+def apply_threads(intra_op_threads=None, inter_op_threads=None):
+    """设置torch线程数，需在第一次推理前调用"""
+    import torch
+
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # 已经执行过并行计算时不能再修改
+            print("inter-op线程数只能在推理开始前设置，已忽略")
+
+
+def resolve(section, batch_size=None, intra_op_threads=None, inter_op_threads=None, use_profile=True):
+    """
+    命令行未指定（None或0）的批大小与线程数从本机调优结果中补全，
+    返回 (batch_size, intra_op_threads, inter_op_threads)，仍未确定的为 None。
+    """
+    profile = load_profile(section) if use_profile else {}
+    values = []
+    used = False
+    for key, value in (('batch_size', batch_size), ('intra_op_threads', intra_op_threads),
+                       ('inter_op_threads', inter_op_threads)):
+        if not value and key in profile:
+            value = profile[key]
+            used = True
+        values.append(value or None)
+    if used:
+        print(f"使用本机调优结果({section}): 批大小 {values[0]}, intra-op线程 {values[1]}, inter-op线程 {values[2]}")
+    return tuple(values)
+
+
+def default_thread_grid():
+    """默认的intra-op线程数候选：CPU核数的1/4、1/2与全部"""
+    cpu_count = os.cpu_count() or 1
+    return sorted({max(1, cpu_count // 4), max(1, cpu_count // 2), cpu_count})
+
+
+def _bench_worker(kind, model_path, img_size, batch_sizes, intra, inter, min_time):
+    """子进程中测量一个线程组合下各批大小的吞吐（张/秒）"""
+    if kind == 'vit_onnx':
+        from utils import vit_onnx
+        from utils.vit_export import get_onnx_model
+        session = vit_onnx.create_session(get_onnx_model(model_path, img_size), intra, inter)
+        rng = np.random.default_rng(0)
+
+        def run(batch_size):
+            vit_onnx.run_session(session, rng.standard_normal((batch_size, 3, img_size, img_size), dtype=np.float32))
+
+        return _measure(run, batch_sizes, min_time)
+
+    import torch
+
+    torch.set_num_interop_threads(inter)
+    torch.set_num_threads(intra)
+    if kind == 'vit':
+        from utils.predect import load_vit_model
+        model = load_vit_model(model_path, torch.device('cpu'), img_size=img_size)
+
+        def run(batch_size):
+            with torch.no_grad():
+                model(torch.randn(batch_size, 3, img_size, img_size))
+    else:
+        from ultralytics import YOLO
+        model = YOLO(model_path)
+        rng = np.random.default_rng(0)
+
+        def run(batch_size):
+            images = [rng.integers(0, 255, (img_size, img_size, 3), dtype=np.uint8) for _ in range(batch_size)]
+            model.predict(source=images, imgsz=img_size, batch=batch_size, verbose=False)
+
+    return _measure(run, batch_sizes, min_time)
+
+
+def _measure(run, batch_sizes, min_time):
+    """对每个批大小预热一次后重复 run(批大小) 至少 min_time 秒，返回 {批大小: 张/秒}"""
+    results = {}
+    for batch_size in batch_sizes:
+        run(batch_size)  # 预热
+        count = 0
+        start = time.perf_counter()
+        while True:
+            run(batch_size)
+            count += batch_size
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        results[batch_size] = count / elapsed
+    return results
+
+
+def tune(kind, model_path, img_size, batch_sizes, intra_threads=None, inter_threads=(1, 2), min_time=2.0):
+    """
+    在 批大小 × intra-op × inter-op 网格上测量 kind（'vit'、'vit_onnx' 或 'yolo'）的吞吐，打印结果表并返回最优组合。
+    onnxruntime 会话按顺序执行算子，inter-op 线程数不起作用，'vit_onnx' 只测量 inter-op 为1的组合。
+    """
+    intra_threads = intra_threads or default_thread_grid()
+    if kind == 'vit_onnx':
+        inter_threads = (1,)
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    print(f"{kind} 调优: 输入 {img_size}px, 批大小 {list(batch_sizes)}, "
+          f"intra-op {list(intra_threads)}, inter-op {list(inter_threads)}")
+    print(f"{'intra':>6} {'inter':>6} {'批大小':>6} {'张/秒':>10}")
+    for inter in inter_threads:
+        for intra in intra_threads:
+            with context.Pool(1) as pool:
+                results = pool.apply(_bench_worker, (kind, model_path, img_size, batch_sizes, intra, inter, min_time))
+            for batch_size, ips in results.items():
+                rows.append({'batch_size': batch_size, 'intra_op_threads': intra, 'inter_op_threads': inter,
+                             'ips': ips})
+                print(f"{intra:>6} {inter:>6} {batch_size:>6} {ips:>10.1f}")
+
+    best = max(rows, key=lambda row: row['ips'])
+    print(f"最优: 批大小 {best['batch_size']}, intra-op {best['intra_op_threads']}, "
+          f"inter-op {best['inter_op_threads']}, {best['ips']:.1f} 张/秒")
+    return dict(best, img_size=img_size)
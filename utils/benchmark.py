@@ -0,0 +1,616 @@
+import os
+import time
+import numpy as np
+"""
+性能基准测试集合，由 cli/benchmark_cli.py 调用。
+每个 bench_* 函数打印结果表并返回结果字典，便于在其他脚本中复用。
+check_* 函数在合成数据上比较新旧实现的输出，不一致时抛出 AssertionError。
+"""
+
+
+def _timeit(func, repeat=1):
+    """执行 func repeat 次，返回最短耗时（秒）和最后一次的返回值"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def random_polygons(count, seed=0, points_per_polygon=8, extent=100000.0, size=20.0):
+    """生成 count 个随机凸多边形（随机点的凸包），用于几何相关的基准测试"""
+    import shapely
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, extent, size=(count, 1, 2))
+    offsets = rng.normal(0, size, size=(count, points_per_polygon, 2))
+    coords = (centers + offsets).reshape(-1, 2)
+    indices = np.repeat(np.arange(count), points_per_polygon)
+    return shapely.convex_hull(shapely.multipoints(coords, indices=indices))
+
+
+def bench_rotated_rect(count=100000, scale_factor=1.5, seed=0):
+    """逐要素 get_minimum_rotated_rectangle 与向量化 get_minimum_rotated_rectangles 的对比"""
+    import shapely
+    from utils.shp_kuang_cut import get_minimum_rotated_rectangle, get_minimum_rotated_rectangles
+
+    geoms = random_polygons(count, seed=seed)
+    loop_time, loop_rects = _timeit(lambda: [get_minimum_rotated_rectangle(g, scale_factor) for g in geoms])
+    vec_time, vec_rects = _timeit(lambda: get_minimum_rotated_rectangles(geoms, scale_factor))
+
+    # 两种实现得到的矩形应当重合，用对称差面积占比衡量
+    loop_rects = np.asarray(loop_rects, dtype=object)
+    diff = shapely.area(shapely.symmetric_difference(loop_rects, vec_rects)) / shapely.area(loop_rects)
+    result = {
+        'count': count,
+        'loop_s': loop_time,
+        'vectorised_s': vec_time,
+        'speedup': loop_time / vec_time,
+        'max_rel_area_diff': float(np.max(diff)),
+    }
+    print(f"要素数: {count}")
+    print(f"逐要素:   {loop_time:.3f} s ({count / loop_time:,.0f} 个/秒)")
+    print(f"向量化:   {vec_time:.3f} s ({count / vec_time:,.0f} 个/秒)")
+    print(f"加速比:   {result['speedup']:.1f}x")
+    print(f"最大相对面积差: {result['max_rel_area_diff']:.2e}")
+    return result
+
+
+def _write_synthetic_layer(workdir, count, seed=0, size=2000, res=0.1):
+    """
+    在 workdir 中生成随机三波段栅格 raster.tif 与 count 个随机凸多边形的 polygons.shp（含一个空几何），
+    多边形分布在栅格范围内并有部分越过边界。返回 (tif_path, shp_path)。
+    """
+    import fiona
+    import rasterio
+    from rasterio.transform import from_origin
+    from shapely.affinity import translate
+    from shapely.geometry import mapping
+
+    rng = np.random.default_rng(seed)
+    origin_x, origin_y = 500000.0, 4000000.0
+    tif_path = os.path.join(workdir, 'raster.tif')
+    with rasterio.open(tif_path, 'w', driver='GTiff', width=size, height=size, count=3, dtype='uint8',
+                       crs='EPSG:32650', transform=from_origin(origin_x, origin_y, res, res)) as dst:
+        dst.write(rng.integers(0, 255, (3, size, size), dtype=np.uint8))
+
+    extent = size * res
+    geoms = random_polygons(count, seed=seed, extent=extent, size=extent / 200)
+    shp_path = os.path.join(workdir, 'polygons.shp')
+    schema = {'geometry': 'Polygon', 'properties': {'id': 'int'}}
+    with fiona.open(shp_path, 'w', driver='ESRI Shapefile', crs='EPSG:32650', schema=schema) as dst:
+        for i, geom in enumerate(geoms):
+            # 空几何应被跳过且不占用其他要素的 chip_id
+            geometry = None if i == count // 2 else mapping(translate(geom, origin_x, origin_y - extent))
+            dst.write({'geometry': geometry, 'properties': {'id': i}})
+    return tif_path, shp_path
+
+
+def _materialised_chips(src, shp_path, scale_factor):
+    """
+    流式改造前的做法：先把全部要素读入列表，整层一次计算最小外接矩形，再逐要素用 mask 裁剪，
+    作为一致性检查的参考。外接矩形本身与逐要素实现的差异由 bench_rotated_rect 衡量。
+    """
+    import fiona
+    from rasterio.mask import mask
+    from shapely.geometry import shape, mapping
+    from utils.shp_kuang_cut import get_minimum_rotated_rectangles
+
+    with fiona.open(shp_path, 'r') as shp:
+        features = [feature for feature in shp]
+    geoms = np.empty(len(features), dtype=object)
+    for i, feature in enumerate(features):
+        try:
+            geoms[i] = shape(feature['geometry'])
+        except Exception:
+            pass
+    rects = get_minimum_rotated_rectangles(geoms, scale_factor=scale_factor)
+    chips = {}
+    for i, geom in enumerate(geoms):
+        if geom is None or geom.is_empty or rects[i] is None:
+            continue
+        try:
+            out_image, out_transform = mask(src, [mapping(rects[i])], crop=True)
+        except Exception:
+            continue
+        chips[f'crop_y{i}'] = (rects[i], out_image, out_transform)
+    return chips
+
+
+def check_chip_stream(count=2000, scales=(1.0, 1.5), chunk_size=97, seed=0):
+    """
+    在合成栅格上检查流式裁剪与先读入全部要素的实现是否一致：iter_chips（按 chunk_size 分批流式读取）
+    与 iter_multiscale_chips（按最大比例读一次区域，经 RegionCache 切出各比例）输出的 chip_id、
+    外接矩形、像素与地理变换都应与参考实现完全相同。不一致时抛出 AssertionError，
+    同时打印流式实现与参考实现的耗时。
+    """
+    import shutil
+    import tempfile
+    import fiona
+    import rasterio
+    from utils.shp_kuang_cut import iter_chips, iter_multiscale_chips, RegionCache
+
+    def compare(name, reference, candidate):
+        assert list(candidate) == list(reference), f"{name}: chip_id 不一致"
+        for chip_id, (ref_rect, ref_image, ref_transform) in reference.items():
+            rect, image, transform = candidate[chip_id]
+            assert rect.equals_exact(ref_rect, 0), f"{name} {chip_id}: 外接矩形不一致"
+            assert image.shape == ref_image.shape, f"{name} {chip_id}: 尺寸 {image.shape} != {ref_image.shape}"
+            assert image.tobytes() == ref_image.tobytes(), f"{name} {chip_id}: 像素不一致"
+            assert transform.almost_equals(ref_transform), f"{name} {chip_id}: 地理变换不一致"
+
+    workdir = tempfile.mkdtemp(prefix='check_chips_')
+    try:
+        tif_path, shp_path = _write_synthetic_layer(workdir, count, seed)
+        with rasterio.open(tif_path) as src:
+            results = []
+            print(f"要素数: {count}, chunk_size: {chunk_size}")
+            multi = {}
+
+            def run_multiscale():
+                with fiona.open(shp_path, 'r') as shp:
+                    return list(iter_multiscale_chips(src, shp, list(scales), chunk_size=chunk_size,
+                                                      cache=RegionCache()))
+
+            multi_time, multi_chips = _timeit(run_multiscale)
+            for chip_id, feature, chips in multi_chips:
+                multi[chip_id] = chips
+
+            for k, scale in enumerate(scales):
+                ref_time, reference = _timeit(lambda: _materialised_chips(src, shp_path, scale))
+
+                def run_stream():
+                    with fiona.open(shp_path, 'r') as shp:
+                        return {chip_id: (rect, image, meta['transform']) for chip_id, feature, rect, image, meta
+                                in iter_chips(src, shp, scale, chunk_size=chunk_size)}
+
+                stream_time, streamed = _timeit(run_stream)
+                compare(f"iter_chips x{scale:g}", reference, streamed)
+                compare(f"iter_multiscale_chips x{scale:g}", reference,
+                        {chip_id: (chips[k][0], chips[k][1], chips[k][2]['transform'])
+                         for chip_id, chips in multi.items()})
+                results.append({'scale': scale, 'chips': len(reference), 'materialised_s': ref_time,
+                                'stream_s': stream_time})
+                print(f"x{scale:g}: {len(reference)} 块一致，全部读入 {ref_time:.3f} s，流式 {stream_time:.3f} s")
+            print(f"多比例一次读取（{len(scales)} 个比例）: {multi_time:.3f} s，各比例结果一致")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_vit_attention(batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128), repeat=3, num_threads=None, atol=1e-4):
+    """
+    ViT-B/16 在CPU上 eager 注意力与融合注意力（scaled_dot_product_attention）的对比，
+    同时检查两者在 eval 模式下的输出差异，超过 atol 时抛出 AssertionError。
+    """
+    import torch
+    from utils.vit_model import vit_base_patch16_224_in21k as create_model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    torch.manual_seed(0)
+    eager = create_model(num_classes=2, has_logits=False).eval()
+    fused = create_model(num_classes=2, has_logits=False, fused_attn=True).eval()
+    fused.load_state_dict(eager.state_dict())
+
+    results = []
+    print(f"{'batch':>6} {'eager(张/秒)':>14} {'fused(张/秒)':>14} {'加速比':>8} {'最大绝对误差':>14}")
+    for batch_size in batch_sizes:
+        x = torch.randn(batch_size, 3, 224, 224)
+        with torch.no_grad():
+            eager(x)
+            fused(x)
+            eager_time, eager_out = _timeit(lambda: eager(x), repeat)
+            fused_time, fused_out = _timeit(lambda: fused(x), repeat)
+        max_diff = (eager_out - fused_out).abs().max().item()
+        results.append({
+            'batch_size': batch_size,
+            'eager_ips': batch_size / eager_time,
+            'fused_ips': batch_size / fused_time,
+            'speedup': eager_time / fused_time,
+            'max_abs_diff': max_diff,
+        })
+        print(f"{batch_size:>6} {batch_size / eager_time:>14.1f} {batch_size / fused_time:>14.1f} "
+              f"{eager_time / fused_time:>7.2f}x {max_diff:>14.2e}")
+        assert max_diff <= atol, f"batch {batch_size}: 融合注意力与eager输出差异 {max_diff:.2e} 超过 {atol:g}"
+    return results
+
+
+def load_labelled_set(data_dir, class_indict, limit=None):
+    """
+    读取带标签的图像集，data_dir 下每个子文件夹名为类别名（与 class_indices.json 中的名称一致）。
+    返回 (img_paths, labels)。
+    """
+    import os
+    name_to_index = {name: int(index) for index, name in class_indict.items()}
+    img_paths, labels = [], []
+    for class_name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir) or class_name not in name_to_index:
+            continue
+        for img_name in sorted(os.listdir(class_dir)):
+            if img_name.lower().endswith(('.tif', '.tiff', '.png', '.jpg', '.jpeg')):
+                img_paths.append(os.path.join(class_dir, img_name))
+                labels.append(name_to_index[class_name])
+    if limit:
+        img_paths, labels = img_paths[:limit], labels[:limit]
+    return img_paths, labels
+
+
+def evaluate_vit(model, img_paths, labels, device, batch_size=64, data_transform=None, num_workers=0):
+    """在带标签的图像集上评估VIT，返回准确率、逐张预测与概率以及模型吞吐"""
+    import torch
+    from utils.predect import CustomDataset, get_data_transform, make_data_loader
+
+    dataset = CustomDataset(img_paths, transform=data_transform or get_data_transform())
+    data_loader = make_data_loader(dataset, batch_size, num_workers)
+    predictions, probs = [], []
+    model_time = 0.0
+    with torch.no_grad():
+        for imgs, _ in data_loader:
+            start = time.perf_counter()
+            predicts = torch.softmax(model(imgs.to(device)), dim=1).cpu()
+            model_time += time.perf_counter() - start
+            predictions.extend(torch.argmax(predicts, dim=1).tolist())
+            probs.append(predicts)
+    probs = torch.cat(probs).numpy() if probs else np.zeros((0, 2))
+    predictions = np.asarray(predictions)
+    labels = np.asarray(labels)
+    return {
+        'accuracy': float((predictions == labels).mean()) if len(labels) else float('nan'),
+        'predictions': predictions,
+        'probs': probs,
+        'ips': len(labels) / model_time if model_time > 0 else float('nan'),
+    }
+
+
+def print_parity_report(name, reference, candidate):
+    """打印候选模型相对参考模型（fp32）的准确率、一致率与吞吐"""
+    agreement = float((reference['predictions'] == candidate['predictions']).mean())
+    max_prob_diff = float(np.abs(reference['probs'] - candidate['probs']).max()) if len(reference['probs']) else 0.0
+    print(f"{name}:")
+    print(f"  准确率:   fp32 {reference['accuracy']:.4f} -> {candidate['accuracy']:.4f} "
+          f"({candidate['accuracy'] - reference['accuracy']:+.4f})")
+    print(f"  预测一致率: {agreement:.4f}, 最大概率差: {max_prob_diff:.4f}")
+    print(f"  吞吐:     fp32 {reference['ips']:.1f} -> {candidate['ips']:.1f} 张/秒 "
+          f"({candidate['ips'] / reference['ips']:.2f}x)")
+    return {'agreement': agreement, 'max_prob_diff': max_prob_diff}
+
+
+def bench_vit_int8(data_dir, json_path, model_weight_path, batch_size=64, limit=None, num_threads=None):
+    """动态INT8量化VIT与fp32在带标签图像集上的准确率与吞吐对比（CPU）"""
+    import torch
+    from utils.predect import load_class_indict, load_vit_model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    device = torch.device('cpu')
+    img_paths, labels = load_labelled_set(data_dir, load_class_indict(json_path), limit)
+    print(f"带标签图像: {len(img_paths)} 张")
+
+    reference = evaluate_vit(load_vit_model(model_weight_path, device), img_paths, labels, device, batch_size)
+    int8 = evaluate_vit(load_vit_model(model_weight_path, device, precision='int8'), img_paths, labels, device,
+                        batch_size)
+    return dict(print_parity_report('INT8', reference, int8), fp32=reference, int8=int8)
+
+
+def bench_vit_tome(data_dir, json_path, model_weight_path, ratios=(0., 0.05, 0.1, 0.15, 0.2), batch_size=64,
+                   limit=None, num_threads=None, use_cuda=False):
+    """扫描token合并(ToMe)比例，在带标签图像集上输出准确率与吞吐的对应关系（以不合并为参考）"""
+    import torch
+    from utils.predect import load_class_indict, load_vit_model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    device = torch.device("cuda:0" if use_cuda and torch.cuda.is_available() else "cpu")
+    img_paths, labels = load_labelled_set(data_dir, load_class_indict(json_path), limit)
+    print(f"带标签图像: {len(img_paths)} 张")
+
+    model = load_vit_model(model_weight_path, device)
+    num_patches = model.patch_embed.num_patches
+    reference = None
+    results = []
+    print(f"{'比例':>6} {'末层token':>10} {'准确率':>8} {'一致率':>8} {'张/秒':>8} {'加速比':>8}")
+    for ratio in ratios:
+        model.merge_ratio = ratio
+        result = evaluate_vit(model, img_paths, labels, device, batch_size)
+        if reference is None:
+            reference = result
+        tokens = num_patches
+        for _ in model.blocks:
+            tokens -= min(int(tokens * ratio), tokens // 2)
+        agreement = float((reference['predictions'] == result['predictions']).mean())
+        results.append(dict(result, ratio=ratio, tokens=tokens, agreement=agreement))
+        print(f"{ratio:>6g} {tokens + model.num_tokens:>10} {result['accuracy']:>8.4f} {agreement:>8.4f} "
+              f"{result['ips']:>8.1f} {result['ips'] / reference['ips']:>7.2f}x")
+    return results
+
+
+def bench_vit_resolution(data_dir, json_path, model_weight_path, img_sizes=(224, 192, 160, 128, 112), batch_size=64,
+                         limit=None, num_threads=None, use_cuda=False):
+    """不同输入分辨率（位置编码插值）下VIT的准确率与吞吐表，以第一个分辨率为参考"""
+    import torch
+    from utils.predect import get_data_transform, load_class_indict, load_vit_model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    device = torch.device("cuda:0" if use_cuda and torch.cuda.is_available() else "cpu")
+    img_paths, labels = load_labelled_set(data_dir, load_class_indict(json_path), limit)
+    print(f"带标签图像: {len(img_paths)} 张")
+
+    reference = None
+    results = []
+    print(f"{'分辨率':>6} {'patch数':>8} {'准确率':>8} {'一致率':>8} {'张/秒':>8} {'加速比':>8}")
+    for img_size in img_sizes:
+        model = load_vit_model(model_weight_path, device, img_size=img_size)
+        result = evaluate_vit(model, img_paths, labels, device, batch_size, data_transform=get_data_transform(img_size))
+        if reference is None:
+            reference = result
+        agreement = float((reference['predictions'] == result['predictions']).mean())
+        num_patches = model.patch_embed.num_patches
+        results.append(dict(result, img_size=img_size, num_patches=num_patches, agreement=agreement))
+        print(f"{img_size:>6} {num_patches:>8} {result['accuracy']:>8.4f} {agreement:>8.4f} "
+              f"{result['ips']:>8.1f} {result['ips'] / reference['ips']:>7.2f}x")
+    return results
+
+
+def bench_vit_onnx(model_weight_path, batch_sizes=(1, 8, 32, 64), repeat=3, num_threads=None, img_dir=None):
+    """
+    torch eager 与 onnxruntime 后端的一致性与吞吐对比。
+    对随机输入比较 logits 的最大绝对误差；给定 img_dir 时再用真实图像执行 check_vit_onnx_parity。
+    """
+    import torch
+    from utils.predect import load_vit_model
+    from utils.vit_export import get_onnx_model
+    from utils import vit_onnx
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = load_vit_model(model_weight_path, torch.device('cpu'))
+    session = vit_onnx.create_session(get_onnx_model(model_weight_path), num_threads)
+    input_name = session.get_inputs()[0].name
+
+    results = []
+    print(f"{'batch':>6} {'torch(张/秒)':>14} {'onnx(张/秒)':>14} {'加速比':>8} {'最大绝对误差':>14}")
+    for batch_size in batch_sizes:
+        x = torch.randn(batch_size, 3, 224, 224)
+        with torch.no_grad():
+            torch_time, torch_out = _timeit(lambda: model(x), repeat)
+        onnx_time, onnx_out = _timeit(lambda: session.run(None, {input_name: x.numpy()})[0], repeat)
+        max_diff = float(np.abs(torch_out.numpy() - onnx_out).max())
+        results.append({
+            'batch_size': batch_size,
+            'torch_ips': batch_size / torch_time,
+            'onnx_ips': batch_size / onnx_time,
+            'speedup': torch_time / onnx_time,
+            'max_abs_diff': max_diff,
+        })
+        print(f"{batch_size:>6} {batch_size / torch_time:>14.1f} {batch_size / onnx_time:>14.1f} "
+              f"{torch_time / onnx_time:>7.2f}x {max_diff:>14.2e}")
+
+    if img_dir:
+        check_vit_onnx_parity(model_weight_path, img_dir)
+    return results
+
+
+# 合成检查块的尺寸 (宽, 高)：覆盖远小于输入、非正方形、奇数边长与大于 Resize 尺寸的块
+PARITY_CHIP_SIZES = [(37, 52), (64, 64), (90, 151), (151, 90), (223, 225), (256, 256), (300, 181), (513, 257)]
+
+
+def check_vit_onnx_parity(model_weight_path, img_dir=None, img_sizes=(224,), atol=1e-3, input_atol=1e-5, seed=0):
+    """
+    同一批块分别经 torch 路径（CustomDataset + get_data_transform + eager模型）与 onnxruntime 路径
+    （vit_onnx.load_and_preprocess + 导出的ONNX）推理，检查两条预处理实现与两个后端的端到端一致性：
+    预处理后输入的最大绝对误差不超过 input_atol、softmax概率的最大绝对误差不超过 atol，
+    且预测类别完全相同，否则抛出 AssertionError。
+    img_dir 为 None 时使用 PARITY_CHIP_SIZES 中各尺寸的随机块。返回各输入尺寸的误差字典。
+    """
+    import shutil
+    import tempfile
+    import torch
+    from PIL import Image
+    from utils.predect import CustomDataset, get_data_transform, load_vit_model
+    from utils.vit_export import get_onnx_model
+    from utils.vit_io import list_tif_images
+    from utils import vit_onnx
+
+    workdir = None
+    try:
+        if img_dir:
+            img_paths = list_tif_images(img_dir)
+            if not img_paths:
+                raise ValueError(f"{img_dir} 中没有图像")
+        else:
+            workdir = tempfile.mkdtemp(prefix='check_onnx_')
+            rng = np.random.default_rng(seed)
+            img_paths = []
+            for i, (w, h) in enumerate(PARITY_CHIP_SIZES):
+                path = os.path.join(workdir, f'chip_{i}_{w}x{h}.tif')
+                Image.fromarray(rng.integers(0, 255, (h, w, 3), dtype=np.uint8)).save(path)
+                img_paths.append(path)
+
+        results = []
+        for img_size in img_sizes:
+            model = load_vit_model(model_weight_path, torch.device('cpu'), img_size=img_size)
+            session = vit_onnx.create_session(get_onnx_model(model_weight_path, img_size))
+            dataset = CustomDataset(img_paths, transform=get_data_transform(img_size))
+            torch_batch = torch.stack([dataset[i][0] for i in range(len(dataset))])
+            onnx_batch = np.stack([vit_onnx.load_and_preprocess(path, img_size) for path in img_paths])
+            with torch.no_grad():
+                torch_probs = torch.softmax(model(torch_batch), dim=1).numpy()
+            onnx_probs = vit_onnx.run_session(session, onnx_batch)
+
+            input_diff = float(np.abs(torch_batch.numpy() - onnx_batch).max())
+            prob_diff = float(np.abs(torch_probs - onnx_probs).max())
+            agreement = float((torch_probs.argmax(axis=1) == onnx_probs.argmax(axis=1)).mean())
+            results.append({'img_size': img_size, 'input_max_abs_diff': input_diff,
+                            'prob_max_abs_diff': prob_diff, 'agreement': agreement})
+            print(f"输入 {img_size}: {len(img_paths)} 块，预处理最大绝对误差 {input_diff:.2e}，"
+                  f"概率最大绝对误差 {prob_diff:.2e}，预测一致率 {agreement:.4f}")
+            assert input_diff <= input_atol, f"输入 {img_size}: 两条预处理路径的输入差 {input_diff:.2e} 超过 {input_atol:g}"
+            assert prob_diff <= atol, f"输入 {img_size}: onnx与torch概率差 {prob_diff:.2e} 超过 {atol:g}"
+            assert agreement == 1.0, f"输入 {img_size}: onnx与torch预测类别不一致（一致率 {agreement:.4f}）"
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _fill_synthetic(payload, out):
+    """IPC基准的 fill 函数：写满整批数据（代价很小，耗时主要是传输）"""
+    out[...] = payload % 251
+
+
+def _pickle_worker(task_queue, out_queue, shape, dtype):
+    """IPC基准的对照：子进程把整批数组直接放入 multiprocessing 队列（pickle传输）"""
+    while True:
+        payload = task_queue.get()
+        if payload is None:
+            break
+        batch = np.empty(shape, dtype=dtype)
+        _fill_synthetic(payload, batch)
+        out_queue.put(batch)
+    out_queue.put(None)
+
+
+def _run_pickled(shape, dtype, batches, workers):
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    task_queue, out_queue = context.Queue(), context.Queue(maxsize=2 * workers)
+    for payload in range(batches):
+        task_queue.put(payload)
+    for _ in range(workers):
+        task_queue.put(None)
+    processes = [context.Process(target=_pickle_worker, args=(task_queue, out_queue, shape, dtype), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    finished, checksum = 0, 0
+    while finished < workers:
+        batch = out_queue.get()
+        if batch is None:
+            finished += 1
+            continue
+        checksum += int(batch[-1].flat[-1])
+    for process in processes:
+        process.join()
+    return checksum
+
+
+def _run_shared(shape, dtype, batches, workers):
+    from utils.shm_ring import iter_shared_batches
+
+    checksum = 0
+    for _, batch, _ in iter_shared_batches([(shape, dtype, payload) for payload in range(batches)],
+                                           _fill_synthetic, workers):
+        checksum += int(batch[-1].flat[-1])
+    return checksum
+
+
+def bench_ipc(count=4096, batch_size=16, workers=2, repeat=3):
+    """
+    解码子进程到推理进程的批数据传输：pickle经 multiprocessing 队列 与 共享内存环形缓冲区 的每块开销对比。
+    子进程只写入合成数据（不解码），耗时基本都是进程间传输；包含子进程启动时间。
+    """
+    batches = max(1, count // batch_size)
+    count = batches * batch_size
+    layouts = [('VIT输入 3x224x224 float32', (batch_size, 3, 224, 224), np.float32),
+               ('YOLO输入 640x640x3 uint8', (batch_size, 640, 640, 3), np.uint8)]
+    results = []
+    print(f"{count} 块, 批大小 {batch_size}, 子进程 {workers} 个")
+    print(f"{'数据':>28} {'传输方式':>10} {'微秒/块':>10} {'MB/s':>10}")
+    for name, shape, dtype in layouts:
+        chip_mb = int(np.prod(shape[1:])) * np.dtype(dtype).itemsize / 1024 / 1024
+        for mode, run in (('pickle', _run_pickled), ('共享内存', _run_shared)):
+            elapsed, checksum = _timeit(lambda: run(shape, dtype, batches, workers), repeat)
+            results.append({'layout': name, 'mode': mode, 'us_per_chip': elapsed / count * 1e6,
+                            'mb_per_s': count * chip_mb / elapsed, 'checksum': checksum})
+            print(f"{name:>28} {mode:>10} {elapsed / count * 1e6:>10.1f} {count * chip_mb / elapsed:>10.0f}")
+    return results
+
+
+def _tile_paths(img_dir, count, tile_size, workdir, pool_size=64, seed=0):
+    """
+    准备 count 个瓦片路径：给定 img_dir 时循环使用其中的图像，否则在 workdir 中生成 pool_size 张随机瓦片循环使用
+    """
+    import cv2
+    from utils.yolo_predict import list_images
+
+    if img_dir:
+        pool = list_images(img_dir)
+        if not pool:
+            raise ValueError(f"{img_dir} 中没有图像")
+    else:
+        rng = np.random.default_rng(seed)
+        pool = []
+        for i in range(pool_size):
+            path = os.path.join(workdir, f'tile_{i:04d}.jpg')
+            cv2.imwrite(path, rng.integers(0, 255, (tile_size, tile_size, 3), dtype=np.uint8))
+            pool.append(path)
+    return [pool[i % len(pool)] for i in range(count)]
+
+
+def bench_yolo_batch(model_path, img_dir=None, count=10000, batch_sizes=(8, 16, 32), img_size=640, tile_size=640,
+                     conf=0.3, iou=0.01, num_threads=None):
+    """
+    YOLO逐张循环（原 yolo_predict_cli 的做法）与批量流式推理的吞吐对比，并比较两者写出的标签。
+    瓦片数不足 count 时循环使用；两种方式都写标签到临时目录，计入写标签开销。
+    """
+    import shutil
+    import tempfile
+    import torch
+    from ultralytics import YOLO
+    from utils.yolo_predict import predict_batched, TxtLabelWriter
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    workdir = tempfile.mkdtemp(prefix='bench_yolo_')
+    try:
+        paths = _tile_paths(img_dir, count, tile_size, workdir)
+        unique_paths = list(dict.fromkeys(paths))
+        model = YOLO(model_path)
+        model.predict(source=paths[0], imgsz=img_size, verbose=False)  # 预热
+
+        def loop():
+            for path in paths:
+                model.predict(source=path, save_txt=True, conf=conf, iou=iou, imgsz=img_size,
+                              project=workdir, name='loop', exist_ok=True)
+
+        loop_time, _ = _timeit(loop)
+        loop_labels = os.path.join(workdir, 'loop', 'labels')
+        results = [{'mode': 'loop', 'batch_size': 1, 'ips': count / loop_time, 'speedup': 1.0}]
+        print(f"{'方式':>8} {'batch':>6} {'张/秒':>10} {'加速比':>8} {'标签一致':>8}")
+        print(f"{'逐张':>8} {1:>6} {count / loop_time:>10.1f} {1.0:>7.2f}x {'-':>8}")
+        for batch_size in batch_sizes:
+            out_dir = os.path.join(workdir, f'batch_{batch_size}')
+            with TxtLabelWriter(out_dir, save_conf=False) as writer:
+                batch_time, _ = _timeit(lambda: predict_batched(model, {img_size: paths}, writer, batch_size, conf, iou))
+            same = _same_labels(loop_labels, out_dir, unique_paths)
+            results.append({'mode': 'stream', 'batch_size': batch_size, 'ips': count / batch_time,
+                            'speedup': loop_time / batch_time, 'labels_match': same})
+            print(f"{'批量流式':>8} {batch_size:>6} {count / batch_time:>10.1f} {loop_time / batch_time:>7.2f}x "
+                  f"{same:>8.4f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _same_labels(dir_a, dir_b, img_paths, tol=1e-3):
+    """
+    两个标签目录中检测框一致（类别相同、坐标误差小于 tol）的图像比例。
+    ultralytics 的 save_txt 以追加方式写文件，循环使用的瓦片会重复写入，比较前先去重。
+    """
+    def read(label_dir, img_path):
+        path = os.path.join(label_dir, os.path.splitext(os.path.basename(img_path))[0] + '.txt')
+        if not os.path.exists(path):
+            return np.zeros((0, 5))
+        return np.unique(np.round(np.loadtxt(path, ndmin=2)[:, :5], 4), axis=0)
+
+    same = 0
+    for img_path in img_paths:
+        a, b = read(dir_a, img_path), read(dir_b, img_path)
+        if a.shape == b.shape and (len(a) == 0 or np.abs(a - b).max() < tol):
+            same += 1
+    return same / len(img_paths)
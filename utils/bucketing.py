@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from PIL import Image
+"""
+按图像尺寸分桶的批处理调度，VIT（utils/predect.py）与YOLO（cli/yolo_predict_cli.py）共用。
+裁剪块从几十像素到几百像素不等，统一放大到 224（VIT）或 letterbox 到 640（YOLO）会在小块上浪费大量计算。
+分桶后每个桶使用自己的输入分辨率，并在桶内组批。
+
+分桶规则写作 "80:112,140:160,224"：最长边 <= 80 的图像用 112 输入，<= 140 的用 160，其余用 224。
+"""
+
+# VIT输入需为16的倍数，YOLO输入需为32的倍数
+DEFAULT_VIT_BUCKETS = "80:112,140:160,224"
+DEFAULT_YOLO_BUCKETS = "160:192,320:352,640"
+
+
+def parse_buckets(spec):
+    """
+    解析分桶规则字符串，返回按阈值升序的 [(最长边上限, 输入尺寸), ...]，最后一项的上限为 None（不限）。
+    """
+    buckets = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if ':' in part:
+            max_side, size = part.split(':')
+            buckets.append((int(max_side), int(size)))
+        else:
+            buckets.append((None, int(part)))
+    bounded = sorted(b for b in buckets if b[0] is not None)
+    unbounded = [b for b in buckets if b[0] is None]
+    if len(unbounded) > 1:
+        raise ValueError(f"分桶规则 {spec} 中只能有一个不带上限的尺寸")
+    if not unbounded:
+        raise ValueError(f"分桶规则 {spec} 缺少最后一个不带上限的尺寸，如 \"80:112,224\" 中的 224")
+    return bounded + unbounded
+
+
+def check_bucket_sizes(buckets, multiple):
+    """检查每个桶的输入尺寸是否为 multiple 的整数倍"""
+    for _, size in buckets:
+        if size % multiple != 0:
+            raise ValueError(f"分桶输入尺寸 {size} 不是 {multiple} 的整数倍")
+
+
+def read_image_size(img_path):
+    """只读取文件头获取图像 (宽, 高)，不解码像素"""
+    with Image.open(img_path) as img:
+        return img.size
+
+
+def bucket_for(width, height, buckets):
+    """返回尺寸为 (width, height) 的图像所属桶的输入尺寸"""
+    max_side = max(width, height)
+    for limit, size in buckets:
+        if limit is None or max_side <= limit:
+            return size
+    return buckets[-1][1]
+
+
+def assign_buckets(img_paths, buckets):
+    """将图像按尺寸分桶，返回 {输入尺寸: [图像路径, ...]}，按输入尺寸升序，桶内保持原有顺序"""
+    grouped = {}
+    for img_path in img_paths:
+        size = bucket_for(*read_image_size(img_path), buckets)
+        grouped.setdefault(size, []).append(img_path)
+    return OrderedDict(sorted(grouped.items()))
+
+
+def iter_bucketed_batches(groups, batch_size):
+    """{输入尺寸: [图像路径, ...]}（assign_buckets 的结果）按桶组批，依次产出 (输入尺寸, 批内图像路径)"""
+    for size, paths in groups.items():
+        for i in range(0, len(paths), batch_size):
+            yield size, paths[i:i + batch_size]
+
+
+def print_bucket_summary(grouped):
+    """打印每个桶的图像数"""
+    total = sum(len(paths) for paths in grouped.values())
+    print(f"尺寸分桶: 共 {total} 张")
+    for size, paths in grouped.items():
+        print(f"  输入 {size}px: {len(paths)} 张")
@@ -0,0 +1,125 @@
+import os
+import csv
+import json
+"""
+VIT与YOLO之间的置信度分流：按VIT判定的类别和概率把每个块分到三路，只有不确定的块进入YOLO。
+  accept  判定为保留类别(病树)且概率 >= accept_prob，不再经过YOLO，块的外接矩形直接写入 cascade_accept.shp，
+          由最后的合并SHP步骤（--extra）并入输出图层
+  reject  判定为其他类别且概率 >= reject_prob，丢弃
+  yolo    其余的块写入 cascade_yolo.shp，作为 1.5 倍SHP框裁剪与YOLO推理的输入
+二分类时其他类别的概率总是 >= 0.5，reject_prob=0.5 即与原流程一样丢弃所有非病树块；
+调高 reject_prob 会把不确定的非病树块也送入YOLO复核。
+
+分流结果按块写入 cascade_routes.csv，各阶段块数与估算节省的YOLO时间写入 cascade_report.json。
+"""
+
+ROUTE_ACCEPT = 'accept'
+ROUTE_REJECT = 'reject'
+ROUTE_YOLO = 'yolo'
+ROUTES = (ROUTE_ACCEPT, ROUTE_REJECT, ROUTE_YOLO)
+
+ACCEPT_LAYER_NAME = 'cascade_accept.shp'
+YOLO_LAYER_NAME = 'cascade_yolo.shp'
+ROUTE_TABLE_NAME = 'cascade_routes.csv'
+REPORT_NAME = 'cascade_report.json'
+
+
+def read_verdicts(vit_dir):
+    """读取 vit_predict_cli 写出的判定表，返回 {chip_id: (类别, 概率)}"""
+    from utils.vit_io import VERDICT_NAME
+
+    path = os.path.join(vit_dir, VERDICT_NAME) if os.path.isdir(vit_dir) else vit_dir
+    with open(path, 'r', newline='') as f:
+        return {row['chip_id']: (int(row['cls']), float(row['prob'])) for row in csv.DictReader(f)}
+
+
+def route_verdict(cla, prob, keep_class=0, accept_prob=0.95, reject_prob=0.5):
+    """单个块的分流结果"""
+    if cla == keep_class:
+        return ROUTE_ACCEPT if prob >= accept_prob else ROUTE_YOLO
+    return ROUTE_REJECT if prob >= reject_prob else ROUTE_YOLO
+
+
+def route_chips(vit_dir, chips_shp, output_dir, keep_class=0, accept_prob=0.95, reject_prob=0.5, yolo_ips=None):
+    """
+    按 vit_dir 中的判定表对 chips_shp（VIT输入的平铺裁剪块图层 crop_chips.shp）中的块分流，
+    写出 cascade_accept.shp、cascade_yolo.shp、cascade_routes.csv 与 cascade_report.json，返回报告字典。
+    yolo_ips 为YOLO每秒处理的块数，用于估算节省的时间（不含1.5倍裁剪）。
+    """
+    import fiona
+
+    if accept_prob < 0.5 or reject_prob < 0.5:
+        # 概率低于0.5时可能存在另一个更高的类别，阈值不再有意义
+        raise ValueError(f"accept_prob({accept_prob}) 与 reject_prob({reject_prob}) 不能小于0.5")
+    verdicts = read_verdicts(vit_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    counts = dict.fromkeys(ROUTES, 0)
+    unmatched = 0
+
+    with fiona.open(chips_shp, 'r') as src:
+        schema = {'geometry': src.schema['geometry'], 'properties': dict(src.schema['properties'])}
+        schema['properties'].update({'cls': 'int', 'prob': 'float', 'route': 'str:8'})
+        layers = {route: fiona.open(os.path.join(output_dir, name), 'w', driver='ESRI Shapefile', crs=src.crs,
+                                    schema=schema)
+                  for route, name in ((ROUTE_ACCEPT, ACCEPT_LAYER_NAME), (ROUTE_YOLO, YOLO_LAYER_NAME))}
+        try:
+            with open(os.path.join(output_dir, ROUTE_TABLE_NAME), 'w', newline='') as f:
+                table = csv.writer(f)
+                table.writerow(['chip_id', 'cls', 'prob', 'route'])
+                for feature in src:
+                    chip_id = feature['properties']['chip_id']
+                    verdict = verdicts.get(chip_id)
+                    if verdict is None:
+                        unmatched += 1
+                        continue
+                    cla, prob = verdict
+                    route = route_verdict(cla, prob, keep_class, accept_prob, reject_prob)
+                    counts[route] += 1
+                    table.writerow([chip_id, cla, f'{prob:.6f}', route])
+                    if route in layers:
+                        properties = dict(feature['properties'])
+                        properties.update({'cls': cla, 'prob': prob, 'route': route})
+                        layers[route].write({'geometry': feature['geometry'], 'properties': properties})
+        finally:
+            for layer in layers.values():
+                layer.close()
+
+    # 原流程中判定为保留类别的块全部进入YOLO
+    baseline_yolo = sum(1 for cla, _ in verdicts.values() if cla == keep_class)
+    report = {
+        'chips': len(verdicts),
+        'accept': counts[ROUTE_ACCEPT],
+        'reject': counts[ROUTE_REJECT],
+        'yolo': counts[ROUTE_YOLO],
+        'unmatched': unmatched,
+        'baseline_yolo': baseline_yolo,
+        'yolo_saved': baseline_yolo - counts[ROUTE_YOLO],
+        'thresholds': {'keep_class': keep_class, 'accept_prob': accept_prob, 'reject_prob': reject_prob},
+        'yolo_ips': yolo_ips,
+        'yolo_saved_s': (baseline_yolo - counts[ROUTE_YOLO]) / yolo_ips if yolo_ips else None,
+    }
+    with open(os.path.join(output_dir, REPORT_NAME), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    return report
+
+
+def print_report(report):
+    chips = report['chips']
+
+    def share(count):
+        return f"{count / chips:.1%}" if chips else '-'
+
+    thresholds = report['thresholds']
+    print(f"置信度分流（保留类别 {thresholds['keep_class']}，直接接受 >= {thresholds['accept_prob']}，"
+          f"丢弃 >= {thresholds['reject_prob']}）:")
+    print(f"  VIT判定块数 {chips}，其中保留类别 {report['baseline_yolo']}")
+    print(f"  直接接受 {report['accept']} ({share(report['accept'])})，丢弃 {report['reject']} "
+          f"({share(report['reject'])})，送入YOLO {report['yolo']} ({share(report['yolo'])})")
+    if report['unmatched']:
+        print(f"  块图层中有 {report['unmatched']} 块没有判定结果，已跳过")
+    # 调高 reject_prob 时送入YOLO的块可能比原流程多
+    change = '减少' if report['yolo_saved'] >= 0 else '增加'
+    print(f"  YOLO块数 {report['baseline_yolo']} -> {report['yolo']}，{change} {abs(report['yolo_saved'])} 块")
+    if report['yolo_saved_s'] is not None:
+        print(f"  按 {report['yolo_ips']:.1f} 块/秒估算，YOLO推理时间{change}约 {abs(report['yolo_saved_s']):.1f} s"
+              f"（不含1.5倍裁剪）")
@@ -0,0 +1,129 @@
+"""
+常驻推理服务（utils/infer_server.py）的客户端，只依赖标准库与numpy，不导入torch/ultralytics。
+
+vit_predict_cli 与 yolo_predict_cli 启动时先查找推理服务：
+  --server URL   指定服务地址
+  默认           读取服务启动时写入的 config/infer_server.json（或环境变量 INFER_SERVER_URL），健康检查通过才使用
+  --no-server    不使用推理服务
+找不到服务或服务不可用时回退为进程内推理。服务与客户端在同一台机器上，请求中只传图像的绝对路径，由服务解码。
+"""
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import urllib.error
+import urllib.request
+import numpy as np
+
+SERVER_INFO_NAME = 'infer_server.json'
+SERVER_URL_ENV = 'INFER_SERVER_URL'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+def server_info_path():
+    """服务地址文件路径，与本机调优结果同在 config/ 下"""
+    from utils.autotune import base_dir, PROFILE_DIR
+    return os.path.join(base_dir(), PROFILE_DIR, SERVER_INFO_NAME)
+
+
+class InferenceClient:
+    """推理服务的HTTP客户端，请求与响应均为JSON"""
+    def __init__(self, url, timeout=3600):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            # 服务端异常以 {"error": ...} 返回
+            raise RuntimeError(f"推理服务出错: {json.loads(e.read()).get('error', e.reason)}") from None
+
+    def health(self, timeout=None):
+        return self._request('/health', timeout=timeout)
+
+    def vit(self, paths, model_path, img_size=224, **options):
+        """VIT分类一批图像，返回softmax概率 [N, 类别数]；options 为 precision、fused_attn、merge_ratio、optimize"""
+        response = self._request('/vit', dict(options, paths=[os.path.abspath(p) for p in paths],
+                                              model_path=os.path.abspath(model_path), img_size=img_size))
+        return np.asarray(response['probs'], dtype=np.float32)
+
+    def yolo(self, paths, model_path, backend='torch', imgsz=640, conf=0.3, iou=0.01, max_det=300):
+        """YOLO检测一批图像，返回每张图像的 ((宽, 高), xyxy float32, conf float32, cls int64)"""
+        response = self._request('/yolo', {'paths': [os.path.abspath(p) for p in paths],
+                                           'model_path': os.path.abspath(model_path), 'backend': backend,
+                                           'imgsz': imgsz, 'conf': conf, 'iou': iou, 'max_det': max_det})
+        return [(tuple(item['size']), np.asarray(item['xyxy'], dtype=np.float32).reshape(-1, 4),
+                 np.asarray(item['conf'], dtype=np.float32), np.asarray(item['cls'], dtype=np.int64))
+                for item in response['results']]
+
+
+def connect(url=None, timeout=0.5):
+    """
+    查找并连接推理服务：url 未指定时依次取环境变量 INFER_SERVER_URL 与 config/infer_server.json。
+    健康检查通过时返回 InferenceClient，否则返回 None（调用方回退为进程内推理）。
+    """
+    if not url:
+        url = os.environ.get(SERVER_URL_ENV)
+    if not url and os.path.exists(server_info_path()):
+        with open(server_info_path(), 'r', encoding='utf-8') as f:
+            url = json.load(f).get('url')
+    if not url:
+        return None
+    client = InferenceClient(url)
+    try:
+        info = client.health(timeout=timeout)
+    except (OSError, ValueError, RuntimeError):
+        print(f"推理服务 {url} 不可用，使用进程内推理")
+        return None
+    print(f"使用推理服务 {url}（进程 {info['pid']}，已加载 {len(info['models'])} 个模型）")
+    return client
+
+
+def predict_and_move_remote(client, img_dir, yolo_txt_dir, output_dir, json_path, model_weight_path, batch_size=64,
+                            img_size=224, buckets=None, cache_path=None, cache_max_entries=None, keep_class=0,
+                            verbose=False, **options):
+    """
+    predict_and_move 的推理服务版本：解码与推理在服务端完成，结果缓存、分桶与判定表的处理与进程内一致，
+    缓存键也相同，两种方式可共用一个缓存文件。options 为 precision、fused_attn、merge_ratio、optimize。
+    """
+    from utils.bucketing import iter_bucketed_batches
+    from utils.vit_io import ChipPredictions
+    from tqdm import tqdm
+
+    results = ChipPredictions(img_dir, yolo_txt_dir, output_dir, json_path, keep_class, verbose)
+    # 结果缓存命中的块直接输出，不再请求推理服务
+    results.open_cache(cache_path, model_weight_path, cache_max_entries, backend='torch',
+                       precision=options.get('precision', 'fp32'), merge_ratio=options.get('merge_ratio', 0.),
+                       img_size=None if buckets else img_size, buckets=buckets)
+    groups = results.group(img_size, buckets)
+    batches = list(iter_bucketed_batches(groups, batch_size))
+
+    # 请求由一个后台线程依次发送，服务端推理下一批时本地处理上一批的结果
+    num_images = 0
+    wait_time = 0.0
+    began = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        futures = [(paths, executor.submit(client.vit, paths, model_weight_path, size, **options))
+                   for size, paths in batches]
+        for paths, future in tqdm(futures, desc="Predicting(推理服务)"):
+            start = time.perf_counter()
+            predicts = future.result()
+            wait_time += time.perf_counter() - start
+            num_images += len(paths)
+            results.add_batch(paths, predicts)
+    finally:
+        # 出错时不再发送剩余的请求
+        executor.shutdown(cancel_futures=True)
+        results.close()
+
+    results.write()
+    elapsed = time.perf_counter() - began
+    if num_images:
+        print(f"吞吐统计: 共 {num_images} 张，用时 {elapsed:.2f} s（其中等待推理服务 {wait_time:.2f} s），"
+              f"{num_images / elapsed:.1f} 张/秒")
@@ -0,0 +1,269 @@
+"""
+常驻推理服务：在本机 localhost 上常驻，VIT 与 YOLO 模型只加载一次并保持预热，
+多次流水线运行（包括同时运行的多条流水线）共用，省去每个推理步骤导入torch/ultralytics与加载权重的时间。
+由 cli/infer_server_cli.py 启动，客户端见 utils/infer_client.py。
+
+接口（请求与响应均为JSON）:
+  GET  /health  进程号、已加载的模型与请求计数
+  POST /vit     {paths, model_path, img_size, precision, fused_attn, merge_ratio, optimize} -> {probs}
+  POST /yolo    {paths, model_path, backend, imgsz, conf, iou, max_det} -> {results: [{size, xyxy, conf, cls}]}
+请求只包含图像的绝对路径，由服务端的解码线程读取。每个模型一把锁，同一模型的前向依次执行，
+不同请求的解码与其他请求的前向并行。权重文件修改后（修改时间变化）自动重新加载。
+YOLO的预处理（批内letterbox）与进程内推理相同，检测结果与 --no-server 一致。
+
+加载权重会反序列化（pickle）文件内容，服务没有鉴权，因此只监听本机回环地址，
+并且只加载位于允许目录（默认 config/ 与预加载模型所在目录）中的模型。
+"""
+import os
+import json
+import time
+import ipaddress
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def is_loopback(host):
+    """host 是否为本机回环地址（localhost、127.0.0.0/8、::1）"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _is_under(path, root):
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # Windows上位于不同盘符
+        return False
+
+
+class ModelRegistry:
+    """
+    按键缓存已加载的模型，每个模型带一把推理锁。
+    注册表锁只在查找或登记占位（Future）时持有，加载在锁外进行：加载一个模型时，
+    其他模型的请求与健康检查不受影响，同一模型的并发请求等待同一次加载。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}
+
+    def get(self, key, loader):
+        with self.lock:
+            future = self.models.get(key)
+            owner = future is None
+            if owner:
+                # 键为 (类型, 权重路径, 修改时间, 其他选项...)，权重文件更新后旧版本不再使用
+                for old in [k for k in self.models if k[:2] == key[:2] and k[3:] == key[3:]]:
+                    del self.models[old]
+                future = self.models[key] = Future()
+        if owner:
+            start = time.perf_counter()
+            try:
+                entry = (loader(), threading.Lock())
+            except BaseException as e:
+                # 加载失败不留在注册表中，下一个请求重新加载
+                with self.lock:
+                    if self.models.get(key) is future:
+                        del self.models[key]
+                future.set_exception(e)
+                raise
+            future.set_result(entry)
+            print(f"已加载模型 {key[1]}（{time.perf_counter() - start:.1f} s）")
+        return future.result()
+
+    def keys(self):
+        """已加载完成的模型键（正在加载的不计入）"""
+        with self.lock:
+            futures = list(self.models.items())
+        return [list(map(str, key)) for key, future in futures if future.done() and future.exception() is None]
+
+
+class InferenceService:
+    """请求的处理逻辑，与HTTP无关。model_roots 为允许加载模型的目录，其外的模型路径被拒绝"""
+    def __init__(self, device='cpu', decode_threads=4, model_roots=()):
+        self.device = device
+        self.registry = ModelRegistry()
+        self.decoder = ThreadPoolExecutor(max_workers=decode_threads)
+        self.model_roots = [os.path.realpath(root) for root in model_roots]
+        self.started = time.time()
+        self.requests = {'vit': 0, 'yolo': 0}
+        self.requests_lock = threading.Lock()
+
+    def health(self):
+        with self.requests_lock:
+            requests = dict(self.requests)
+        return {'pid': os.getpid(), 'device': str(self.device), 'models': self.registry.keys(),
+                'requests': requests, 'uptime_s': time.time() - self.started}
+
+    def _count(self, kind):
+        with self.requests_lock:
+            self.requests[kind] += 1
+
+    def allow_model_dir(self, model_path):
+        """把模型所在目录加入允许目录（预加载的模型）"""
+        root = os.path.dirname(os.path.realpath(model_path))
+        if root not in self.model_roots:
+            self.model_roots.append(root)
+
+    def _model_path(self, model_path):
+        """规范为绝对路径（与客户端发送的路径一致，预加载的模型才能被请求命中），并检查是否在允许目录中"""
+        real = os.path.realpath(model_path)
+        if not any(_is_under(real, root) for root in self.model_roots):
+            raise PermissionError(f"模型 {model_path} 不在允许的目录中（infer_server_cli.py --model-root）")
+        return os.path.abspath(model_path)
+
+    def vit_model(self, model_path, img_size=224, precision='fp32', fused_attn=False, merge_ratio=0.,
+                  optimize='eager'):
+        """eager模式下各分辨率共用一个模型（推理前切换位置编码），冻结/编译的模型按分辨率分别加载"""
+        import torch
+        from utils.predect import load_vit_model
+
+        model_path = self._model_path(model_path)
+        size_key = None if optimize == 'eager' else img_size
+        key = ('vit', model_path, os.path.getmtime(model_path), precision, fused_attn, merge_ratio, optimize,
+               size_key)
+        device = torch.device('cpu') if precision == 'int8' else torch.device(self.device)
+
+        def load():
+            model = load_vit_model(model_path, device, fused_attn=fused_attn, precision=precision, optimize=optimize,
+                                   merge_ratio=merge_ratio, img_size=img_size)
+            # 预热一次前向，首个请求不再承担初始化开销
+            with torch.no_grad():
+                model(torch.zeros(1, 3, img_size, img_size, device=device))
+            return model
+
+        return self.registry.get(key, load), device
+
+    def predict_vit(self, request):
+        import torch
+        from PIL import Image
+        from utils.predect import get_data_transform
+
+        self._count('vit')
+        img_size = request.get('img_size', 224)
+        options = {k: request[k] for k in ('precision', 'fused_attn', 'merge_ratio', 'optimize') if k in request}
+        (model, lock), device = self.vit_model(request['model_path'], img_size, **options)
+        transform = get_data_transform(img_size)
+        images = torch.stack(list(self.decoder.map(lambda p: transform(Image.open(p).convert("RGB")),
+                                                   request['paths'])))
+        with lock, torch.no_grad():
+            if options.get('optimize', 'eager') == 'eager':
+                model.set_input_size(img_size)
+            probs = torch.softmax(model(images.to(device)), dim=1).cpu().numpy()
+        return {'probs': probs.tolist()}
+
+    def yolo_model(self, model_path, backend='torch', imgsz=640):
+        import numpy as np
+        from utils.yolo_export import load_model
+        from utils.yolo_predict import candidate_predictor
+
+        model_path = self._model_path(model_path)
+        key = ('yolo', model_path, os.path.getmtime(model_path), backend)
+
+        def load():
+            model = load_model(model_path, backend, imgsz)
+            # 预热一次前向
+            model.predict(source=[np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], imgsz=imgsz, verbose=False,
+                          predictor=candidate_predictor())
+            return model
+
+        return self.registry.get(key, load)
+
+    def predict_yolo(self, request):
+        import numpy as np
+        from utils.yolo_candidates import NO_NMS_IOU
+        from utils.yolo_predict import read_image, result_arrays, letterbox_batch, letterboxed_images, \
+            unletterbox_boxes, candidate_predictor, letterbox_stride
+
+        self._count('yolo')
+        imgsz = request.get('imgsz', 640)
+        iou = request.get('iou', 0.01)
+        backend = request.get('backend', 'torch')
+        model, lock = self.yolo_model(request['model_path'], backend, imgsz)
+        images = list(self.decoder.map(read_image, request['paths']))
+        # 与进程内读取线程相同的letterbox，ultralytics收到后不再改变图像
+        batch = np.empty((len(images), imgsz, imgsz, 3), dtype=np.uint8)
+        infos, shape = letterbox_batch(images, batch, letterbox_stride(backend))
+        with lock:
+            results = list(model.predict(source=letterboxed_images(batch, shape), stream=True, batch=len(images),
+                                         imgsz=imgsz, conf=request.get('conf', 0.3), iou=iou,
+                                         max_det=request.get('max_det', 300), verbose=False,
+                                         predictor=candidate_predictor()))
+        output = []
+        for (size, ratio, pad), result in zip(infos, results):
+            xyxy, scores, classes = result_arrays(result)
+            # 候选框（不做NMS）不裁剪，由客户端NMS后再裁剪
+            xyxy = unletterbox_boxes(xyxy, ratio, pad, size, clip=iou < NO_NMS_IOU)
+            output.append({'size': list(size), 'xyxy': xyxy.tolist(), 'conf': scores.tolist(),
+                           'cls': classes.tolist()})
+        return {'results': output}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'InferServer/1.0'
+
+    def log_message(self, format, *args):
+        # 不逐个请求打印访问日志
+        pass
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.server.service.health())
+        else:
+            self._send(404, {'error': f'未知路径 {self.path}'})
+
+    def do_POST(self):
+        service = self.server.service
+        handler = {'/vit': service.predict_vit, '/yolo': service.predict_yolo}.get(self.path)
+        if handler is None:
+            self._send(404, {'error': f'未知路径 {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            self._send(200, handler(request))
+        except PermissionError as e:
+            self._send(403, {'error': str(e)})
+        except Exception as e:
+            traceback.print_exc()
+            self._send(500, {'error': f'{type(e).__name__}: {e}'})
+
+
+def serve(host, port, service, info_path=None):
+    """
+    启动HTTP服务并阻塞运行，直到 Ctrl+C。info_path 给定时写入服务地址供客户端发现，退出时删除。
+    服务没有鉴权，host 只能是本机回环地址。
+    """
+    if not is_loopback(host):
+        raise ValueError(f"推理服务只能监听本机回环地址（如 127.0.0.1），不能使用 {host}")
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    url = f'http://{host}:{server.server_address[1]}'
+    if info_path:
+        os.makedirs(os.path.dirname(info_path), exist_ok=True)
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'pid': os.getpid()}, f, ensure_ascii=False, indent=4)
+    print(f"推理服务已启动: {url}（进程 {os.getpid()}），Ctrl+C 停止")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.decoder.shutdown()
+        if info_path and os.path.exists(info_path):
+            os.remove(info_path)
+        print("推理服务已停止")
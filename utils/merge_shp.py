@@ -3,15 +3,17 @@ import geopandas as gpd
 import pandas as pd
 from tqdm import tqdm
 
-def merge_shp(input_folder, output_file, target_crs='EPSG:4326'):
+def merge_shp(input_folder, output_file, target_crs='EPSG:4326', extra_files=None):
+    # extra_files: 额外并入的Shapefile路径（如置信度分流直接接受的块图层），不存在的跳过
     # 创建输出文件夹
     output_folder = os.path.dirname(output_file)
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     gdfs = []
+    # 置信度分流后可能没有块进入YOLO，此时输入文件夹可能不存在
     sub_folders = [os.path.join(input_folder, sub_folder) for sub_folder in os.listdir(input_folder) if
-                   os.path.isdir(os.path.join(input_folder, sub_folder))]
+                   os.path.isdir(os.path.join(input_folder, sub_folder))] if os.path.isdir(input_folder) else []
 
     for sub_folder_path in tqdm(sub_folders, desc='merge_shp'):
         for file in os.listdir(sub_folder_path):
@@ -21,6 +23,12 @@ def merge_shp(input_folder, output_file, target_crs='EPSG:4326'):
                 gdf = gdf.to_crs(target_crs)
                 gdfs.append(gdf)
 
+    for file_path in extra_files or []:
+        if not os.path.exists(file_path):
+            print(f"Warning: {file_path} does not exist, skipped.")
+            continue
+        gdfs.append(gpd.read_file(file_path).to_crs(target_crs))
+
     if not gdfs:
         print("No shapefiles found in the specified input folder.")
         return
@@ -0,0 +1,26 @@
+"""
+流程配置中步骤参数到命令行参数的转换，pipeline_runner.py 与 Qt 的两个流程运行线程共用。
+"""
+
+
+def build_cli_args(params):
+    """
+    把步骤的 params 字典转换为命令行参数列表（不含脚本路径）:
+      布尔值  -> store_true 开关，只在为 True 时传递 --key
+      空字符串 -> 视为未设置，不传递
+      列表    -> nargs='+'，传递 --key v1 v2 ...
+      其他    -> --key str(value)
+    """
+    args = []
+    for k, v in params.items():
+        if isinstance(v, bool):
+            if v:
+                args.append(f"--{k}")
+            continue
+        if v == "":
+            continue
+        if isinstance(v, list):
+            args.extend([f"--{k}"] + [str(item) for item in v])
+            continue
+        args.extend([f"--{k}", str(v)])
+    return args
@@ -1,17 +1,21 @@
-import os
-import json
+import queue
+import threading
+import time
+from contextlib import closing
+import numpy as np
 import torch
 from PIL import Image
 from torchvision import transforms
 from torch.utils.data import DataLoader, Dataset
 from utils.vit_model import vit_base_patch16_224_in21k as create_model
+from utils.vit_io import load_class_indict, print_throughput_report, ChipPredictions
+from utils.vit_cache import DEFAULT_MAX_ENTRIES
 from tqdm import tqdm
-import shutil
 """
-该VIT用来将图像文件夹中预测非病树图像的同名ｔｘｔ文件从ｔｘｔ文件夹转移到另一个文件夹中
+该VIT用来对图像文件夹中的块分类，判定结果写成一张判定表（vit_verdicts.csv）和保留块图层（vit_keep.shp），供后续步骤筛选
 img_path：存放ｔｉｆ图文件夹
-source_txt_dir：存放ｔｉｆ图对应的同名ＹＯＬＯ格式的ｔｘｔ文件夹
-target_txt_dir：存放经VIT判断后非病树图像对应的txt文件夹。
+yolo_txt_dir：可选（旧流程），存放ｔｉｆ图对应的同名ＹＯＬＯ格式的ｔｘｔ文件夹，给定时将非病树图像的同名txt转移到输出文件夹
+output_dir：输出文件夹，存放判定表与保留块图层。
 """
 
 class CustomDataset(Dataset):
@@ -30,79 +34,306 @@ class CustomDataset(Dataset):
         return img, img_path
 
 
-def move_yolo_txt(img_path, source_txt_dir, target_txt_dir):
-    """Move YOLO format annotation txt files to the target directory."""
-    # Get the base name of the image (without extension)
-    img_name = os.path.basename(img_path)
-    txt_name = os.path.splitext(img_name)[0] + ".txt"
+def get_data_transform(img_size=224):
+    """VIT推理使用的预处理，img_size 为模型输入尺寸，缩放比例与224时的 Resize(256) 一致"""
+    return transforms.Compose(
+        [transforms.Resize(img_size * 256 // 224),
+         transforms.CenterCrop(img_size),
+         transforms.ToTensor(),
+         transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5])])
 
-    source_txt_path = os.path.join(source_txt_dir, txt_name)
-    target_txt_path = os.path.join(target_txt_dir, txt_name)
 
-    # If the txt file exists, move it to the new directory
-    if os.path.exists(source_txt_path):
-        shutil.move(source_txt_path, target_txt_path)
-        print(f"Moved: {txt_name}")
-    else:
-        print(f"Warning: No corresponding txt file for {img_name}.")
+def load_vit_model(model_weight_path, device, fused_attn=False, precision='fp32', optimize='eager',
+                   merge_ratio=0., img_size=224):
+    """
+    创建VIT模型并加载权重。
 
+    fused_attn=True 时注意力使用融合的 scaled_dot_product_attention。
+    precision='int8' 时使用 nn.Linear 动态INT8量化的模型（仅CPU），量化权重缓存在原权重旁边。
+    optimize='frozen' 时使用缓存的TorchScript冻结图，'compile' 时使用 torch.compile，失败时均退回eager。
+    merge_ratio > 0 时启用token合并(ToMe)，每个block后合并该比例的patch token。
+    img_size 不为224时插值位置编码，模型以该分辨率推理（需配合 get_data_transform(img_size)）。
+    """
+    def build():
+        return create_model(num_classes=2, has_logits=False, fused_attn=fused_attn, merge_ratio=merge_ratio)
 
-def predict_and_move(img_dir, yolo_txt_dir, target_txt_dir, json_path, model_weight_path, device, batch_size=64):
-    data_transform = transforms.Compose(
-        [transforms.Resize(256),
-         transforms.CenterCrop(224),
-         transforms.ToTensor(),
-         transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5])])
+    def load_eager():
+        if precision == 'int8':
+            from utils.vit_export import load_int8_model
+            model = load_int8_model(build, model_weight_path)
+        else:
+            model = build().to(device)
+            model.load_state_dict(torch.load(model_weight_path, map_location=device))
+            model.eval()
+        model.set_input_size(img_size)
+        return model
+
+    if precision == 'int8':
+        if device.type != 'cpu':
+            print("INT8量化模型只支持CPU推理，已忽略CUDA设置")
+        device = torch.device('cpu')
+
+    if optimize == 'frozen':
+        from utils.vit_export import load_frozen_model
+        tag = f"frozen-{precision}" + ("-fused" if fused_attn else "") + (f"-tome{merge_ratio:g}" if merge_ratio else "")
+        if img_size != 224:
+            tag += f"-{img_size}px"
+        return load_frozen_model(load_eager, model_weight_path, device, tag=tag, img_size=img_size)
+    if optimize == 'compile':
+        from utils.vit_export import compile_model
+        return compile_model(load_eager(), model_weight_path, device, img_size=img_size)
+    return load_eager()
+
+
+def make_data_loader(dataset, batch_size=64, num_workers=0, prefetch_factor=2, persistent_workers=False,
+                     pin_memory=False):
+    """
+    创建推理用的DataLoader。num_workers > 0 时图像解码与预处理在子进程中进行，
+    prefetch_factor 为每个子进程预取的批数，pin_memory 在使用CUDA时加速拷贝。
+    """
+    if num_workers > 0:
+        return DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                          prefetch_factor=prefetch_factor, persistent_workers=persistent_workers,
+                          pin_memory=pin_memory)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, pin_memory=pin_memory)
+
+
+def predict_and_move(img_dir, yolo_txt_dir, output_dir, json_path, model_weight_path, device, batch_size=64,
+                     num_workers=0, prefetch_factor=2, persistent_workers=False, pin_memory=None,
+                     fused_attn=False, precision='fp32', backend='torch', intra_op_threads=None, optimize='eager',
+                     merge_ratio=0., img_size=224, buckets=None, cache_path=None,
+                     cache_max_entries=DEFAULT_MAX_ENTRIES, keep_class=0, verbose=False):
+    """
+    对 img_dir 中的块做VIT分类，判定结果写入 output_dir 的 vit_verdicts.csv；img_dir 为平铺裁剪输出时，
+    判定为 keep_class（默认病树）的块连同几何写入 output_dir 的 vit_keep.shp（见 utils/vit_io.VerdictTable）。
+    给定 yolo_txt_dir 时保留旧流程：健康树对应的txt从 yolo_txt_dir 移动到 output_dir。
+    verbose=True 时逐块打印结果。
+
+    pin_memory 为 None 时在CUDA设备上自动开启。结束时打印数据加载与模型推理的吞吐统计。
+    optimize、merge_ratio、img_size 见 load_vit_model。
+    buckets 为分桶规则（见 utils/bucketing.py）时按图像尺寸分桶，每个桶使用自己的输入分辨率，此时忽略 img_size。
+    backend='onnx' 时改用 onnxruntime 推理（见 utils/vit_onnx.py），intra_op_threads 为其线程数。
+    cache_path 为SQLite结果缓存文件（见 utils/vit_cache.py），命中的块跳过解码与推理。
+    """
+    if backend == 'onnx':
+        from utils.vit_onnx import predict_and_move_onnx
+        return predict_and_move_onnx(img_dir, yolo_txt_dir, output_dir, json_path, model_weight_path,
+                                     batch_size=batch_size, intra_op_threads=intra_op_threads,
+                                     num_workers=num_workers, img_size=img_size, buckets=buckets,
+                                     cache_path=cache_path, cache_max_entries=cache_max_entries,
+                                     keep_class=keep_class, verbose=verbose)
+
+    results = ChipPredictions(img_dir, yolo_txt_dir, output_dir, json_path, keep_class, verbose)
+    # 结果缓存命中的块直接输出，不再解码和推理
+    results.open_cache(cache_path, model_weight_path, cache_max_entries, backend='torch', precision=precision,
+                       merge_ratio=merge_ratio, img_size=None if buckets else img_size, buckets=buckets)
+    # 按尺寸分桶时每个桶一个输入分辨率
+    groups = results.group(img_size, buckets)
+
+    # Create model and load weights
+    # eager模式下所有桶共用一个模型，切换分辨率只需重新插值位置编码；冻结/编译的模型按分辨率分别加载
+    models = {}
+
+    def model_for(size):
+        if optimize == 'eager':
+            if not models:
+                models[None] = load_vit_model(model_weight_path, device, fused_attn=fused_attn, precision=precision,
+                                              merge_ratio=merge_ratio, img_size=size)
+            models[None].set_input_size(size)
+            return models[None]
+        if size not in models:
+            models[size] = load_vit_model(model_weight_path, device, fused_attn=fused_attn, precision=precision,
+                                          optimize=optimize, merge_ratio=merge_ratio, img_size=size)
+        return models[size]
+
+    if precision == 'int8':
+        device = torch.device('cpu')
+    if pin_memory is None:
+        pin_memory = device.type == 'cuda'
+
+    num_images = 0
+    load_time = 0.0
+    model_time = 0.0
+    progress = tqdm(total=len(results.img_paths), desc="Predicting")
+    try:
+        for size, paths in groups.items():
+            if not paths:
+                continue
+            model = model_for(size)
+
+            # Create a DataLoader
+            dataset = CustomDataset(paths, transform=get_data_transform(size))
+            data_loader = make_data_loader(dataset, batch_size, num_workers, prefetch_factor, persistent_workers,
+                                           pin_memory)
 
-    # Load images from directory
-    assert os.path.exists(img_dir), f"directory: '{img_dir}' does not exist."
-    img_paths = [os.path.join(img_dir, img_name) for img_name in os.listdir(img_dir) if img_name.endswith('.tif')]
+            start = time.perf_counter()
+            for imgs, batch_paths in data_loader:
+                loaded = time.perf_counter()
+                load_time += loaded - start
 
-    # Create the target directory for non-diseased tree txt files
-    os.makedirs(target_txt_dir, exist_ok=True)
+                imgs = imgs.to(device, non_blocking=pin_memory)
+                with torch.no_grad():
+                    outputs = model(imgs)
+                    predicts = torch.softmax(outputs, dim=1).cpu().numpy()
+                model_time += time.perf_counter() - loaded
+                num_images += len(batch_paths)
 
-    # Read class_indict
-    assert os.path.exists(json_path), f"file: '{json_path}' does not exist."
-    with open(json_path, "r") as f:
-        class_indict = json.load(f)
+                results.add_batch(batch_paths, predicts)
+                progress.update(len(batch_paths))
+                start = time.perf_counter()
+    finally:
+        progress.close()
+        results.close()
 
-    # Create model
-    model = create_model(num_classes=2, has_logits=False).to(device)
-    # Load model weights
-    model.load_state_dict(torch.load(model_weight_path, map_location=device))
-    model.eval()
+    results.write()
+    print_throughput_report(num_images, load_time, model_time)
 
-    # Create a DataLoader
-    dataset = CustomDataset(img_paths, transform=data_transform)
-    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
 
-    for imgs, img_paths in tqdm(data_loader, desc="Predicting"):
-        imgs = imgs.to(device)
+def chip_to_pil(chip):
+    """将 rasterio 读出的 [bands, H, W] 数组转换为 RGB 的 PIL 图像，与 Image.open(...).convert("RGB") 一致"""
+    if chip.shape[0] >= 3:
+        return Image.fromarray(np.ascontiguousarray(np.moveaxis(chip[:3], 0, -1))).convert("RGB")
+    return Image.fromarray(chip[0]).convert("RGB")
+
+
+_QUEUE_DONE = object()
+
+
+def _produce_chips(chip_iter, chip_queue, stop):
+    """生产者线程：把裁剪块放入有界队列，队列满时阻塞（背压）；stop 置位后不再读取并退出"""
+    def put(item):
+        while not stop.is_set():
+            try:
+                chip_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    try:
+        for item in chip_iter:
+            if stop.is_set():
+                break
+            put(item)
+    except Exception as e:
+        put(e)
+    finally:
+        put(_QUEUE_DONE)
+
+
+def classify_chips(chip_iter, model, device, data_transform=None, batch_size=64, queue_size=256, get_image=None):
+    """
+    在后台线程中消费 chip_iter（例如 shp_kuang_cut.iter_chips 的输出），经有界队列按批送入VIT，
+    对每个元素生成 item + (predict_cla, prob)。
+
+    get_image 从元素中取出 [bands, H, W] 图像数组，默认取 item[3]（iter_chips 的 out_image）。
+    queue_size 限制已裁剪但尚未推理的块数，推理跟不上时裁剪线程会被阻塞。
+    消费方出错或提前停止迭代（生成器关闭）时通知裁剪线程停止并等待其退出，
+    之后 chip_iter 引用的数据源可以安全关闭。
+    """
+    data_transform = data_transform or get_data_transform()
+    get_image = get_image or (lambda item: item[3])
+    chip_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce_chips, args=(chip_iter, chip_queue, stop), daemon=True)
+    producer.start()
+
+    def run_batch(batch):
+        imgs = torch.stack([data_transform(chip_to_pil(get_image(item))) for item in batch]).to(device)
         with torch.no_grad():
-            outputs = model(imgs)
-            predicts = torch.softmax(outputs, dim=1)
+            predicts = torch.softmax(model(imgs), dim=1)
             predict_clas = torch.argmax(predicts, dim=1)
+        for item, predict_cla, predict in zip(batch, predict_clas.tolist(), predicts):
+            yield item + (predict_cla, predict[predict_cla].item())
+
+    try:
+        batch = []
+        while True:
+            item = chip_queue.get()
+            if item is _QUEUE_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield from run_batch(batch)
+                batch = []
+        if batch:
+            yield from run_batch(batch)
+    finally:
+        stop.set()
+        producer.join()
+
+
+def crop_and_classify(input_tif, input_shp, output_dir, json_path, model_weight_path, device, scale_factor=1.0,
+                      batch_size=64, queue_size=256, keep_class=0, save_chips=True,
+                      followup_scale=None, followup_dir=None, cache=None, chunk_size=1024, fused_attn=False,
+                      precision='fp32', optimize='eager', merge_ratio=0., img_size=224):
+    """
+    裁剪与VIT分类融合：裁剪块在内存中直接送入VIT，不经过中间GeoTIFF。
+
+    输出（均位于 output_dir）:
+    crop_verdicts.shp / crop_verdicts.csv: 所有块的外接矩形、类别(cls)与概率(prob)
+    crop_chips.shp / crop_manifest.csv: 预测为 keep_class 的块（默认病树），可直接作为下一次SHP框裁剪的输入
+    save_chips=True 时保留块的图像同时写入 output_dir
+
+    给定 followup_scale 和 followup_dir 时，每个区域按较大比例只读取一次，保留块按 followup_scale
+    的裁剪结果以平铺模式写入 followup_dir（替代之后单独的 1.5 倍SHP框裁剪步骤）。
+    """
+    import fiona
+    import rasterio
+    from utils.shp_kuang_cut import FlatChipWriter, make_progress, iter_multiscale_chips
+
+    class_indict = load_class_indict(json_path)
+    model = load_vit_model(model_weight_path, device, fused_attn=fused_attn, precision=precision,
+                           optimize=optimize, merge_ratio=merge_ratio, img_size=img_size)
+    if precision == 'int8':
+        device = torch.device('cpu')
+
+    scales = [scale_factor] if followup_scale is None else [scale_factor, followup_scale]
+    verdict_fields = {'cls': 'int', 'prob': 'float'}
+    kept = 0
+    # 要素从shp中流式读取，不整体载入内存
+    with fiona.open(input_shp, 'r') as shp, rasterio.open(input_tif) as src, make_progress(len(shp)) as progress:
+        schema = shp.schema
+        crs = shp.crs
+        total = len(shp)
 
-        for i in range(len(img_paths)):
-            img_path = img_paths[i]
-            predict_cla = predict_clas[i].item()
-            prob = predicts[i][predict_cla].item()
+        followup_writer = None
+        if followup_scale is not None:
+            followup_writer = FlatChipWriter(followup_dir, schema, crs, verdict_fields)
+        try:
+            with FlatChipWriter(output_dir, schema, crs, verdict_fields, save_images=False,
+                                layer_name='crop_verdicts.shp', manifest_name='crop_verdicts.csv') as verdict_writer, \
+                    FlatChipWriter(output_dir, schema, crs, verdict_fields, save_images=save_chips) as keep_writer:
+                chip_iter = iter_multiscale_chips(src, shp, scales, chunk_size=chunk_size, cache=cache, progress=progress)
+                # 显式关闭生成器：写出出错时先停止裁剪线程，再关闭 src 与 shp
+                results = classify_chips(chip_iter, model, device, data_transform=get_data_transform(img_size),
+                                         batch_size=batch_size, queue_size=queue_size,
+                                         get_image=lambda item: item[2][0][1])
+                with closing(results):
+                    for chip_id, feature, chips, predict_cla, prob in results:
+                        rotated_rect, out_image, out_meta = chips[0]
+                        verdict_writer.write(chip_id, feature, rotated_rect, out_image, out_meta, cls=predict_cla, prob=prob)
+                        if predict_cla != keep_class:
+                            continue
+                        keep_writer.write(chip_id, feature, rotated_rect, out_image, out_meta, cls=predict_cla, prob=prob)
+                        if followup_writer is not None:
+                            followup_writer.write(chip_id, feature, *chips[1], cls=predict_cla, prob=prob)
+                        kept += 1
+        finally:
+            if followup_writer is not None:
+                followup_writer.close()
 
-            # 根据预测类别打印结果
-            print_res = f"Image: {img_path} - class: {class_indict[str(predict_cla)]}   prob: {prob:.3f}"
-            print(print_res)
+    print(f"共 {total} 个要素，{kept} 个被判定为 {class_indict[str(keep_class)]}")
 
-            # 如果是健康树（即类别为 1），则移动相应的 YOLO txt 文件
-            if predict_cla == 1:  # 预测为健康树
-                move_yolo_txt(img_path, yolo_txt_dir, target_txt_dir)
 
 # Usage example:
 
 # img_dir = "path/to/tif_images"
-# yolo_txt_dir = "path/to/yolo_txts"
-# target_txt_dir = "path/to/save/target_txts"
+# yolo_txt_dir = None
+# output_dir = "path/to/save/verdicts"
 # json_path = "path/to/class_indices.json"
 # model_weight_path = "path/to/vit_model_weights.pth"
 # device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-# predict_and_move(img_dir, yolo_txt_dir, target_txt_dir, json_path, model_weight_path, device)
+# predict_and_move(img_dir, yolo_txt_dir, output_dir, json_path, model_weight_path, device)
@@ -0,0 +1,145 @@
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+"""
+解码子进程与推理循环之间的共享内存环形缓冲区，批数据不经过 pickle。
+
+一块 SharedMemory 划分为 slots 个固定字节数的槽，每个槽放一整批预处理好的数组：
+  空闲槽队列  子进程先取一个空闲槽（没有空闲槽时阻塞，即背压），把一批图像直接解码写入槽内的数组视图
+  就绪队列    子进程只发送 (任务号, 槽号, 少量元数据)，推理循环按槽号在同一块内存上建立视图直接使用
+  回收        推理循环取下一批时，上一批的槽自动放回空闲队列
+队列中只传递整数和小元组，每块的传输开销与图像大小无关。
+子进程以 spawn 方式启动（Windows 与打包后的exe一致），fill 函数必须是模块级函数。
+"""
+
+_WORKER_DONE = 'done'
+
+
+class SharedBatchRing:
+    """
+    固定槽数、每槽 slot_bytes 字节的共享内存环形缓冲区。
+    创建方持有并负责 unlink；传给子进程时只序列化共享内存名称与队列，子进程中按名称重新连接。
+    """
+    def __init__(self, slots, slot_bytes, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, slots * slot_bytes))
+        self.owner = True
+        self.free = context.Queue()
+        self.ready = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def __getstate__(self):
+        return {'slots': self.slots, 'slot_bytes': self.slot_bytes, 'name': self.shm.name,
+                'free': self.free, 'ready': self.ready}
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.slot_bytes = state['slot_bytes']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.owner = False
+        self.free = state['free']
+        self.ready = state['ready']
+
+    def view(self, slot, shape, dtype):
+        """槽 slot 上形状为 shape 的数组视图（不复制）"""
+        dtype = np.dtype(dtype)
+        if int(np.prod(shape)) * dtype.itemsize > self.slot_bytes:
+            raise ValueError(f"形状 {shape} ({dtype}) 超出槽容量 {self.slot_bytes} 字节")
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # 调用方仍持有视图时无法解除映射，由进程退出时释放
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def _ring_worker(ring, tasks, fill):
+    """子进程：取任务 -> 等待空闲槽 -> fill 写入槽 -> 通知推理循环"""
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, shape, dtype, payload = task
+            start = time.perf_counter()
+            slot = ring.free.get()
+            acquired = time.perf_counter()
+            try:
+                meta = fill(payload, ring.view(slot, shape, dtype))
+            except Exception as e:
+                ring.release(slot)
+                ring.ready.put((task_id, None, e, 0.0, 0.0))
+                break
+            ring.ready.put((task_id, slot, meta, acquired - start, time.perf_counter() - acquired))
+    finally:
+        ring.ready.put(_WORKER_DONE)
+        ring.close()
+
+
+def iter_shared_batches(tasks, fill, workers=2, slots=None, timer=None):
+    """
+    在 workers 个子进程中执行 fill(payload, out) 并通过共享内存环形缓冲区取回结果。
+    tasks 为 [(形状, dtype, payload), ...]，fill 把 payload 对应的一批数据写入形状为 形状 的数组 out，
+    返回可 pickle 的少量元数据。按完成顺序产出 (payload, out视图, 元数据)；
+    视图在取下一批时回收，推理循环需在此之前用完（或复制）。
+    timer（utils.yolo_predict.StageTimer）累计子进程的 fill 时间与等待空闲槽的时间。
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return
+    context = multiprocessing.get_context('spawn')
+    slot_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype, _ in tasks)
+    # 每个子进程一个在写的槽、一个写完待取的槽，外加推理循环正在使用的一个
+    ring = SharedBatchRing(slots or 2 * workers + 1, slot_bytes, context)
+    task_queue = context.Queue()
+    for task_id, (shape, dtype, _) in enumerate(tasks):
+        task_queue.put((task_id, tuple(shape), np.dtype(dtype).str, tasks[task_id][2]))
+    for _ in range(workers):
+        task_queue.put(None)
+    processes = [context.Process(target=_ring_worker, args=(ring, task_queue, fill), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    held = None
+    finished = 0
+    try:
+        while finished < workers:
+            try:
+                item = ring.ready.get(timeout=1.0)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError("解码子进程异常退出")
+                continue
+            if item == _WORKER_DONE:
+                finished += 1
+                continue
+            task_id, slot, meta, blocked_s, fill_s = item
+            if slot is None:
+                raise meta
+            if timer is not None:
+                timer.add('fill', fill_s)
+                timer.add('reader_blocked', blocked_s)
+            if held is not None:
+                ring.release(held)
+            held = slot
+            shape, dtype, payload = tasks[task_id]
+            yield payload, ring.view(slot, shape, dtype), meta
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        ring.close()
@@ -1,7 +1,13 @@
 import os
+import csv
+import threading
+from collections import OrderedDict
+from itertools import islice
 import fiona
+import shapely
 import rasterio
 from rasterio.mask import mask
+from rasterio.features import geometry_mask, geometry_window
 from shapely.geometry import shape, mapping, Polygon
 from shapely.affinity import rotate, scale
 import numpy as np
@@ -25,6 +31,79 @@ def get_minimum_rotated_rectangle(geom, scale_factor=1.0):
     return rotated_rect
 
 
+def minimum_rotated_rectangle_arrays(geoms):
+    """
+    对整组几何对象向量化计算最小外接矩形。
+
+    返回:
+    oriented (ndarray[Polygon]): 最小外接矩形，无法构成矩形的几何（空、点、线）为 None
+    angles (ndarray): 长边与x轴的夹角（度），与 get_minimum_rotated_rectangle 一致
+    centers (ndarray): 旋转至水平后矩形的中心，形状 (n, 2)
+    widths, heights (ndarray): 旋转至水平后矩形的宽（长边）和高
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    n = len(geoms)
+    oriented = np.full(n, None, dtype=object)
+    angles = np.full(n, np.nan)
+    centers = np.full((n, 2), np.nan)
+    widths = np.full(n, np.nan)
+    heights = np.full(n, np.nan)
+    if n == 0:
+        return oriented, angles, centers, widths, heights
+
+    rects = shapely.minimum_rotated_rectangle(geoms)
+    valid = (shapely.get_type_id(rects) == 3) & ~shapely.is_empty(rects)
+    if not valid.any():
+        return oriented, angles, centers, widths, heights
+
+    # 每个矩形外环 5 个坐标，取前 4 个角点
+    corners = shapely.get_coordinates(shapely.get_exterior_ring(rects[valid])).reshape(-1, 5, 2)[:, :4]
+    edge1 = corners[:, 1] - corners[:, 0]
+    edge2 = corners[:, 2] - corners[:, 1]
+    len1 = np.hypot(edge1[:, 0], edge1[:, 1])
+    len2 = np.hypot(edge2[:, 0], edge2[:, 1])
+    use_edge1 = len1 > len2
+    edge = np.where(use_edge1[:, None], edge1, edge2)
+    angle = np.degrees(np.arctan2(edge[:, 1], edge[:, 0]))
+
+    # rotate(origin='center') 以外包框中心为旋转中心，矩形中心随之旋转
+    rect_center = corners.mean(axis=1)
+    bbox_center = (corners.min(axis=1) + corners.max(axis=1)) / 2
+    theta = np.radians(-angle)
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    offset = rect_center - bbox_center
+    center = bbox_center + np.stack([offset[:, 0] * cos_t - offset[:, 1] * sin_t,
+                                     offset[:, 0] * sin_t + offset[:, 1] * cos_t], axis=1)
+
+    oriented[valid] = rects[valid]
+    angles[valid] = angle
+    centers[valid] = center
+    widths[valid] = np.where(use_edge1, len1, len2)
+    heights[valid] = np.where(use_edge1, len2, len1)
+    return oriented, angles, centers, widths, heights
+
+
+def get_minimum_rotated_rectangles(geoms, scale_factor=1.0):
+    """
+    get_minimum_rotated_rectangle 的向量化版本，一次处理整组几何（列表、ndarray 或 GeoSeries）。
+
+    scale_factor 可以是标量或与 geoms 等长的数组。返回与输入等长的 Polygon 数组，
+    无法计算的几何对应 None。
+    """
+    if hasattr(geoms, 'values'):
+        geoms = geoms.values
+    _, _, centers, widths, heights = minimum_rotated_rectangle_arrays(geoms)
+    scale_factor = np.broadcast_to(np.asarray(scale_factor, dtype=float), widths.shape)
+    half_w = widths * scale_factor / 2
+    half_h = heights * scale_factor / 2
+
+    boxes = np.full(len(widths), None, dtype=object)
+    valid = ~np.isnan(widths)
+    boxes[valid] = shapely.box(centers[valid, 0] - half_w[valid], centers[valid, 1] - half_h[valid],
+                               centers[valid, 0] + half_w[valid], centers[valid, 1] + half_h[valid])
+    return boxes
+
+
 def write_tfw(transform, output_tfw):
     """生成tfw文件"""
     with open(output_tfw, 'w') as tfw:
@@ -36,84 +115,385 @@ def write_tfw(transform, output_tfw):
         tfw.write(f'{transform.yoff:.10f}\n')
 
 
-def crop_and_save_raster(input_tif, input_shp, output_dir, scale_factor=1.0, progress_bar=None, progress_signal=None, log_signal=None):
+# 平铺模式下的汇总文件名
+FLAT_LAYER_NAME = 'crop_chips.shp'
+MANIFEST_NAME = 'crop_manifest.csv'
+MANIFEST_FIELDS = ['chip_id', 'width', 'height', 'a', 'b', 'c', 'd', 'e', 'f']
+
+
+def read_crop_manifest(manifest_path):
+    """
+    读取平铺模式生成的清单文件。
+
+    返回:
+    dict: chip_id -> (top_left_x, top_left_y, x_pixel_size, y_pixel_size, width, height)
+    """
+    manifest = {}
+    with open(manifest_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            manifest[row['chip_id']] = (float(row['c']), float(row['f']),
+                                        float(row['a']), float(row['e']),
+                                        int(row['width']), int(row['height']))
+    return manifest
+
+
+class FlatChipWriter:
+    """
+    平铺模式的裁剪块写出器：图像直接写入输出目录，外接矩形及属性写入同一个
+    crop_chips.shp（chip_id 字段对应图像名），地理变换写入 crop_manifest.csv。
+
+    extra_fields 为额外的属性字段定义，例如 {'cls': 'int', 'prob': 'float'}。
+    save_images=False 时只写汇总图层和清单，不写图像。
+    """
+    def __init__(self, output_dir, schema, crs, extra_fields=None, save_images=True,
+                 layer_name=FLAT_LAYER_NAME, manifest_name=MANIFEST_NAME):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.save_images = save_images
+
+        layer_schema = {'geometry': 'Polygon', 'properties': dict(schema['properties'])}
+        layer_schema['properties']['chip_id'] = 'str:32'
+        layer_schema['properties'].update(extra_fields or {})
+        self.layer = fiona.open(os.path.join(output_dir, layer_name), 'w',
+                                driver='ESRI Shapefile', crs=crs, schema=layer_schema)
+        self.manifest_file = open(os.path.join(output_dir, manifest_name), 'w', newline='')
+        self.manifest_writer = csv.writer(self.manifest_file)
+        self.manifest_writer.writerow(MANIFEST_FIELDS)
+
+    def write(self, chip_id, feature, rotated_rect, out_image, out_meta, **extra):
+        if self.save_images:
+            with rasterio.open(os.path.join(self.output_dir, f'{chip_id}.tif'), 'w', **out_meta) as dest:
+                dest.write(out_image)
+
+        properties = dict(feature['properties'])
+        properties['chip_id'] = chip_id
+        properties.update(extra)
+        self.layer.write({'geometry': mapping(rotated_rect), 'properties': properties})
+
+        transform = out_meta['transform']
+        self.manifest_writer.writerow([chip_id, out_meta['width'], out_meta['height'],
+                                       f'{transform.a:.10f}', f'{transform.b:.10f}', f'{transform.c:.10f}',
+                                       f'{transform.d:.10f}', f'{transform.e:.10f}', f'{transform.f:.10f}'])
+
+    def close(self):
+        self.layer.close()
+        self.manifest_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RegionCache:
+    """
+    已解码栅格区域的LRU缓存，按字节数上限淘汰。
+
+    区域按 (栅格文件, 区域中心所在的网格块) 分桶，栅格文件由 source_key 给出（路径、修改时间与大小），
+    同一路径的栅格被重新生成或替换后不会取到旧的像素。查询时在相邻网格块中寻找完整包含
+    所需窗口的区域，因此一次按大比例读出的区域可以供同一要素更小比例的裁剪复用，
+    也可以供同一进程中后续步骤（例如 1.5 倍的二次裁剪）复用。线程安全。
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024, bucket_size=64):
+        self.max_bytes = max_bytes
+        self.bucket_size = bucket_size
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, window):
+        return (int((window.row_off + window.height / 2) // self.bucket_size),
+                int((window.col_off + window.width / 2) // self.bucket_size))
+
+    def get(self, name, window):
+        """返回包含 window 的已缓存区域 (region_window, data)，没有则返回 None"""
+        row, col = self._bucket(window)
+        with self._lock:
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    for key in self._buckets.get((name, row + d_row, col + d_col), ()):
+                        region_window, data = self._items[key]
+                        if _window_contains(region_window, window):
+                            self._items.move_to_end(key)
+                            self.hits += 1
+                            return region_window, data
+            self.misses += 1
+        return None
+
+    def put(self, name, window, data):
+        key = (name, window.row_off, window.col_off, window.height, window.width)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = (window, data)
+            self._buckets.setdefault((name,) + self._bucket(window), set()).add(key)
+            self.nbytes += data.nbytes
+            while self.nbytes > self.max_bytes and len(self._items) > 1:
+                old_key, (old_window, old_data) = self._items.popitem(last=False)
+                self._buckets[(old_key[0],) + self._bucket(old_window)].discard(old_key)
+                self.nbytes -= old_data.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._buckets.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+# 进程内共享的区域缓存，Qt界面在同一进程中依次执行裁剪步骤时可复用前一步解码的区域
+REGION_CACHE = RegionCache()
+
+
+def _window_contains(outer, inner):
+    return (outer.row_off <= inner.row_off and outer.col_off <= inner.col_off and
+            inner.row_off + inner.height <= outer.row_off + outer.height and
+            inner.col_off + inner.width <= outer.col_off + outer.width)
+
+
+def source_key(src):
+    """区域缓存中栅格文件的键：路径加修改时间与大小，文件被替换后键随之变化"""
+    try:
+        stat = os.stat(src.name)
+    except OSError:
+        # 非本地文件（如 /vsicurl/）只按名称区分
+        return src.name, None, None
+    return src.name, stat.st_mtime_ns, stat.st_size
+
+
+def read_region(src, rect, cache=None):
+    """读取覆盖 rect 的栅格区域（掩膜数组），优先从缓存中取包含该窗口的区域"""
+    window = geometry_window(src, [mapping(rect)])
+    if cache is not None:
+        name = source_key(src)
+        cached = cache.get(name, window)
+        if cached is not None:
+            return cached
+    data = src.read(window=window, masked=True)
+    if cache is not None:
+        cache.put(name, window, data)
+    return window, data
+
+
+def crop_from_region(src, region_window, region_data, rect):
+    """从已读出的区域中裁剪 rect，结果与 mask(src, [rect], crop=True) 一致"""
+    window = geometry_window(src, [mapping(rect)])
+    row = int(window.row_off - region_window.row_off)
+    col = int(window.col_off - region_window.col_off)
+    height, width = int(window.height), int(window.width)
+    data = region_data[:, row:row + height, col:col + width]
+
+    out_transform = src.window_transform(window)
+    shape_mask = geometry_mask([mapping(rect)], transform=out_transform, out_shape=(height, width))
+    nodata = src.nodata if src.nodata is not None else 0
+    out_image = np.ma.array(data, mask=np.ma.getmaskarray(data) | shape_mask).filled(nodata)
+
+    out_meta = src.meta.copy()
+    out_meta.update({
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "transform": out_transform
+    })
+    return out_image, out_meta
+
+
+def _iter_feature_rects(features, scales, chunk_size, progress=None):
+    """
+    按 chunk_size 个要素一组向量化计算各比例的最小外接矩形，生成 (i, feature, rects)。
+    空几何被跳过，无法计算的要素打印错误后跳过。每处理完一个要素 progress 前进一步。
+    """
+    features = iter(features)
+    start = 0
+    while True:
+        chunk = list(islice(features, chunk_size))
+        if not chunk:
+            break
+
+        # 获取标注框的几何形状，计算最小外接矩形并旋转至水平，同时调整矩形大小
+        geoms = np.empty(len(chunk), dtype=object)
+        for j, feature in enumerate(chunk):
+            try:
+                geoms[j] = shape(feature['geometry'])
+            except Exception as e:
+                print(f"Error processing feature {start + j}: {e}")
+        rects = [get_minimum_rotated_rectangles(geoms, scale_factor=scale) for scale in scales]
+
+        for j, feature in enumerate(chunk):
+            i = start + j
+            # 如果几何对象为空，则跳过
+            if geoms[j] is None or geoms[j].is_empty:
+                pass
+            elif rects[0][j] is None:
+                print(f"Error processing feature {i}: 无法计算最小外接矩形")
+            else:
+                yield i, feature, [scale_rects[j] for scale_rects in rects]
+            if progress is not None:
+                progress.update(1)
+        start += len(chunk)
+
+
+def iter_chips(src, features, scale_factor=1.0, chunk_size=1024, progress=None):
+    """
+    逐个要素裁剪已打开的栅格，生成 (chip_id, feature, rotated_rect, out_image, out_meta)。
+
+    最小外接矩形按 chunk_size 个要素一组向量化计算。单个要素出错时打印错误并继续，
+    chip_id 与要素序号一一对应。progress 为 make_progress 创建的进度条。
+    """
+    for i, feature, (rotated_rect,) in _iter_feature_rects(features, [scale_factor], chunk_size, progress):
+        try:
+            # 裁剪tif图像
+            out_image, out_transform = mask(src, [mapping(rotated_rect)], crop=True)
+
+            out_meta = src.meta.copy()
+            out_meta.update({
+                "driver": "GTiff",
+                "height": out_image.shape[1],
+                "width": out_image.shape[2],
+                "transform": out_transform
+            })
+        except Exception as e:
+            print(f"Error processing feature {i}: {e}")
+            continue
+
+        yield f'crop_y{i}', feature, rotated_rect, out_image, out_meta
+
+
+def iter_multiscale_chips(src, features, scales, chunk_size=1024, cache=None, progress=None, followup_scale=None):
+    """
+    多比例裁剪：每个要素只按最大比例读取一次区域，各比例的裁剪块都从该区域中切出。
+
+    生成 (chip_id, feature, chips)，chips 为与 scales 顺序一致的 (rotated_rect, out_image, out_meta) 列表。
+    传入 cache 时区域经由 RegionCache 读取，可复用之前已解码的区域。
+    followup_scale 为后续步骤将要裁剪的比例（例如先 1.0 倍、分流后再 1.5 倍）：区域按它与 scales 中的
+    最大者读取并放入缓存，本次只输出 scales 的裁剪块，后续步骤的窗口被缓存中的区域包含，无需再读盘。
+    """
+    read_scales = list(scales) if followup_scale is None else list(scales) + [followup_scale]
+    largest = int(np.argmax(read_scales))
+    for i, feature, rects in _iter_feature_rects(features, read_scales, chunk_size, progress):
+        try:
+            region_window, region_data = read_region(src, rects[largest], cache)
+            chips = [(rect,) + crop_from_region(src, region_window, region_data, rect)
+                     for rect in rects[:len(scales)]]
+        except Exception as e:
+            print(f"Error processing feature {i}: {e}")
+            continue
+
+        yield f'crop_y{i}', feature, chips
+
+
+def make_progress(total, progress_bar=None, progress_signal=None, log_signal=None):
+    """使用tqdm创建进度条，如果提供了Qt进度条参数，则使用QtTqdm"""
+    if progress_bar is not None or progress_signal is not None:
+        from utils.qt_tqdm import QtTqdm
+        return QtTqdm(
+            total=total,
+            desc="裁剪图像",
+            unit="块",
+            progress_bar=progress_bar,
+            progress_signal=progress_signal,
+            log_signal=log_signal,
+            step_name="裁剪图像"
+        )
+    return tqdm(total=total, desc="裁剪图像", unit="块")
+
+
+def write_chip_folder(output_dir, chip_id, feature, rotated_rect, out_image, out_meta, schema, crs):
+    """默认输出模式：每个裁剪块一个子文件夹，内含 tif、tfw 和单要素 shp"""
+    # 创建子文件夹
+    subfolder = os.path.join(output_dir, chip_id)
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
+
+    # 输出文件路径
+    output_tif = os.path.join(subfolder, f'{chip_id}.tif')
+    output_shp = os.path.join(subfolder, f'{chip_id}.shp')
+    output_tfw = os.path.join(subfolder, f'{chip_id}.tfw')
+
+    # 保存裁剪后的tif图像
+    with rasterio.open(output_tif, 'w', **out_meta) as dest:
+        dest.write(out_image)
+
+    # 生成并保存tfw文件
+    write_tfw(out_meta['transform'], output_tfw)
+
+    # 创建新的shp文件
+    with fiona.open(output_shp, 'w', driver='ESRI Shapefile', crs=crs, schema=schema) as dest_shp:
+        new_feature = {
+            'geometry': mapping(rotated_rect),
+            'properties': feature['properties']
+        }
+        dest_shp.write(new_feature)
+
+
+def scale_output_dir(output_dir, scale):
+    """多比例模式下每个比例的输出子文件夹，例如 scale_1.5"""
+    return os.path.join(output_dir, f'scale_{scale:g}')
+
+
+def crop_and_save_raster(input_tif, input_shp, output_dir, scale_factor=1.0, progress_bar=None, progress_signal=None, log_signal=None,
+                         flat=False, cache=None, chunk_size=1024, followup_scale=None):
+    """
+    按shp中每个要素的最小外接矩形裁剪大图。
+
+    默认模式为每个要素创建 crop_y{i} 子文件夹，内含 tif、tfw 和单要素 shp。
+    flat=True 时使用 FlatChipWriter 平铺输出，下游无需再执行 tiqu 提取步骤。
+
+    scale_factor 为列表时进入多比例模式：每个区域只按最大比例读取一次，各比例的结果分别写入
+    output_dir/scale_<比例> 子文件夹。cache 为 RegionCache 时读取经由缓存（可传入 REGION_CACHE
+    与同一进程中的其他步骤共享）。followup_scale 见 iter_multiscale_chips，只在传入 cache 时生效：
+    cvy 流程中 05 步按 1.0 倍裁剪时传入 1.5，08 步 1.5 倍裁剪的区域即可全部从缓存中取得。
+
+    要素从shp中流式读取，每次最多取 chunk_size 个，进度条总数取自图层的要素数，
+    内存占用与要素总数无关，第一批读入后即开始裁剪。
+    """
     # 创建输出目录
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # 读取shp文件
-    with fiona.open(input_shp, 'r') as shp:
-        features = [feature for feature in shp]
+    multiscale = isinstance(scale_factor, (list, tuple))
+    scales = list(scale_factor) if multiscale else [scale_factor]
+    output_dirs = [scale_output_dir(output_dir, scale) for scale in scales] if multiscale else [output_dir]
+    for scale_dir in output_dirs:
+        os.makedirs(scale_dir, exist_ok=True)
+
+    # 读取shp文件（流式）和大tif图像
+    with fiona.open(input_shp, 'r') as shp, rasterio.open(input_tif) as src, \
+            make_progress(len(shp), progress_bar, progress_signal, log_signal) as progress:
         schema = shp.schema
         crs = shp.crs
 
-    # 读取大tif图像
-    with rasterio.open(input_tif) as src:
-        # 使用tqdm创建进度条，如果提供了Qt进度条参数，则使用QtTqdm
-        if progress_bar is not None or progress_signal is not None:
-            from utils.qt_tqdm import QtTqdm
-            progress_iterator = QtTqdm(
-                features, 
-                desc="裁剪图像", 
-                unit="块",
-                progress_bar=progress_bar,
-                progress_signal=progress_signal,
-                log_signal=log_signal,
-                step_name="裁剪图像"
-            )
-        else:
-            progress_iterator = tqdm(features, desc="裁剪图像", unit="块")
-            
-        for i, feature in enumerate(progress_iterator):
-            try:
-                # 获取标注框的几何形状
-                geom = shape(feature['geometry'])
-
-                # 如果几何对象为空，则跳过
-                if geom.is_empty:
-                    continue
-
-                # 计算最小外接矩形并旋转至水平，同时调整矩形大小
-                rotated_rect = get_minimum_rotated_rectangle(geom, scale_factor=scale_factor)
-
-                # 裁剪tif图像
-                out_image, out_transform = mask(src, [mapping(rotated_rect)], crop=True)
-
-                # 创建子文件夹
-                subfolder = os.path.join(output_dir, f'crop_y{i}')
-                if not os.path.exists(subfolder):
-                    os.makedirs(subfolder)
-
-                # 输出文件路径
-                output_tif = os.path.join(subfolder, f'crop_y{i}.tif')
-                output_shp = os.path.join(subfolder, f'crop_y{i}.shp')
-                output_tfw = os.path.join(subfolder, f'crop_y{i}.tfw')
-
-                # 保存裁剪后的tif图像
-                out_meta = src.meta.copy()
-                out_meta.update({
-                    "driver": "GTiff",
-                    "height": out_image.shape[1],
-                    "width": out_image.shape[2],
-                    "transform": out_transform
-                })
-
-                with rasterio.open(output_tif, 'w', **out_meta) as dest:
-                    dest.write(out_image)
-
-                # 生成并保存tfw文件
-                write_tfw(out_transform, output_tfw)
-
-                # 创建新的shp文件
-                with fiona.open(output_shp, 'w', driver='ESRI Shapefile', crs=crs, schema=schema) as dest_shp:
-                    new_feature = {
-                        'geometry': mapping(rotated_rect),
-                        'properties': feature['properties']
-                    }
-                    dest_shp.write(new_feature)
+        flat_writers = [FlatChipWriter(scale_dir, schema, crs) for scale_dir in output_dirs] if flat else None
+        try:
+            if multiscale or cache is not None:
+                chip_iter = iter_multiscale_chips(src, shp, scales, chunk_size=chunk_size, cache=cache,
+                                                  progress=progress,
+                                                  followup_scale=followup_scale if cache is not None else None)
+            else:
+                chip_iter = ((chip_id, feature, [(rotated_rect, out_image, out_meta)])
+                             for chip_id, feature, rotated_rect, out_image, out_meta
+                             in iter_chips(src, shp, scale_factor, chunk_size=chunk_size, progress=progress))
 
-            except Exception as e:
-                print(f"Error processing feature {i}: {e}")
+            for chip_id, feature, chips in chip_iter:
+                for k, (rotated_rect, out_image, out_meta) in enumerate(chips):
+                    try:
+                        if flat_writers is not None:
+                            flat_writers[k].write(chip_id, feature, rotated_rect, out_image, out_meta)
+                        else:
+                            write_chip_folder(output_dirs[k], chip_id, feature, rotated_rect, out_image, out_meta,
+                                              schema, crs)
+                    except Exception as e:
+                        print(f"Error processing feature {chip_id}: {e}")
+        finally:
+            if flat_writers is not None:
+                for flat_writer in flat_writers:
+                    flat_writer.close()
 
 # # 输入文件路径
 # input_tif = 'D:\\病树检测\\code_merge\\sicktree_merge_code\\data\\10\\2.tif'
@@ -3,6 +3,7 @@ import numpy as np
 from osgeo import gdal, ogr, osr
 from shapely.geometry import Polygon
 from tqdm import tqdm
+from utils.shp_kuang_cut import MANIFEST_NAME, read_crop_manifest
 
 def read_tfw(tfw_path):
     with open(tfw_path, 'r') as f:
@@ -82,6 +83,9 @@ def create_shapefile(output_path, labels, top_left_x, top_left_y, x_pixel_size,
 
 def batch_process(tif_folder, tfw_folder, txt_folder, output_folder):
     tif_files = [f for f in os.listdir(tif_folder) if f.endswith('.tif')]
+    # 平铺裁剪模式下没有tfw文件，地理变换从清单中读取
+    manifest_path = os.path.join(tfw_folder, MANIFEST_NAME)
+    manifest = read_crop_manifest(manifest_path) if os.path.exists(manifest_path) else {}
     for tif_file in tqdm(tif_files, desc='txt_to_shp'):
         base_name = os.path.splitext(tif_file)[0]
         tif_path = os.path.join(tif_folder, tif_file)
@@ -94,8 +98,12 @@ def batch_process(tif_folder, tfw_folder, txt_folder, output_folder):
         if os.path.exists(tfw_path) and os.path.exists(txt_path):
             top_left_x, top_left_y, x_pixel_size, y_pixel_size = read_tfw(tfw_path)
             img_width, img_height = read_image_size(tif_path)
-            labels = read_yolo_labels(txt_path)
-            create_shapefile(output_shp_path, labels, top_left_x, top_left_y, x_pixel_size, y_pixel_size, img_width, img_height)
-            print(f"Shapefile created for {tif_file}")
+        elif base_name in manifest and os.path.exists(txt_path):
+            top_left_x, top_left_y, x_pixel_size, y_pixel_size, img_width, img_height = manifest[base_name]
         else:
             print(f"Missing TFW or TXT file for {tif_file}")
+            continue
+
+        labels = read_yolo_labels(txt_path)
+        create_shapefile(output_shp_path, labels, top_left_x, top_left_y, x_pixel_size, y_pixel_size, img_width, img_height)
+        print(f"Shapefile created for {tif_file}")
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import numpy as np
+"""
+VIT逐块推理结果的持久化缓存（SQLite）。
+
+键为 (块哈希, 模型键)：块哈希是图像文件内容的哈希，模型键由模型文件（路径、修改时间与大小）
+与影响输出的推理配置（精度、模型实际的输入分辨率/分桶、token合并比例、后端）共同决定，
+模型文件被替换或重新导出、配置变化时旧结果自动失效。
+值为softmax概率。命中时跳过解码与前向推理。条目数超过上限时按最近使用时间淘汰（LRU）。
+不依赖torch，torch 与 onnxruntime 两种后端共用。
+"""
+
+DEFAULT_MAX_ENTRIES = 1000000
+
+
+def chip_hash(img_path, chunk_size=1024 * 1024):
+    """图像文件内容的哈希（只读取字节，不解码）"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(img_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_file_key(model_path):
+    """模型文件的标识：规范化的绝对路径加修改时间与大小（同 shp_kuang_cut.source_key），文件被替换后随之变化"""
+    stat = os.stat(model_path)
+    return os.path.realpath(model_path), stat.st_mtime_ns, stat.st_size
+
+
+def model_cache_key(model_path, **config):
+    """
+    模型文件标识与推理配置组成的模型键。config 中的 img_size 应为模型实际的输入分辨率
+    （.onnx 模型取自导出的图，而不是命令行请求的尺寸），同一模型在同一配置下只有一个键。
+    """
+    identity = json.dumps([model_file_key(model_path), config], sort_keys=True, default=str)
+    return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    按 (块哈希, 模型键) 存取softmax概率。
+
+    with ResultCache("data/vit_cache.sqlite", model_key) as cache:
+        hits = cache.get_many(hashes)       # {块哈希: 概率数组}
+        cache.put_many({块哈希: 概率数组})
+    """
+
+    def __init__(self, path, model_key, max_entries=DEFAULT_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " chip TEXT NOT NULL, model TEXT NOT NULL, probs BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (chip, model))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.commit()
+
+    def get_many(self, hashes, chunk_size=500):
+        """批量查询，返回命中的 {块哈希: 概率数组}，并刷新命中条目的使用时间"""
+        found = {}
+        hashes = list(hashes)
+        for i in range(0, len(hashes), chunk_size):
+            chunk = hashes[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT chip, probs FROM results WHERE model = ? AND chip IN ({placeholders})",
+                [self.model_key] + chunk)
+            for chip, probs in rows:
+                found[chip] = np.frombuffer(probs, dtype=np.float32)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE results SET last_used = ? WHERE chip = ? AND model = ?",
+                                  [(now, chip, self.model_key) for chip in found])
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, results):
+        """写入 {块哈希: 概率数组}"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (chip, model, probs, last_used) VALUES (?, ?, ?, ?)",
+            [(chip, self.model_key, np.asarray(probs, dtype=np.float32).tobytes(), now)
+             for chip, probs in results.items()])
+        self.conn.commit()
+
+    def evict(self):
+        """条目数超过上限时删除最久未使用的条目，返回删除数"""
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        self.conn.execute(
+            "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)", (excess,))
+        self.conn.commit()
+        return excess
+
+    def lookup_files(self, img_paths):
+        """
+        对图像文件查询缓存，返回 (块哈希字典 {路径: 哈希}, 命中 {路径: 概率数组}, 未命中的路径列表)
+        """
+        hashes = {img_path: chip_hash(img_path) for img_path in img_paths}
+        found = self.get_many(set(hashes.values()))
+        cached = {img_path: found[h] for img_path, h in hashes.items() if h in found}
+        misses = [img_path for img_path in img_paths if img_path not in cached]
+        return hashes, cached, misses
+
+    def close(self):
+        evicted = self.evict()
+        self.conn.close()
+        total = self.hits + self.misses
+        if total:
+            print(f"结果缓存: 命中 {self.hits}/{total} ({self.hits / total:.1%})"
+                  + (f"，淘汰 {evicted} 条" if evicted else ""))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,193 @@
+import os
+import hashlib
+"""
+VIT推理模型的优化版本（INT8量化、ONNX、TorchScript冻结图等）的构建与磁盘缓存。
+缓存文件与原始权重放在同一目录，文件名带权重哈希，内容记录torch版本，权重或torch版本变化时自动重建。
+torch 在函数内部导入，只查找已有缓存文件时不需要加载torch。
+"""
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件的sha256"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def artifact_path(model_weight_path, tag, ext='.pth'):
+    """权重旁边的缓存文件路径，例如 config/vit_gq.int8-1a2b3c4d5e6f.pth"""
+    base = os.path.splitext(model_weight_path)[0]
+    return f"{base}.{tag}-{file_sha256(model_weight_path)[:12]}{ext}"
+
+
+def quantize_int8(model):
+    """对 Attention/Mlp/head 中的 nn.Linear 做动态INT8量化（仅支持CPU）"""
+    import torch
+    import torch.nn as nn
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def load_int8_model(model_builder, model_weight_path):
+    """
+    加载动态INT8量化的VIT模型。
+
+    model_builder 返回未加载权重的fp32模型。首次调用时由fp32权重量化并保存到缓存文件，
+    之后直接加载量化后的权重。
+    """
+    import torch
+    cache_path = artifact_path(model_weight_path, 'int8')
+    if os.path.exists(cache_path):
+        cached = torch.load(cache_path, map_location='cpu')
+        if cached.get('torch_version') == str(torch.__version__):
+            model = quantize_int8(model_builder().eval())
+            model.load_state_dict(cached['state_dict'])
+            return model.eval()
+        print(f"INT8缓存的torch版本({cached.get('torch_version')})与当前版本不一致，重新量化")
+
+    fp32_model = model_builder()
+    fp32_model.load_state_dict(torch.load(model_weight_path, map_location='cpu'))
+    model = quantize_int8(fp32_model.eval())
+    torch.save({'torch_version': str(torch.__version__), 'state_dict': model.state_dict()}, cache_path)
+    print(f"INT8量化权重已缓存: {cache_path}")
+    return model.eval()
+
+
+ONNX_OPSET = 17
+# 导出后与torch输出对比的容差（softmax前的logits）
+ONNX_PARITY_ATOL = 1e-3
+
+
+def export_onnx(model_builder, model_weight_path, onnx_path, img_size=224, opset_version=ONNX_OPSET):
+    """将VIT导出为ONNX，批大小为动态维度。安装了onnxruntime时导出后对比两者的输出，差异超过容差则删除导出文件并报错"""
+    import torch
+
+    model = model_builder()
+    model.load_state_dict(torch.load(model_weight_path, map_location='cpu'))
+    model.set_input_size(img_size)
+    model.eval()
+    dummy = torch.randn(1, 3, img_size, img_size)
+    torch.onnx.export(model, dummy, onnx_path, input_names=['input'], output_names=['logits'],
+                      dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                      opset_version=opset_version)
+    print(f"ONNX模型已导出: {onnx_path}")
+    check_onnx_parity(model, onnx_path, img_size)
+    return onnx_path
+
+
+def check_onnx_parity(model, onnx_path, img_size=224, batch=2, atol=ONNX_PARITY_ATOL):
+    """用随机输入对比torch模型与导出的ONNX的logits，返回最大绝对误差；没有onnxruntime时跳过并返回None"""
+    import torch
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+
+    inputs = torch.randn(batch, 3, img_size, img_size)
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+    session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+    actual = session.run(None, {session.get_inputs()[0].name: inputs.numpy()})[0]
+    diff = float(abs(expected - actual).max())
+    if diff > atol:
+        os.remove(onnx_path)
+        raise RuntimeError(f"导出的ONNX与torch输出不一致(最大误差 {diff:.2e} > {atol:g})，已删除 {onnx_path}")
+    print(f"ONNX与torch输出一致(最大误差 {diff:.2e})")
+    return diff
+
+
+def onnx_tag(img_size=224, opset_version=ONNX_OPSET, torch_tag=None):
+    """ONNX缓存文件名中的标签，包含输入尺寸、opset与导出所用的torch版本"""
+    return ('onnx' if img_size == 224 else f'onnx{img_size}') + f'-opset{opset_version}-torch{torch_tag}'
+
+
+def get_onnx_model(model_weight_path, img_size=224, opset_version=ONNX_OPSET):
+    """
+    返回权重对应的ONNX文件路径，不存在时先导出。缓存按权重哈希、输入尺寸、opset与torch版本区分，
+    torch升级后重新导出。只有导出时需要导入torch；没有安装torch时使用已有的任一版本torch导出的文件。
+    """
+    torch_tag = installed_torch_tag()
+    if torch_tag is None:
+        import glob
+        pattern = artifact_path(model_weight_path, onnx_tag(img_size, opset_version, '*'), '.onnx')
+        existing = sorted(glob.glob(pattern), key=os.path.getmtime)
+        if not existing:
+            raise ImportError(f"没有找到 {model_weight_path} 导出的ONNX文件，导出需要安装torch")
+        return existing[-1]
+
+    onnx_path = artifact_path(model_weight_path, onnx_tag(img_size, opset_version, torch_tag), '.onnx')
+    if not os.path.exists(onnx_path):
+        from utils.vit_model import vit_base_patch16_224_in21k as create_model
+        export_onnx(lambda: create_model(num_classes=2, has_logits=False), model_weight_path, onnx_path,
+                    img_size=img_size, opset_version=opset_version)
+    return onnx_path
+
+
+def torch_version_tag():
+    """可用于文件名的torch版本号，例如 2.4.1+cpu -> 2.4.1_cpu"""
+    import torch
+    return str(torch.__version__).replace('+', '_')
+
+
+def installed_torch_tag():
+    """同 torch_version_tag，但优先从安装信息读取而不导入torch（打包后没有安装信息时再导入）；没有torch时返回None"""
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version('torch').replace('+', '_')
+    except PackageNotFoundError:
+        pass
+    try:
+        return torch_version_tag()
+    except ImportError:
+        return None
+
+
+def load_frozen_model(load_eager, model_weight_path, device, tag='frozen', img_size=224):
+    """
+    加载TorchScript冻结图（trace + torch.jit.freeze）。
+
+    load_eager 返回已加载权重的eager模型。冻结图按权重哈希、torch版本和 tag 缓存在权重旁边，
+    之后直接 torch.jit.load，不再构建eager模型。缓存加载失败或trace失败时退回eager模式。
+    """
+    import torch
+
+    cache_path = artifact_path(model_weight_path, f"{tag}-{device.type}-torch{torch_version_tag()}", '.pt')
+    if os.path.exists(cache_path):
+        try:
+            return torch.jit.load(cache_path, map_location=device)
+        except Exception as e:
+            print(f"冻结图缓存加载失败({e})，重新生成")
+
+    model = load_eager()
+    try:
+        dummy = torch.randn(1, 3, img_size, img_size, device=device)
+        with torch.no_grad():
+            frozen = torch.jit.freeze(torch.jit.trace(model, dummy))
+        torch.jit.save(frozen, cache_path)
+    except Exception as e:
+        print(f"TorchScript冻结失败({e})，使用eager模式")
+        return model
+    print(f"TorchScript冻结图已缓存: {cache_path}")
+    return frozen
+
+
+def compile_model(model, model_weight_path, device, img_size=224):
+    """
+    使用 torch.compile 编译模型。inductor 的编译缓存放在权重旁边（按权重哈希区分），
+    后续进程命中缓存可跳过大部分编译时间。编译失败（如缺少C++编译器）时退回eager模式。
+    """
+    import torch
+
+    cache_dir = artifact_path(model_weight_path, 'inductor', '')
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.abspath(cache_dir))
+    os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    try:
+        compiled = torch.compile(model, dynamic=True)
+        with torch.no_grad():
+            # torch.compile 是惰性的，预热一次以便在这里捕获编译错误
+            compiled(torch.randn(2, 3, img_size, img_size, device=device))
+    except Exception as e:
+        print(f"torch.compile 失败({e})，使用eager模式")
+        return model
+    return compiled
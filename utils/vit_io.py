@@ -0,0 +1,200 @@
+import os
+import csv
+import json
+import shutil
+import numpy as np
+"""
+VIT推理中与推理后端无关的输入输出工具，不依赖torch，供 torch、onnxruntime 与推理服务三种后端共用。
+"""
+
+# 逐块判定表（所有块）与按判定结果筛选出的块图层
+VERDICT_NAME = 'vit_verdicts.csv'
+KEEP_LAYER_NAME = 'vit_keep.shp'
+
+
+def load_class_indict(json_path):
+    assert os.path.exists(json_path), f"file: '{json_path}' does not exist."
+    with open(json_path, "r") as f:
+        return json.load(f)
+
+
+def list_tif_images(img_dir):
+    """列出文件夹中的tif图像"""
+    assert os.path.exists(img_dir), f"directory: '{img_dir}' does not exist."
+    return [os.path.join(img_dir, img_name) for img_name in os.listdir(img_dir) if img_name.endswith('.tif')]
+
+
+def move_yolo_txt(img_path, source_txt_dir, target_txt_dir):
+    """Move YOLO format annotation txt files to the target directory."""
+    # Get the base name of the image (without extension)
+    img_name = os.path.basename(img_path)
+    txt_name = os.path.splitext(img_name)[0] + ".txt"
+
+    source_txt_path = os.path.join(source_txt_dir, txt_name)
+    target_txt_path = os.path.join(target_txt_dir, txt_name)
+
+    # If the txt file exists, move it to the new directory
+    if os.path.exists(source_txt_path):
+        shutil.move(source_txt_path, target_txt_path)
+        print(f"Moved: {txt_name}")
+    else:
+        print(f"Warning: No corresponding txt file for {img_name}.")
+
+
+class VerdictTable:
+    """
+    按列收集VIT逐块判定结果（chip_id、类别、概率），推理结束后一次性写出，
+    代替逐块打印和移动txt文件。
+    """
+    def __init__(self):
+        self.chip_ids = []
+        self.classes = []
+        self.probs = []
+
+    def add(self, img_path, predict):
+        """记录一个块的softmax概率，返回 (类别, 概率)"""
+        predict_cla = int(np.argmax(predict))
+        prob = float(predict[predict_cla])
+        self.chip_ids.append(os.path.splitext(os.path.basename(img_path))[0])
+        self.classes.append(predict_cla)
+        self.probs.append(prob)
+        return predict_cla, prob
+
+    def __len__(self):
+        return len(self.chip_ids)
+
+    def write_csv(self, path, class_indict):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['chip_id', 'cls', 'class_name', 'prob'])
+            for chip_id, cla, prob in zip(self.chip_ids, self.classes, self.probs):
+                writer.writerow([chip_id, cla, class_indict[str(cla)], f'{prob:.6f}'])
+
+    def join_chip_layer(self, chips_shp, output_shp, keep_class):
+        """
+        将判定结果按 chip_id 与平铺裁剪生成的块图层（crop_chips.shp）连接，
+        只保留类别为 keep_class 的块并带上 cls/prob 字段写入 output_shp，返回写出的要素数。
+        """
+        import fiona
+
+        verdicts = {chip_id: (cla, prob) for chip_id, cla, prob in zip(self.chip_ids, self.classes, self.probs)
+                    if cla == keep_class}
+        written = 0
+        with fiona.open(chips_shp, 'r') as src:
+            schema = {'geometry': src.schema['geometry'], 'properties': dict(src.schema['properties'])}
+            schema['properties'].update({'cls': 'int', 'prob': 'float'})
+            with fiona.open(output_shp, 'w', driver='ESRI Shapefile', crs=src.crs, schema=schema) as dst:
+                for feature in src:
+                    verdict = verdicts.get(feature['properties']['chip_id'])
+                    if verdict is None:
+                        continue
+                    properties = dict(feature['properties'])
+                    properties['cls'], properties['prob'] = verdict
+                    dst.write({'geometry': feature['geometry'], 'properties': properties})
+                    written += 1
+        return written
+
+    def write(self, output_dir, class_indict, img_dir, keep_class=0):
+        """
+        写出判定表 vit_verdicts.csv；图像文件夹中有平铺裁剪的块图层时，
+        同时写出判定为 keep_class 的块图层 vit_keep.shp，可直接作为下一次SHP框裁剪的输入。
+        """
+        from utils.shp_kuang_cut import FLAT_LAYER_NAME
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.write_csv(os.path.join(output_dir, VERDICT_NAME), class_indict)
+        counts = np.bincount(np.asarray(self.classes, dtype=np.int64), minlength=len(class_indict))
+        summary = ', '.join(f"{class_indict[str(cla)]} {count}" for cla, count in enumerate(counts))
+        print(f"VIT判定: 共 {len(self)} 块 ({summary})")
+
+        chips_shp = os.path.join(img_dir, FLAT_LAYER_NAME)
+        if os.path.exists(chips_shp):
+            written = self.join_chip_layer(chips_shp, os.path.join(output_dir, KEEP_LAYER_NAME), keep_class)
+            print(f"判定为 {class_indict[str(keep_class)]} 的 {written} 块已写入 {KEEP_LAYER_NAME}")
+
+
+class ChipPredictions:
+    """
+    torch、onnxruntime 与推理服务三种VIT后端共用的逐块结果处理，保证三者的输出、缓存与分桶一致：
+    记录判定表（可选逐块打印、旧流程的txt移动）、查询与写入结果缓存、按尺寸分桶。
+
+    results = ChipPredictions(img_dir, yolo_txt_dir, output_dir, json_path, keep_class, verbose)
+    results.open_cache(cache_path, model_weight_path, backend='torch', ...)  # 命中的块直接记录
+    for size, paths in results.group(img_size, buckets).items(): ...           # 只包含未命中的块
+        results.add_batch(paths, predicts)
+    results.close()
+    """
+    def __init__(self, img_dir, yolo_txt_dir, output_dir, json_path, keep_class=0, verbose=False):
+        self.img_dir = img_dir
+        self.yolo_txt_dir = yolo_txt_dir
+        self.output_dir = output_dir
+        self.keep_class = keep_class
+        self.verbose = verbose
+        self.img_paths = list_tif_images(img_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        self.class_indict = load_class_indict(json_path)
+        self.verdicts = VerdictTable()
+        self.cache = None
+        self.chip_hashes = {}
+
+    def add(self, img_path, predict):
+        predict_cla, prob = self.verdicts.add(img_path, predict)
+        if self.verbose:
+            print(f"Image: {img_path} - class: {self.class_indict[str(predict_cla)]}   prob: {prob:.3f}")
+
+        # 兼容旧流程：如果是健康树（即类别为 1），则移动相应的 YOLO txt 文件
+        if self.yolo_txt_dir and predict_cla == 1:
+            move_yolo_txt(img_path, self.yolo_txt_dir, self.output_dir)
+
+    def add_batch(self, paths, predicts):
+        """记录一批推理结果并写入结果缓存"""
+        for img_path, predict in zip(paths, predicts):
+            self.add(img_path, predict)
+        if self.cache is not None:
+            self.cache.put_many({self.chip_hashes[img_path]: predict for img_path, predict in zip(paths, predicts)})
+
+    def open_cache(self, cache_path, model_weight_path, max_entries=None, **config):
+        """
+        打开SQLite结果缓存（见 utils/vit_cache.py），config 为影响输出的推理配置，与模型文件标识一起组成模型键。
+        命中的块直接记录，img_paths 只保留需要推理的块。cache_path 为空时不使用缓存。
+        """
+        if not cache_path:
+            return
+        from utils.vit_cache import DEFAULT_MAX_ENTRIES, ResultCache, model_cache_key
+
+        self.cache = ResultCache(cache_path, model_cache_key(model_weight_path, **config),
+                                 max_entries or DEFAULT_MAX_ENTRIES)
+        self.chip_hashes, cached, self.img_paths = self.cache.lookup_files(self.img_paths)
+        for img_path, predict in cached.items():
+            self.add(img_path, predict)
+
+    def group(self, img_size=224, buckets=None):
+        """需要推理的块按输入分辨率分组 {分辨率: [路径, ...]}；buckets 为分桶规则时每个桶一个分辨率"""
+        if not buckets:
+            return {img_size: self.img_paths}
+        from utils.bucketing import assign_buckets, parse_buckets, check_bucket_sizes, print_bucket_summary
+        buckets = parse_buckets(buckets) if isinstance(buckets, str) else buckets
+        check_bucket_sizes(buckets, 16)
+        groups = assign_buckets(self.img_paths, buckets)
+        print_bucket_summary(groups)
+        return groups
+
+    def close(self):
+        """关闭结果缓存，出错时也需调用"""
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def write(self):
+        """写出判定表与保留块图层（见 VerdictTable.write）"""
+        self.verdicts.write(self.output_dir, self.class_indict, self.img_dir, self.keep_class)
+
+
+def print_throughput_report(num_images, load_time, model_time):
+    """打印数据加载与模型推理各自的吞吐，用于判断瓶颈"""
+    load_rate = num_images / load_time if load_time > 0 else float('inf')
+    model_rate = num_images / model_time if model_time > 0 else float('inf')
+    print(f"吞吐统计: 共 {num_images} 张")
+    print(f"  数据加载: 等待 {load_time:.2f} s, {load_rate:.1f} 张/秒")
+    print(f"  模型推理: 耗时 {model_time:.2f} s, {model_rate:.1f} 张/秒")
+    print(f"  瓶颈: {'数据加载' if load_time > model_time else '模型推理'}")
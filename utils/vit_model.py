@@ -2,11 +2,13 @@
 original code from rwightman:
 https://github.com/rwightman/pytorch-image-models/blob/master/timm/models/vision_transformer.py
 """
+import math
 from functools import partial
 from collections import OrderedDict
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 
 def drop_path(x, drop_prob: float = 0., training: bool = False):
@@ -56,6 +58,12 @@ class PatchEmbed(nn.Module):
         self.proj = nn.Conv2d(in_c, embed_dim, kernel_size=patch_size, stride=patch_size)
         self.norm = norm_layer(embed_dim) if norm_layer else nn.Identity()
 
+    def set_img_size(self, img_size):
+        """修改输入尺寸（卷积权重与尺寸无关，只需更新patch网格）"""
+        self.img_size = (img_size, img_size)
+        self.grid_size = (img_size // self.patch_size[0], img_size // self.patch_size[1])
+        self.num_patches = self.grid_size[0] * self.grid_size[1]
+
     def forward(self, x):
         B, C, H, W = x.shape
         assert H == self.img_size[0] and W == self.img_size[1], \
@@ -68,6 +76,68 @@ class PatchEmbed(nn.Module):
         return x
 
 
+def resize_pos_embed(pos_embed, new_grid, num_tokens=1):
+    """
+    将 [1, num_tokens + H*W, C] 的位置编码双三次插值到新的patch网格 new_grid=(h, w)，
+    cls/dist token 的位置编码保持不变。
+    """
+    prefix, grid = pos_embed[:, :num_tokens], pos_embed[:, num_tokens:]
+    old_size = int(math.sqrt(grid.shape[1]))
+    grid = grid.reshape(1, old_size, old_size, -1).permute(0, 3, 1, 2)
+    grid = F.interpolate(grid, size=new_grid, mode='bicubic', align_corners=False)
+    grid = grid.permute(0, 2, 3, 1).reshape(1, new_grid[0] * new_grid[1], -1)
+    return torch.cat([prefix, grid], dim=1)
+
+
+def bipartite_soft_matching(metric, r, class_token=True):
+    """
+    Token Merging (ToMe, Bolya et al. 2023) 的二分软匹配。
+    token 交替分为 A/B 两组，A 中与 B 最相似（key 余弦相似度）的 r 个 token 合并到对应的 B token 上。
+    class_token=True 时第 0 个 token（cls）不参与合并，并保持在第 0 位。
+    返回 merge(x, mode) 函数，对 [B, N, C] 的张量执行相同的合并。
+    """
+    protected = 1 if class_token else 0
+    t = metric.shape[1]
+    r = min(r, (t - protected) // 2)
+    if r <= 0:
+        return None
+
+    with torch.no_grad():
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = metric[..., ::2, :], metric[..., 1::2, :]
+        scores = a @ b.transpose(-1, -2)
+        if class_token:
+            scores[..., 0, :] = -math.inf
+
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+        unm_idx = edge_idx[..., r:, :]  # 不合并的A组token
+        src_idx = edge_idx[..., :r, :]  # 合并到B组的A组token
+        dst_idx = node_idx[..., None].gather(dim=-2, index=src_idx)
+        if class_token:
+            # 保持原有顺序，cls token 留在第 0 位
+            unm_idx = unm_idx.sort(dim=1)[0]
+
+    def merge(x, mode="mean"):
+        src, dst = x[..., ::2, :], x[..., 1::2, :]
+        n, t1, c = src.shape
+        unm = src.gather(dim=-2, index=unm_idx.expand(n, t1 - r, c))
+        src = src.gather(dim=-2, index=src_idx.expand(n, r, c))
+        dst = dst.scatter_reduce(-2, dst_idx.expand(n, r, c), src, reduce=mode)
+        return torch.cat([unm, dst], dim=1)
+
+    return merge
+
+
+def merge_wavg(merge, x, size=None):
+    """按每个token代表的原始patch数(size)加权平均地合并token，返回合并后的 x 与 size"""
+    if size is None:
+        size = torch.ones_like(x[..., 0, None])
+    x = merge(x * size, mode="sum")
+    size = merge(size, mode="sum")
+    return x / size, size
+
+
 class Attention(nn.Module):
     def __init__(self,
                  dim,   # 输入token的dim
@@ -75,9 +145,11 @@ class Attention(nn.Module):
                  qkv_bias=False,
                  qk_scale=None,
                  attn_drop_ratio=0.,
-                 proj_drop_ratio=0.):
+                 proj_drop_ratio=0.,
+                 fused_attn=False):
         super(Attention, self).__init__()
         self.num_heads = num_heads
+        self.fused_attn = fused_attn
         head_dim = dim // num_heads
         self.scale = qk_scale or head_dim ** -0.5
         self.qkv = nn.Linear(dim, dim * 3, bias=qkv_bias)
@@ -85,7 +157,11 @@ class Attention(nn.Module):
         self.proj = nn.Linear(dim, dim)
         self.proj_drop = nn.Dropout(proj_drop_ratio)
 
-    def forward(self, x):
+    def forward(self, x, size=None, return_metric=False):
+        """
+        size: token合并时每个token代表的patch数 [B, N, 1]，用于按比例注意力(proportional attention)
+        return_metric: 同时返回各头平均的key，作为token合并的相似度度量
+        """
         # [batch_size, num_patches + 1, total_embed_dim]
         B, N, C = x.shape
 
@@ -95,19 +171,34 @@ class Attention(nn.Module):
         qkv = self.qkv(x).reshape(B, N, 3, self.num_heads, C // self.num_heads).permute(2, 0, 3, 1, 4)
         # [batch_size, num_heads, num_patches + 1, embed_dim_per_head]
         q, k, v = qkv[0], qkv[1], qkv[2]  # make torchscript happy (cannot use tensor as tuple)
+        # 合并后的token代表多个patch，注意力中按 log(size) 加权
+        size_bias = size.log()[:, None, None, :, 0] if size is not None else None
+
+        if self.fused_attn:
+            # 融合实现，不显式生成 [num_patches + 1, num_patches + 1] 的注意力矩阵
+            # -> [batch_size, num_heads, num_patches + 1, embed_dim_per_head]
+            x = F.scaled_dot_product_attention(q, k, v, attn_mask=size_bias,
+                                               dropout_p=self.attn_drop.p if self.training else 0.,
+                                               scale=self.scale)
+        else:
+            # transpose: -> [batch_size, num_heads, embed_dim_per_head, num_patches + 1]
+            # @: multiply -> [batch_size, num_heads, num_patches + 1, num_patches + 1]
+            attn = (q @ k.transpose(-2, -1)) * self.scale
+            if size_bias is not None:
+                attn = attn + size_bias
+            attn = attn.softmax(dim=-1)
+            attn = self.attn_drop(attn)
 
-        # transpose: -> [batch_size, num_heads, embed_dim_per_head, num_patches + 1]
-        # @: multiply -> [batch_size, num_heads, num_patches + 1, num_patches + 1]
-        attn = (q @ k.transpose(-2, -1)) * self.scale
-        attn = attn.softmax(dim=-1)
-        attn = self.attn_drop(attn)
+            # @: multiply -> [batch_size, num_heads, num_patches + 1, embed_dim_per_head]
+            x = attn @ v
 
-        # @: multiply -> [batch_size, num_heads, num_patches + 1, embed_dim_per_head]
         # transpose: -> [batch_size, num_patches + 1, num_heads, embed_dim_per_head]
         # reshape: -> [batch_size, num_patches + 1, total_embed_dim]
-        x = (attn @ v).transpose(1, 2).reshape(B, N, C)
+        x = x.transpose(1, 2).reshape(B, N, C)
         x = self.proj(x)
         x = self.proj_drop(x)
+        if return_metric:
+            return x, k.mean(1)
         return x
 
 
@@ -144,11 +235,12 @@ class Block(nn.Module):
                  attn_drop_ratio=0.,
                  drop_path_ratio=0.,
                  act_layer=nn.GELU,
-                 norm_layer=nn.LayerNorm):
+                 norm_layer=nn.LayerNorm,
+                 fused_attn=False):
         super(Block, self).__init__()
         self.norm1 = norm_layer(dim)
         self.attn = Attention(dim, num_heads=num_heads, qkv_bias=qkv_bias, qk_scale=qk_scale,
-                              attn_drop_ratio=attn_drop_ratio, proj_drop_ratio=drop_ratio)
+                              attn_drop_ratio=attn_drop_ratio, proj_drop_ratio=drop_ratio, fused_attn=fused_attn)
         # NOTE: drop path for stochastic depth, we shall see if this is better than dropout here
         self.drop_path = DropPath(drop_path_ratio) if drop_path_ratio > 0. else nn.Identity()
         self.norm2 = norm_layer(dim)
@@ -160,13 +252,23 @@ class Block(nn.Module):
         x = x + self.drop_path(self.mlp(self.norm2(x)))
         return x
 
+    def forward_merge(self, x, size, r):
+        """注意力之后合并 r 个token（ToMe），返回合并后的 x 与 size"""
+        x_attn, metric = self.attn(self.norm1(x), size, return_metric=True)
+        x = x + self.drop_path(x_attn)
+        merge = bipartite_soft_matching(metric, r, class_token=True)
+        if merge is not None:
+            x, size = merge_wavg(merge, x, size)
+        x = x + self.drop_path(self.mlp(self.norm2(x)))
+        return x, size
+
 
 class VisionTransformer(nn.Module):
     def __init__(self, img_size=224, patch_size=16, in_c=3, num_classes=1000,
                  embed_dim=768, depth=12, num_heads=12, mlp_ratio=4.0, qkv_bias=True,
                  qk_scale=None, representation_size=None, distilled=False, drop_ratio=0.,
                  attn_drop_ratio=0., drop_path_ratio=0., embed_layer=PatchEmbed, norm_layer=None,
-                 act_layer=None):
+                 act_layer=None, fused_attn=False, merge_ratio=0.):
         """
         Args:
             img_size (int, tuple): input image size
@@ -186,11 +288,15 @@ class VisionTransformer(nn.Module):
             drop_path_ratio (float): stochastic depth rate
             embed_layer (nn.Module): patch embedding layer
             norm_layer: (nn.Module): normalization layer
+            fused_attn (bool): use torch.nn.functional.scaled_dot_product_attention in Attention
+            merge_ratio (float, list): token merging (ToMe) ratio per block, the fraction of current patch
+                tokens merged after each block's attention; a list gives one ratio per block, 0 disables
         """
         super(VisionTransformer, self).__init__()
         self.num_classes = num_classes
         self.num_features = self.embed_dim = embed_dim  # num_features for consistency with other models
         self.num_tokens = 2 if distilled else 1
+        self.merge_ratio = merge_ratio
         norm_layer = norm_layer or partial(nn.LayerNorm, eps=1e-6)
         act_layer = act_layer or nn.GELU
 
@@ -206,7 +312,7 @@ class VisionTransformer(nn.Module):
         self.blocks = nn.Sequential(*[
             Block(dim=embed_dim, num_heads=num_heads, mlp_ratio=mlp_ratio, qkv_bias=qkv_bias, qk_scale=qk_scale,
                   drop_ratio=drop_ratio, attn_drop_ratio=attn_drop_ratio, drop_path_ratio=dpr[i],
-                  norm_layer=norm_layer, act_layer=act_layer)
+                  norm_layer=norm_layer, act_layer=act_layer, fused_attn=fused_attn)
             for i in range(depth)
         ])
         self.norm = norm_layer(embed_dim)
@@ -248,13 +354,55 @@ class VisionTransformer(nn.Module):
             x = torch.cat((cls_token, self.dist_token.expand(x.shape[0], -1, -1), x), dim=1)
 
         x = self.pos_drop(x + self.pos_embed)
-        x = self.blocks(x)
+        if self.merge_ratio and self.dist_token is None:
+            x = self.forward_blocks_merged(x)
+        else:
+            x = self.blocks(x)
         x = self.norm(x)
         if self.dist_token is None:
             return self.pre_logits(x[:, 0])
         else:
             return x[:, 0], x[:, 1]
 
+    def set_input_size(self, img_size):
+        """
+        在加载权重后切换输入分辨率（如112、160），位置编码由训练分辨率插值得到。
+        img_size 必须是patch大小的整数倍。
+        可以多次切换（如按尺寸分桶推理），每次都从训练分辨率的位置编码插值，误差不累积。
+        """
+        patch_size = self.patch_embed.patch_size[0]
+        if img_size % patch_size != 0:
+            raise ValueError(f"输入尺寸 {img_size} 不是patch大小 {patch_size} 的整数倍")
+        if (img_size, img_size) == self.patch_embed.img_size:
+            return
+        if getattr(self, '_base_pos_embed', None) is None:
+            self._base_pos_embed = (self.pos_embed.detach().clone(), self.patch_embed.img_size[0])
+        base_pos_embed, base_size = self._base_pos_embed
+        self.patch_embed.set_img_size(img_size)
+        if img_size == base_size:
+            pos_embed = base_pos_embed.clone()
+        else:
+            with torch.no_grad():
+                pos_embed = resize_pos_embed(base_pos_embed, self.patch_embed.grid_size, self.num_tokens)
+        self.pos_embed = nn.Parameter(pos_embed.to(self.pos_embed.device),
+                                      requires_grad=self.pos_embed.requires_grad)
+
+    def merge_schedule(self):
+        """每个block的合并比例"""
+        if isinstance(self.merge_ratio, (list, tuple)):
+            if len(self.merge_ratio) != len(self.blocks):
+                raise ValueError(f"merge_ratio 长度({len(self.merge_ratio)})与block数({len(self.blocks)})不一致")
+            return list(self.merge_ratio)
+        return [self.merge_ratio] * len(self.blocks)
+
+    def forward_blocks_merged(self, x):
+        """逐block执行并按 merge_ratio 合并patch token（ToMe），token数逐层减少"""
+        size = None
+        for blk, ratio in zip(self.blocks, self.merge_schedule()):
+            r = int((x.shape[1] - self.num_tokens) * ratio)
+            x, size = blk.forward_merge(x, size, r)
+        return x
+
     def forward(self, x):
         x = self.forward_features(x)
         if self.head_dist is not None:
@@ -287,7 +435,7 @@ def _init_vit_weights(m):
         nn.init.ones_(m.weight)
 
 
-def vit_base_patch16_224(num_classes: int = 1000):
+def vit_base_patch16_224(num_classes: int = 1000, **kwargs):
     """
     ViT-Base model (ViT-B/16) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-1k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -300,11 +448,12 @@ def vit_base_patch16_224(num_classes: int = 1000):
                               depth=12,
                               num_heads=12,
                               representation_size=None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_base_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = True):
+def vit_base_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = True, **kwargs):
     """
     ViT-Base model (ViT-B/16) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-21k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -317,11 +466,12 @@ def vit_base_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = True
                               depth=12,
                               num_heads=12,
                               representation_size=768 if has_logits else None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_base_patch32_224(num_classes: int = 1000):
+def vit_base_patch32_224(num_classes: int = 1000, **kwargs):
     """
     ViT-Base model (ViT-B/32) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-1k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -334,11 +484,12 @@ def vit_base_patch32_224(num_classes: int = 1000):
                               depth=12,
                               num_heads=12,
                               representation_size=None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_base_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = True):
+def vit_base_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = True, **kwargs):
     """
     ViT-Base model (ViT-B/32) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-21k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -351,11 +502,12 @@ def vit_base_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = True
                               depth=12,
                               num_heads=12,
                               representation_size=768 if has_logits else None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_large_patch16_224(num_classes: int = 1000):
+def vit_large_patch16_224(num_classes: int = 1000, **kwargs):
     """
     ViT-Large model (ViT-L/16) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-1k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -368,11 +520,12 @@ def vit_large_patch16_224(num_classes: int = 1000):
                               depth=24,
                               num_heads=16,
                               representation_size=None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_large_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = True):
+def vit_large_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = True, **kwargs):
     """
     ViT-Large model (ViT-L/16) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-21k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -385,11 +538,12 @@ def vit_large_patch16_224_in21k(num_classes: int = 21843, has_logits: bool = Tru
                               depth=24,
                               num_heads=16,
                               representation_size=1024 if has_logits else None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_large_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = True):
+def vit_large_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = True, **kwargs):
     """
     ViT-Large model (ViT-L/32) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-21k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -402,11 +556,12 @@ def vit_large_patch32_224_in21k(num_classes: int = 21843, has_logits: bool = Tru
                               depth=24,
                               num_heads=16,
                               representation_size=1024 if has_logits else None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
 
 
-def vit_huge_patch14_224_in21k(num_classes: int = 21843, has_logits: bool = True):
+def vit_huge_patch14_224_in21k(num_classes: int = 21843, has_logits: bool = True, **kwargs):
     """
     ViT-Huge model (ViT-H/14) from original paper (https://arxiv.org/abs/2010.11929).
     ImageNet-21k weights @ 224x224, source https://github.com/google-research/vision_transformer.
@@ -418,5 +573,6 @@ def vit_huge_patch14_224_in21k(num_classes: int = 21843, has_logits: bool = True
                               depth=32,
                               num_heads=16,
                               representation_size=1280 if has_logits else None,
-                              num_classes=num_classes)
+                              num_classes=num_classes,
+                              **kwargs)
     return model
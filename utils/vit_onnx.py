@@ -0,0 +1,151 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+from utils.bucketing import iter_bucketed_batches
+from utils.vit_io import print_throughput_report, ChipPredictions
+from utils.vit_cache import DEFAULT_MAX_ENTRIES
+"""
+基于onnxruntime的VIT推理后端。不导入torch，预处理用PIL+numpy实现，
+与 predect.get_data_transform（Resize(256) -> CenterCrop(224) -> ToTensor -> Normalize(0.5, 0.5)）一致，
+两条路径的一致性由 cli/benchmark_cli.py vit-onnx-parity 检查。
+"""
+
+
+def preprocess(img, resize=256, crop=224):
+    """PIL图像 -> [3, crop, crop] 的float32数组"""
+    img = img.convert("RGB")
+    w, h = img.size
+    # torchvision.transforms.Resize(int)：短边缩放到 resize，长边按比例取整
+    if w <= h:
+        new_w, new_h = resize, int(resize * h / w)
+    else:
+        new_w, new_h = int(resize * w / h), resize
+    img = img.resize((new_w, new_h), Image.BILINEAR)
+
+    top = int(round((new_h - crop) / 2.0))
+    left = int(round((new_w - crop) / 2.0))
+    arr = np.asarray(img.crop((left, top, left + crop, top + crop)), dtype=np.float32)
+    arr = (arr / 255.0 - 0.5) / 0.5
+    return np.ascontiguousarray(arr.transpose(2, 0, 1))
+
+
+def load_and_preprocess(img_path, img_size=224):
+    return preprocess(Image.open(img_path), resize=img_size * 256 // 224, crop=img_size)
+
+
+def fill_vit_batch(paths, out):
+    """共享内存解码子进程的 fill 函数：预处理一批图像写入 out [N, 3, 尺寸, 尺寸]"""
+    for i, img_path in enumerate(paths):
+        out[i] = load_and_preprocess(img_path, out.shape[-1])
+
+
+def create_session(onnx_path, intra_op_threads=None, inter_op_threads=1):
+    """创建CPU上的onnxruntime会话，intra_op_threads 默认为CPU核数"""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise ImportError("--backend onnx 需要安装onnxruntime（pip install onnxruntime，版本见requirements.txt）") from None
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def run_session(session, batch):
+    """对 [B, 3, H, W] 的float32数组推理，返回softmax概率"""
+    logits = session.run(None, {session.get_inputs()[0].name: batch})[0]
+    return softmax(logits)
+
+
+def predict_and_move_onnx(img_dir, yolo_txt_dir, output_dir, json_path, model_weight_path, batch_size=64,
+                          intra_op_threads=None, num_workers=0, img_size=224, buckets=None, cache_path=None,
+                          cache_max_entries=DEFAULT_MAX_ENTRIES, keep_class=0, verbose=False, decode_processes=0):
+    """
+    predict_and_move 的onnxruntime版本。model_weight_path 为 .pth 时按 img_size 自动导出（并缓存）ONNX，
+    也可以直接传入 .onnx 文件，此时输入尺寸取自模型。num_workers > 0 时用线程池并行解码下一批图像；
+    decode_processes > 0 时改用子进程解码，批数据经共享内存环形缓冲区传回（见 utils/shm_ring.py）。
+    buckets 为分桶规则时按图像尺寸分桶，每个桶的分辨率各导出一个ONNX（仅 .pth 权重支持）。
+    cache_path 为SQLite结果缓存文件（见 utils/vit_cache.py），命中的块跳过解码与推理。
+    输出与 keep_class、verbose 同 predict_and_move。
+    """
+    results = ChipPredictions(img_dir, yolo_txt_dir, output_dir, json_path, keep_class, verbose)
+    sessions = {}
+
+    def session_for(size):
+        if size not in sessions:
+            if model_weight_path.endswith('.onnx'):
+                onnx_path = model_weight_path
+            else:
+                from utils.vit_export import get_onnx_model
+                onnx_path = get_onnx_model(model_weight_path, size)
+            sessions[size] = create_session(onnx_path, intra_op_threads)
+        return sessions[size]
+
+    if model_weight_path.endswith('.onnx'):
+        if buckets:
+            print("ONNX模型的输入尺寸固定，已忽略尺寸分桶")
+            buckets = None
+        # 输入尺寸以导出的图为准（缓存键与推理都使用它），不是 img_size
+        input_size = session_for(img_size).get_inputs()[0].shape[-1]
+        if isinstance(input_size, int) and input_size != img_size:
+            sessions[input_size] = sessions.pop(img_size)
+            img_size = input_size
+
+    # 结果缓存命中的块直接输出，不再解码和推理
+    results.open_cache(cache_path, model_weight_path, cache_max_entries, backend='onnx',
+                       img_size=None if buckets else img_size, buckets=buckets)
+    groups = results.group(img_size, buckets) if results.img_paths else {}
+    batches = list(iter_bucketed_batches(groups, batch_size))
+    executor = ThreadPoolExecutor(max_workers=num_workers) if num_workers > 0 else None
+
+    def decode(paths, size):
+        load = partial(load_and_preprocess, img_size=size)
+        if executor is not None:
+            return np.stack(list(executor.map(load, paths)))
+        return np.stack([load(path) for path in paths])
+
+    def iter_batches():
+        if decode_processes > 0:
+            from utils.shm_ring import iter_shared_batches
+            shared = [((len(paths), 3, size, size), np.float32, paths) for size, paths in batches]
+            for paths, batch, _ in iter_shared_batches(shared, fill_vit_batch, decode_processes):
+                yield batch.shape[-1], paths, batch
+        else:
+            for size, paths in batches:
+                yield size, paths, decode(paths, size)
+
+    num_images = 0
+    load_time = 0.0
+    model_time = 0.0
+    try:
+        start = time.perf_counter()
+        for size, paths, batch in tqdm(iter_batches(), total=len(batches), desc="Predicting"):
+            load_time += time.perf_counter() - start
+            session = session_for(size)
+            loaded = time.perf_counter()
+            predicts = run_session(session, batch)
+            model_time += time.perf_counter() - loaded
+            num_images += len(paths)
+
+            results.add_batch(paths, predicts)
+            start = time.perf_counter()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        results.close()
+
+    results.write()
+    print_throughput_report(num_images, load_time, model_time)
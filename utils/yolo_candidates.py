@@ -0,0 +1,165 @@
+import os
+import json
+import numpy as np
+"""
+YOLO的NMS前候选框存储，改变 conf/iou 阈值时不必重新推理。
+
+推理时以较低的置信度阈值（默认0.05）、不做NMS（IoU阈值为1）得到每张图像（或大图的每个窗口）的候选框，
+全部写入输出目录下的 yolo_candidates.npz：
+  names    图像路径（大图为窗口名 col_row）      sizes    图像 (宽, 高)
+  origins  窗口左上角在大图中的像素坐标           offsets  每张图像的候选框在下列数组中的起止位置
+  boxes    像素坐标 xyxy (float32，未裁剪到图像范围)  conf     置信度 (float32)        cls    类别 (uint16)
+  meta     JSON：存储阈值、模式（images/mosaic）、大图的仿射变换与坐标系等
+之后由 cli/yolo_rethreshold_cli.py 按任意 conf/iou 重新筛选与NMS，生成标签或地理图层。
+筛选规则与ultralytics一致：置信度大于 conf，同一图像内按类别NMS，每张图像最多 max_det 个，
+NMS之后再把检测框裁剪到图像范围内（ultralytics 同样先NMS后裁剪，见 yolo_predict.candidate_predictor）。
+"""
+
+CANDIDATE_STORE_NAME = 'yolo_candidates.npz'
+DEFAULT_STORE_CONF = 0.05
+DEFAULT_STORE_MAX_DET = 3000
+# IoU阈值为1时NMS不抑制任何框
+NO_NMS_IOU = 1.0
+
+
+class CandidateStore:
+    """
+    收集每张图像的候选框，save() 写为一个 npz。
+
+    store = CandidateStore("data/yolo_txt_folder/yolo_candidates.npz", mode='images')
+    store.add(img_path, (宽, 高), xyxy, conf, cls)
+    store.save()
+    """
+    def __init__(self, path, conf=DEFAULT_STORE_CONF, max_det=DEFAULT_STORE_MAX_DET, **meta):
+        self.path = path
+        self.conf = conf
+        self.max_det = max_det
+        self.meta = dict(meta, store_conf=conf, max_det=max_det)
+        self.names, self.sizes, self.origins, self.counts = [], [], [], []
+        self.boxes, self.scores, self.classes = [], [], []
+
+    def add(self, name, size, xyxy, conf, cls, origin=(0, 0)):
+        self.names.append(name)
+        self.sizes.append(size)
+        self.origins.append(origin)
+        self.counts.append(len(xyxy))
+        self.boxes.append(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.scores.append(np.asarray(conf, dtype=np.float32))
+        self.classes.append(np.asarray(cls, dtype=np.uint16))
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        offsets = np.concatenate([[0], np.cumsum(self.counts, dtype=np.int64)])
+        np.savez_compressed(
+            self.path,
+            names=np.array(self.names, dtype=str),
+            sizes=np.array(self.sizes, dtype=np.int32).reshape(-1, 2),
+            origins=np.array(self.origins, dtype=np.int64).reshape(-1, 2),
+            offsets=offsets,
+            boxes=np.concatenate(self.boxes) if self.boxes else np.zeros((0, 4), dtype=np.float32),
+            conf=np.concatenate(self.scores) if self.scores else np.zeros(0, dtype=np.float32),
+            cls=np.concatenate(self.classes) if self.classes else np.zeros(0, dtype=np.uint16),
+            meta=np.array(json.dumps(self.meta, ensure_ascii=False)))
+        print(f"候选框已保存: {self.path}（{len(self.names)} 张图像，{int(offsets[-1])} 个候选框，"
+              f"置信度 > {self.conf}，{os.path.getsize(self.path) / 1024 / 1024:.1f} MB）")
+        return self.path
+
+
+def load_candidates(path):
+    """读取候选框存储（path 为 npz 文件或其所在文件夹），返回数组字典，meta 解析为字典"""
+    if os.path.isdir(path):
+        path = os.path.join(path, CANDIDATE_STORE_NAME)
+    with np.load(path) as data:
+        store = {key: data[key] for key in data.files}
+    store['meta'] = json.loads(str(store['meta']))
+    store['groups'] = np.repeat(np.arange(len(store['names'])), np.diff(store['offsets']))
+    return store
+
+
+def nms(boxes, scores, iou):
+    """
+    贪心NMS，与 torchvision.ops.nms 一致：依次保留置信度最高的框，抑制与其IoU大于 iou 的框。
+    返回保留的下标，按置信度降序排列。
+    """
+    order = np.argsort(-scores, kind='stable')
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        inter = (np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None) *
+                 np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overlap = inter / (areas[i] + areas[rest] - inter)
+        # 面积为0时IoU为nan，与torchvision一样不抑制
+        order = rest[~(overlap > iou)]
+    return np.array(keep, dtype=np.int64)
+
+
+def clip_boxes(xyxy, size):
+    """检测框裁剪到图像范围内，size 为 (宽, 高) 或逐框的 (N, 2)；与ultralytics一样在NMS之后调用，返回副本"""
+    size = np.asarray(size, dtype=np.float32).reshape(-1, 2)
+    xyxy = np.array(xyxy, dtype=np.float32).reshape(-1, 4)
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, size[:, :1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, size[:, 1:])
+    return xyxy
+
+
+def select_detections(boxes, scores, classes, conf, iou, groups=None, max_det=300):
+    """
+    按 conf 过滤后在每组（图像或窗口）内按类别NMS，每组最多 max_det 个。
+    返回保留的下标，按组号、置信度降序排列。boxes 为未裁剪的候选框，保留的框再用 clip_boxes 裁剪。
+    只用numpy，重新筛选阈值时不需要导入torch。
+    """
+    idx = np.nonzero(scores > conf)[0]
+    if len(idx) == 0:
+        return idx
+    groups = np.zeros(len(scores), dtype=np.int64) if groups is None else groups
+    classes = classes.astype(np.int64)
+    keys = groups[idx].astype(np.int64) * (int(classes.max()) + 1) + classes[idx]
+    # 按 (组, 类别) 分段，每段单独NMS
+    idx = idx[np.argsort(keys, kind='stable')]
+    bounds = np.flatnonzero(np.diff(np.sort(keys))) + 1
+    boxes = np.asarray(boxes, dtype=np.float32)
+    keep = np.concatenate([part[nms(boxes[part], scores[part], iou)] for part in np.split(idx, bounds)])
+    keep = keep[np.lexsort((-scores[keep], groups[keep]))]
+    # 组内名次
+    kept_groups = groups[keep]
+    rank = np.arange(len(keep)) - np.searchsorted(kept_groups, kept_groups)
+    return keep[rank < max_det]
+
+
+def rethreshold(store, writer, conf=0.3, iou=0.01, max_det=300, merge_threshold=None):
+    """
+    按新的 conf/iou 从候选框生成检测结果并通过 writer 写出，返回写出的检测框数。
+    images 模式 writer 为 TxtLabelWriter 或 GeoLayerWriter；mosaic 模式为 GeoLayerWriter，
+    窗口内NMS后再跨窗口去重（merge_threshold 默认取推理时的值）。
+    """
+    meta = store['meta']
+    if conf < meta['store_conf']:
+        raise ValueError(f"conf {conf} 低于候选框的存储阈值 {meta['store_conf']}，需要重新推理")
+    boxes, scores, classes, groups = store['boxes'], store['conf'], store['cls'], store['groups']
+    keep = select_detections(boxes, scores, classes, conf, iou, groups, max_det)
+    # 与ultralytics一样NMS之后才裁剪到图像（窗口）范围
+    kept_boxes = clip_boxes(boxes[keep], store['sizes'][groups[keep]])
+
+    if meta['mode'] == 'mosaic':
+        from affine import Affine
+        from utils.yolo_tiled import cross_window_nms, pixel_boxes_to_rings
+
+        global_boxes = kept_boxes.astype(np.float64) + np.tile(store['origins'][groups[keep]], 2)
+        merge_threshold = meta['merge_threshold'] if merge_threshold is None else merge_threshold
+        merged = cross_window_nms(global_boxes, scores[keep], classes[keep], groups[keep], merge_threshold)
+        rings = pixel_boxes_to_rings(global_boxes[merged], Affine(*meta['transform'][:6]))
+        kept = keep[merged]
+        return writer.write_rings(rings, classes[kept], scores[kept], list(store['names'][groups[kept]]))
+
+    total = 0
+    bounds = np.searchsorted(groups[keep], np.arange(len(store['names']) + 1))
+    for i, name in enumerate(store['names']):
+        selected = keep[bounds[i]:bounds[i + 1]]
+        total += writer.write(str(name), tuple(store['sizes'][i]), kept_boxes[bounds[i]:bounds[i + 1]],
+                              scores[selected], classes[selected])
+    return total
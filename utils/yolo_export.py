@@ -0,0 +1,180 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from utils.vit_export import artifact_path
+"""
+YOLO检测模型导出为 ONNX 或 OpenVINO IR，用于没有GPU的服务器上的CPU推理。
+导出结果与 .pt 放在同一目录，文件名带 .pt 的哈希与 ultralytics 版本，例如
+config/happy.onnx-ul8.3.27-1a2b3c4d5e6f.onnx、config/happy.openvino-ul8.3.27-1a2b3c4d5e6f_openvino_model/，
+权重或 ultralytics 版本变化时自动重新导出。导出的模型输入尺寸与批大小均为动态维度，可用于分桶推理。
+首次导出时在样例图像上与 .pt 对比检测结果一致性与吞吐。
+"""
+
+EXPORT_FORMATS = ('onnx', 'openvino')
+BACKENDS = ('torch',) + EXPORT_FORMATS
+
+
+# 各导出格式导出与推理所需的包（ultralytics 缺包时会尝试在线安装，打包后的exe中无法安装，这里先检查）
+BACKEND_PACKAGES = {'onnx': ('onnx', 'onnxruntime'), 'openvino': ('openvino',)}
+
+
+def check_backend_packages(fmt):
+    """检查导出格式所需的包是否已安装，缺少时抛出 ImportError"""
+    from importlib.util import find_spec
+    missing = [name for name in BACKEND_PACKAGES.get(fmt, ()) if find_spec(name) is None]
+    if missing:
+        raise ImportError(f"--backend {fmt} 需要安装 {'、'.join(missing)}"
+                          f"（pip install {' '.join(missing)}，版本见requirements.txt）")
+
+
+def exported_model_path(model_path, fmt):
+    """导出模型的缓存路径（onnx 为文件，openvino 为 *_openvino_model 文件夹）"""
+    import ultralytics
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式 {fmt}，可选 {EXPORT_FORMATS}")
+    ext = '.onnx' if fmt == 'onnx' else '_openvino_model'
+    return artifact_path(model_path, f'{fmt}-ul{ultralytics.__version__}', ext)
+
+
+def export_model(model_path, fmt, imgsz=640):
+    """
+    导出模型到缓存路径并返回该路径。
+    在临时目录中导出，避免覆盖 .pt 旁边已有的同名 onnx 或 openvino 文件夹；导出完成后再移动到缓存路径。
+    """
+    from ultralytics import YOLO
+
+    target = exported_model_path(model_path, fmt)
+    with tempfile.TemporaryDirectory(prefix='yolo_export_') as workdir:
+        local_pt = shutil.copy(model_path, workdir)
+        exported = YOLO(local_pt).export(format=fmt, imgsz=imgsz, dynamic=True, half=False)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(exported, target)
+    print(f"YOLO模型已导出({fmt}): {target}")
+    return target
+
+
+def ensure_exported(model_path, fmt, imgsz=640, sample_source=None, conf=0.3, iou=0.01):
+    """
+    返回 (导出模型路径, 对比结果)。没有缓存时先导出，并在 sample_source（图像文件夹或大图）的样例图像上
+    打印与 .pt 的一致性与吞吐对比；已有缓存时直接返回，对比结果为 None。
+    """
+    check_backend_packages(fmt)
+    exported = exported_model_path(model_path, fmt)
+    if os.path.exists(exported):
+        print(f"使用已导出的YOLO模型({fmt}): {exported}")
+        return exported, None
+    export_model(model_path, fmt, imgsz)
+    images = sample_images(sample_source) if sample_source else []
+    report = compare_backends(model_path, exported, images, imgsz, conf, iou) if images else None
+    return exported, report
+
+
+def load_model(model_path, backend='torch', imgsz=640, sample_source=None, conf=0.3, iou=0.01):
+    """加载YOLO模型；backend 为 onnx/openvino 时使用缓存的导出模型（见 ensure_exported）"""
+    from ultralytics import YOLO
+
+    if backend == 'torch':
+        return YOLO(model_path)
+    exported, _ = ensure_exported(model_path, backend, imgsz, sample_source, conf, iou)
+    return YOLO(exported, task='detect')
+
+
+def box_iou(a, b):
+    """xyxy 检测框两两之间的IoU，返回 (len(a), len(b))"""
+    inter_w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_detections(ref, cand, iou_threshold=0.5):
+    """
+    按置信度贪心匹配两组检测 (xyxy, conf, cls)，同类别且IoU大于阈值视为同一目标。
+    返回 (匹配数, 匹配框的置信度差列表, 匹配框的坐标差列表)
+    """
+    ref_boxes, ref_conf, ref_cls = ref
+    cand_boxes, cand_conf, cand_cls = cand
+    if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+        return 0, [], []
+    ious = box_iou(ref_boxes, cand_boxes)
+    ious[ref_cls[:, None] != cand_cls[None, :]] = 0
+    used = np.zeros(len(cand_boxes), dtype=bool)
+    conf_diffs, coord_diffs = [], []
+    for i in np.argsort(-ref_conf):
+        candidates = np.where(~used & (ious[i] > iou_threshold))[0]
+        if len(candidates) == 0:
+            continue
+        j = candidates[np.argmax(ious[i, candidates])]
+        used[j] = True
+        conf_diffs.append(abs(float(ref_conf[i]) - float(cand_conf[j])))
+        coord_diffs.append(float(np.abs(ref_boxes[i] - cand_boxes[j]).max()))
+    return len(conf_diffs), conf_diffs, coord_diffs
+
+
+def _run_detections(model, images, imgsz, conf, iou, batch_size, repeat=2):
+    """在 images 上推理，返回 (最快一轮的吞吐, 每张图像的 (xyxy, conf, cls))"""
+    model.predict(source=images[:1], imgsz=imgsz, conf=conf, iou=iou, verbose=False)  # 预热
+    best = float('inf')
+    detections = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = list(model.predict(source=images, stream=True, batch=batch_size, imgsz=imgsz, conf=conf, iou=iou,
+                                     verbose=False))
+        best = min(best, time.perf_counter() - start)
+        detections = [(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy())
+                      for r in results]
+    return len(images) / best, detections
+
+
+def compare_backends(model_path, exported_path, images, imgsz=640, conf=0.3, iou=0.01, batch_size=8):
+    """在样例图像上对比 .pt 与导出模型：吞吐、检测框数、匹配率、置信度与坐标差"""
+    from ultralytics import YOLO
+
+    ref_ips, ref_dets = _run_detections(YOLO(model_path), images, imgsz, conf, iou, batch_size)
+    cand_ips, cand_dets = _run_detections(YOLO(exported_path, task='detect'), images, imgsz, conf, iou, batch_size)
+    ref_count = sum(len(d[0]) for d in ref_dets)
+    cand_count = sum(len(d[0]) for d in cand_dets)
+    matched, conf_diffs, coord_diffs = 0, [], []
+    for ref, cand in zip(ref_dets, cand_dets):
+        m, c, d = match_detections(ref, cand)
+        matched += m
+        conf_diffs += c
+        coord_diffs += d
+    report = {
+        'images': len(images),
+        'torch_ips': ref_ips,
+        'exported_ips': cand_ips,
+        'speedup': cand_ips / ref_ips,
+        'torch_boxes': ref_count,
+        'exported_boxes': cand_count,
+        'match_rate': matched / max(ref_count, cand_count) if max(ref_count, cand_count) else 1.0,
+        'mean_conf_diff': float(np.mean(conf_diffs)) if conf_diffs else 0.0,
+        'max_coord_diff': float(np.max(coord_diffs)) if coord_diffs else 0.0,
+    }
+    name = os.path.basename(exported_path)
+    print(f"导出模型对比（{len(images)} 张样例图像，输入 {imgsz}px）:")
+    print(f"{'模型':>10} {'张/秒':>10} {'检测框':>8}")
+    print(f"{'pt':>10} {ref_ips:>10.1f} {ref_count:>8}")
+    print(f"{'导出':>10} {cand_ips:>10.1f} {cand_count:>8}   ({name})")
+    print(f"加速比 {report['speedup']:.2f}x，检测框匹配率 {report['match_rate']:.2%}，"
+          f"置信度平均差 {report['mean_conf_diff']:.2e}，坐标最大差 {report['max_coord_diff']:.2f} px")
+    return report
+
+
+def sample_images(source, count=16):
+    """取样例图像（BGR）：文件夹取前 count 张，大图取前 count 个非空白窗口"""
+    if os.path.isfile(source):
+        from utils.yolo_tiled import iter_window_batches
+        for _, images, _ in iter_window_batches(source, 640, 0, count):
+            if images:
+                return images
+        return []
+    from utils.yolo_predict import list_images, read_image
+    return [read_image(path) for path in sorted(list_images(source))[:count]]
@@ -0,0 +1,522 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+from tqdm import tqdm
+from utils.bucketing import iter_bucketed_batches
+from functools import lru_cache, partial
+from utils.yolo_candidates import NO_NMS_IOU, clip_boxes, select_detections
+"""
+YOLO批量流式推理，由 cli/yolo_predict_cli.py 调用。
+
+模型只加载一次，图像读取与推理重叠：
+  readers=0  一个后台线程解码图像，letterbox 由 ultralytics 在推理线程中完成
+  readers>0  多个读取线程解码并 letterbox（与ultralytics相同：.pt 模型在同一批原图尺寸相同时为stride对齐的
+             最小矩形，否则为正方形；导出的 onnx/openvino 模型总是正方形，见 letterbox_stride。
+             ultralytics收到后不再改变图像），放入有界队列，
+             推理循环只做前向与后处理，检测框再映射回原图坐标；检测结果与 readers=0 一致
+各阶段耗时（解码、letterbox、读取线程因队列满阻塞、推理等待数据、推理、写出）汇总打印，用于确定读取线程数。
+每批以 stream=True 调用 model.predict，逐个取出 Results 直接写入输出目录，不经过 runs/detect/predict：
+  TxtLabelWriter  每张图像一个YOLO格式txt（可带置信度）
+  GeoLayerWriter  所有检测框映射到地理坐标后写入同一个 yolo_detections.shp
+多个进程可以同时推理到不同的输出目录，互不干扰。
+cv2 在函数内部导入，只使用写出工具（如 cli/yolo_rethreshold_cli.py）时不需要加载OpenCV。
+"""
+
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.tif', '.jpeg')
+DETECTION_LAYER_NAME = 'yolo_detections.shp'
+# YOLOv8 检测模型的最大下采样倍数，letterbox 的矩形填充按它对齐
+YOLO_STRIDE = 32
+
+
+def letterbox_stride(backend):
+    """
+    读取线程 letterbox 使用的 stride。ultralytics 只对 .pt 模型使用最小矩形（auto=True），
+    导出的 onnx/openvino 模型使用 auto=False，总是填充为 imgsz×imgsz；读取线程与之相同，
+    ultralytics 收到的图像已是最终尺寸，不会再填充一次。
+    """
+    return YOLO_STRIDE if backend == 'torch' else None
+
+_QUEUE_DONE = object()
+
+
+def list_images(input_dir):
+    """列出文件夹中的图像文件路径"""
+    return [os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith(IMAGE_EXTENSIONS)]
+
+
+def read_image(img_path):
+    """读取为BGR图像（与ultralytics一致），支持中文路径"""
+    import cv2
+    return cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def iter_in_background(iterable, prefetch=2):
+    """
+    在后台线程中迭代 iterable（如解码图像的生成器），主线程按顺序取出结果；
+    最多预先准备 prefetch 项，后台线程中的异常在主线程抛出。
+    """
+    out_queue = queue.Queue(maxsize=prefetch)
+
+    def produce():
+        try:
+            for item in iterable:
+                out_queue.put(item)
+        except Exception as e:
+            # 异常交给主线程抛出
+            out_queue.put(e)
+        finally:
+            out_queue.put(_QUEUE_DONE)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    while True:
+        item = out_queue.get()
+        if item is _QUEUE_DONE:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    worker.join()
+
+
+class StageTimer:
+    """按阶段累计耗时（秒），多个线程可同时累加"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+
+def letterbox(image, size, color=(114, 114, 114), stride=None):
+    """
+    等比缩放到最长边为 size 后居中填充，缩放、取整与填充值与ultralytics LetterBox一致：
+    stride 为空时填充为 size×size（auto=False），给定时只填充到 stride 的倍数，得到最小矩形（auto=True）。
+    返回 (图像, 缩放比例, (左侧填充, 上方填充))
+    """
+    import cv2
+
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (w, h) != (new_w, new_h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = size - new_w, size - new_h
+    if stride:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+
+def unletterbox_boxes(xyxy, ratio, pad, size, clip=True):
+    """
+    letterbox 后图像上的检测框映射回原图（尺寸 size=(宽, 高)）像素坐标。
+    clip=False 用于NMS前的候选框，NMS之后再 clip_boxes（与ultralytics的顺序一致）。
+    """
+    left, top = pad
+    xyxy = (xyxy - np.array([left, top, left, top], dtype=np.float32)) / ratio
+    return clip_boxes(xyxy, size) if clip else xyxy
+
+
+@lru_cache(maxsize=None)
+def candidate_predictor():
+    """
+    ultralytics DetectionPredictor 的子类，作为 model.predict(predictor=...) 传入。
+    ultralytics 在NMS之后才把检测框裁剪到原图范围；以 NO_NMS_IOU 推理候选框时若照常裁剪，
+    存下的就是裁剪后的框，重新筛选时图像边缘的框与直接推理的结果不同。因此 iou >= NO_NMS_IOU 时
+    检测框只映射回原图坐标、不裁剪（与 ops.scale_boxes 的缩放和填充相同），其他情况与父类完全一致。
+    """
+    from ultralytics.engine.results import Results
+    from ultralytics.models.yolo.detect import DetectionPredictor
+    from ultralytics.utils import ops
+
+    class CandidatePredictor(DetectionPredictor):
+        def postprocess(self, preds, img, orig_imgs):
+            if self.args.iou < NO_NMS_IOU:
+                return super().postprocess(preds, img, orig_imgs)
+            preds = ops.non_max_suppression(preds, self.args.conf, self.args.iou, agnostic=self.args.agnostic_nms,
+                                            max_det=self.args.max_det, classes=self.args.classes)
+            if not isinstance(orig_imgs, list):
+                orig_imgs = ops.convert_torch2numpy_batch(orig_imgs)
+            results = []
+            for pred, orig_img, img_path in zip(preds, orig_imgs, self.batch[0]):
+                (in_h, in_w), (h, w) = img.shape[2:], orig_img.shape[:2]
+                gain = min(in_h / h, in_w / w)
+                left, top = round((in_w - w * gain) / 2 - 0.1), round((in_h - h * gain) / 2 - 0.1)
+                pred[:, :4] = (pred[:, :4] - pred.new_tensor([left, top, left, top])) / gain
+                results.append(Results(orig_img, path=img_path, names=self.model.names, boxes=pred))
+            return results
+
+    return CandidatePredictor
+
+
+def _decode_tasks(tasks, timer):
+    """解码（不letterbox），产出 (输入尺寸, 批内路径, 图像列表, [(原图尺寸, None, None), ...])"""
+    for imgsz, paths in tasks:
+        start = time.perf_counter()
+        images = [read_image(p) for p in paths]
+        timer.add('decode', time.perf_counter() - start)
+        yield imgsz, paths, images, [((img.shape[1], img.shape[0]), None, None) for img in images]
+
+
+def letterbox_batch(images, out, stride=YOLO_STRIDE):
+    """
+    letterbox一批已解码的图像，写入形状为 (N, 输入尺寸, 输入尺寸, 3) 的 out 的左上角，
+    返回 ([(原图尺寸, 缩放比例, 填充), ...], letterbox后的 (高, 宽))。
+    与ultralytics对一批图像的处理一致：原图尺寸全部相同时填充为 stride 对齐的最小矩形，否则填充为正方形；
+    stride 为 None 时总是正方形（导出的模型，见 letterbox_stride）。
+    """
+    same_shapes = len({image.shape for image in images}) == 1
+    infos = []
+    shape = (out.shape[1], out.shape[2])
+    for i, image in enumerate(images):
+        boxed, ratio, pad = letterbox(image, out.shape[1], stride=stride if same_shapes else None)
+        shape = boxed.shape[:2]
+        out[i, :shape[0], :shape[1]] = boxed
+        infos.append(((image.shape[1], image.shape[0]), ratio, pad))
+    return infos, shape
+
+
+def fill_letterbox_batch(paths, out, stride=YOLO_STRIDE):
+    """
+    解码并letterbox一批图像（见 letterbox_batch），返回 (infos, letterbox后的 (高, 宽), 解码耗时, letterbox耗时)。
+    也是共享内存读取子进程的 fill 函数。
+    """
+    start = time.perf_counter()
+    images = [read_image(img_path) for img_path in paths]
+    decoded = time.perf_counter()
+    infos, shape = letterbox_batch(images, out, stride)
+    return infos, shape, decoded - start, time.perf_counter() - decoded
+
+
+def letterboxed_images(batch, shape):
+    """letterbox_batch 写出的批中每张图像的有效部分（视图，不复制）"""
+    return [image[:shape[0], :shape[1]] for image in batch]
+
+
+def _prepare_task(imgsz, paths, timer, stride=YOLO_STRIDE):
+    """解码并letterbox一批图像，产出格式同 _decode_tasks，附带缩放比例与填充"""
+    batch = np.empty((len(paths), imgsz, imgsz, 3), dtype=np.uint8)
+    infos, shape, decode_s, letterbox_s = fill_letterbox_batch(paths, batch, stride)
+    timer.add('decode', decode_s)
+    timer.add('letterbox', letterbox_s)
+    return imgsz, paths, letterboxed_images(batch, shape), infos
+
+
+def iter_prepared_batches(tasks, readers=2, queue_size=4, timer=None, stride=YOLO_STRIDE):
+    """
+    readers 个读取线程从任务队列取批，解码并letterbox（stride 见 letterbox_stride）后放入最多 queue_size 批的
+    有界队列，主线程按完成顺序取出（批之间的顺序不保证）。读取线程中的异常在主线程抛出。
+    """
+    timer = timer or StageTimer()
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        timer.add('reader_blocked', time.perf_counter() - start)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                try:
+                    imgsz, paths = task_queue.get_nowait()
+                except queue.Empty:
+                    break
+                put(_prepare_task(imgsz, paths, timer, stride))
+        except Exception as e:
+            # 异常交给主线程抛出
+            put(e)
+        finally:
+            put(_QUEUE_DONE)
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(max(1, readers))]
+    for thread in threads:
+        thread.start()
+    finished = 0
+    try:
+        while finished < len(threads):
+            item = out_queue.get()
+            if item is _QUEUE_DONE:
+                finished += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def iter_shared_prepared_batches(tasks, readers=2, queue_size=4, timer=None, stride=YOLO_STRIDE):
+    """
+    同 iter_prepared_batches，但读取在 readers 个子进程中完成，letterbox后的批经共享内存环形缓冲区
+    传回推理进程，不经过 pickle（见 utils/shm_ring.py）。产出的图像是缓冲区上的视图，取下一批时回收。
+    """
+    from utils.shm_ring import iter_shared_batches
+
+    timer = timer or StageTimer()
+    shared = [((len(paths), imgsz, imgsz, 3), np.uint8, paths) for imgsz, paths in tasks]
+    for paths, batch, (infos, shape, decode_s, letterbox_s) in iter_shared_batches(
+            shared, partial(fill_letterbox_batch, stride=stride), readers, slots=readers + queue_size + 1,
+            timer=timer):
+        timer.add('decode', decode_s)
+        timer.add('letterbox', letterbox_s)
+        yield batch.shape[1], paths, letterboxed_images(batch, shape), infos
+
+
+def result_arrays(result):
+    """Results 中的检测框，返回 (xyxy像素坐标 float32 (N, 4), 置信度 (N,), 类别 int (N,))"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return (boxes.xyxy.cpu().numpy().astype(np.float32), boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(np.int64))
+
+
+def boxes_to_lines(xyxy, conf, cls, width, height, save_conf=False):
+    """像素坐标检测框转换为YOLO格式文本行（与ultralytics save_txt格式一致）"""
+    lines = []
+    scale = np.array([width, height, width, height], dtype=np.float32)
+    for (x0, y0, x1, y1), c, k in zip(xyxy / scale, conf, cls):
+        values = (int(k), float((x0 + x1) / 2), float((y0 + y1) / 2), float(x1 - x0), float(y1 - y0))
+        values += (float(c),) if save_conf else ()
+        lines.append(("%g " * len(values)).rstrip() % values)
+    return lines
+
+
+def write_label(img_path, lines, output_dir):
+    """写出与图像同名的txt标签；没有检测框时不写文件（与ultralytics一致）"""
+    if not lines:
+        return
+    name = os.path.splitext(os.path.basename(img_path))[0] + '.txt'
+    with open(os.path.join(output_dir, name), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class TxtLabelWriter:
+    """每张图像写一个YOLO格式txt：类别 x y w h [置信度]，坐标为归一化值"""
+    def __init__(self, output_dir, save_conf=True):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.save_conf = save_conf
+
+    def write(self, img_path, size, xyxy, conf, cls):
+        """写出一张图像（尺寸 size=(宽, 高)）的检测结果，返回检测框数"""
+        lines = boxes_to_lines(xyxy, conf, cls, size[0], size[1], self.save_conf)
+        write_label(img_path, lines, self.output_dir)
+        return len(lines)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class GeoTransformLookup:
+    """
+    按图像名查找地理变换 (左上角x, 左上角y, x像元大小, y像元大小)，依次尝试：
+    geo_dir 中的同名tfw（cli/cutting_cli.py 的输出）、geo_dir 中的 crop_manifest.csv（平铺裁剪的输出）、
+    图像自身的地理变换（GeoTIFF）。
+    """
+    def __init__(self, geo_dir=None):
+        from utils.shp_kuang_cut import MANIFEST_NAME, read_crop_manifest
+        self.geo_dir = geo_dir
+        manifest_path = os.path.join(geo_dir, MANIFEST_NAME) if geo_dir else None
+        self.manifest = read_crop_manifest(manifest_path) if manifest_path and os.path.exists(manifest_path) else {}
+
+    def get(self, img_path):
+        base_name = os.path.splitext(os.path.basename(img_path))[0]
+        if self.geo_dir:
+            tfw_path = os.path.join(self.geo_dir, base_name + '.tfw')
+            if os.path.exists(tfw_path):
+                from utils.txt_to_shp import read_tfw
+                return read_tfw(tfw_path)
+        if base_name in self.manifest:
+            return self.manifest[base_name][:4]
+        import rasterio
+        with rasterio.open(img_path) as src:
+            if src.transform.is_identity:
+                raise ValueError(f"找不到 {img_path} 的地理变换（tfw、裁剪清单或GeoTIFF地理信息）")
+            transform = src.transform
+        return transform.c, transform.f, transform.a, transform.e
+
+
+def image_crs(img_path, default='EPSG:4326'):
+    """图像的坐标系，没有时使用 default（与 txt_to_shp 的默认坐标系一致）"""
+    import rasterio
+    with rasterio.open(img_path) as src:
+        return src.crs if src.crs else default
+
+
+class GeoLayerWriter:
+    """
+    检测框（像素坐标 xyxy）映射到地理坐标，全部写入 output_dir/yolo_detections.shp，
+    字段为 Class、Conf 与 chip_id（图像名）。
+    """
+    def __init__(self, output_dir, crs, geo_dir=None, layer_name=DETECTION_LAYER_NAME):
+        import fiona
+        os.makedirs(output_dir, exist_ok=True)
+        self.lookup = GeoTransformLookup(geo_dir)
+        schema = {'geometry': 'Polygon',
+                  'properties': {'Class': 'int', 'Conf': 'float', 'chip_id': 'str:32'}}
+        self.layer = fiona.open(os.path.join(output_dir, layer_name), 'w', driver='ESRI Shapefile',
+                                crs=crs, schema=schema)
+
+    def write(self, img_path, size, xyxy, conf, cls):
+        """写出一张图像的检测结果（像素坐标 xyxy），返回检测框数"""
+        if len(xyxy) == 0:
+            return 0
+        top_left_x, top_left_y, x_pixel_size, y_pixel_size = self.lookup.get(img_path)
+        xyxy = np.asarray(xyxy, dtype=np.float64)
+        xs = top_left_x + xyxy[:, [0, 2, 2, 0, 0]] * x_pixel_size
+        ys = top_left_y + xyxy[:, [1, 1, 3, 3, 1]] * y_pixel_size
+        chip_id = os.path.splitext(os.path.basename(img_path))[0]
+        return self.write_rings(np.stack([xs, ys], axis=-1), cls, conf, [chip_id] * len(xs))
+
+    def write_rings(self, rings, classes, confs, chip_ids):
+        """写出地理坐标下的检测框，rings 形状为 (N, 5, 2) 的闭合外环，返回写出数"""
+        features = []
+        for ring, cls, conf, chip_id in zip(rings, classes, confs, chip_ids):
+            features.append({'geometry': {'type': 'Polygon', 'coordinates': [[tuple(p) for p in ring.tolist()]]},
+                             'properties': {'Class': int(cls), 'Conf': float(conf), 'chip_id': chip_id}})
+        self.layer.writerecords(features)
+        return len(features)
+
+    def close(self):
+        self.layer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _write_detections(writer, store, img_path, size, xyxy, scores, classes, conf, iou):
+    """给定 store 时先存入NMS前（未裁剪的）候选框，再按 conf/iou 筛选并裁剪到图像范围；写出并返回检测框数"""
+    if store:
+        store.add(img_path, size, xyxy, scores, classes)
+        keep = select_detections(xyxy, scores, classes, conf, iou)
+        xyxy, scores, classes = clip_boxes(xyxy[keep], size), scores[keep], classes[keep]
+    return writer.write(img_path, size, xyxy, scores, classes)
+
+
+def predict_batched(model, groups, writer, batch_size=16, conf=0.3, iou=0.01, prefetch=2, store=None, readers=0,
+                    reader_processes=False, backend='torch'):
+    """
+    批量流式推理。groups 为 {输入尺寸: [图像路径, ...]}（不分桶时只有一组），
+    writer 为 TxtLabelWriter 或 GeoLayerWriter。
+    readers>0 时由 readers 个读取线程解码并letterbox，prefetch 为就绪批队列的容量；
+    readers=0 时一个后台线程只解码，预先准备 prefetch 批。
+    reader_processes=True 时读取线程改为子进程，批数据经共享内存环形缓冲区传回。
+    backend 为模型的后端（torch/onnx/openvino），决定读取线程的letterbox方式（见 letterbox_stride）。
+    给定 store（CandidateStore）时以低阈值、不做NMS推理，候选框全部存入 store，再按 conf/iou 筛选后写出。
+    返回统计字典：图像数、检测框数、墙钟时间与各阶段耗时。
+    """
+    predict_conf, predict_iou, max_det = (store.conf, NO_NMS_IOU, store.max_det) if store else (conf, iou, 300)
+    timer = StageTimer()
+    tasks = list(iter_bucketed_batches(groups, batch_size))
+    if readers > 0 and reader_processes:
+        batches = iter_shared_prepared_batches(tasks, readers, prefetch, timer, letterbox_stride(backend))
+    elif readers > 0:
+        batches = iter_prepared_batches(tasks, readers, prefetch, timer, letterbox_stride(backend))
+    else:
+        batches = iter_in_background(_decode_tasks(tasks, timer), prefetch)
+    total = sum(len(paths) for paths in groups.values())
+    stats = {'images': 0, 'boxes': 0, 'readers': readers, 'reader_processes': reader_processes}
+    began = time.perf_counter()
+    with tqdm(total=total, desc="YOLO推理") as progress:
+        start = time.perf_counter()
+        for imgsz, batch_paths, images, infos in batches:
+            loaded = time.perf_counter()
+            timer.add('wait', loaded - start)
+            results = list(model.predict(source=images, stream=True, batch=len(images), conf=predict_conf,
+                                         iou=predict_iou, max_det=max_det, imgsz=imgsz, verbose=False,
+                                         predictor=candidate_predictor()))
+            inferred = time.perf_counter()
+            timer.add('infer', inferred - loaded)
+            for img_path, (size, ratio, pad), result in zip(batch_paths, infos, results):
+                xyxy, scores, classes = result_arrays(result)
+                if ratio is not None:
+                    xyxy = unletterbox_boxes(xyxy, ratio, pad, size, clip=store is None)
+                stats['boxes'] += _write_detections(writer, store, img_path, size, xyxy, scores, classes, conf, iou)
+            timer.add('write', time.perf_counter() - inferred)
+            stats['images'] += len(batch_paths)
+            progress.update(len(batch_paths))
+            start = time.perf_counter()
+    stats['elapsed_s'] = time.perf_counter() - began
+    stats.update({f'{stage}_s': seconds for stage, seconds in timer.totals.items()})
+    return stats
+
+
+def predict_remote(client, model_path, backend, groups, writer, batch_size=16, conf=0.3, iou=0.01, prefetch=2,
+                   store=None):
+    """
+    同 predict_batched，但解码与推理由常驻推理服务完成（见 utils/infer_server.py），只发送图像路径。
+    后台线程发送下一批请求，与本批结果的写出重叠。
+    """
+    predict_conf, predict_iou, max_det = (store.conf, NO_NMS_IOU, store.max_det) if store else (conf, iou, 300)
+    requests = ((paths, client.yolo(paths, model_path, backend, imgsz, predict_conf, predict_iou, max_det))
+                for imgsz, paths in iter_bucketed_batches(groups, batch_size))
+    total = sum(len(paths) for paths in groups.values())
+    stats = {'images': 0, 'boxes': 0, 'server': client.url, 'wait_s': 0.0, 'write_s': 0.0}
+    began = time.perf_counter()
+    with tqdm(total=total, desc="YOLO推理(推理服务)") as progress:
+        start = time.perf_counter()
+        for batch_paths, detections in iter_in_background(requests, prefetch):
+            received = time.perf_counter()
+            stats['wait_s'] += received - start
+            for img_path, (size, xyxy, scores, classes) in zip(batch_paths, detections):
+                stats['boxes'] += _write_detections(writer, store, img_path, size, xyxy, scores, classes, conf, iou)
+            stats['write_s'] += time.perf_counter() - received
+            stats['images'] += len(batch_paths)
+            progress.update(len(batch_paths))
+            start = time.perf_counter()
+    stats['elapsed_s'] = time.perf_counter() - began
+    return stats
+
+
+def print_stats(stats):
+    """打印吞吐与各阶段耗时，并根据推理等待数据/读取线程阻塞的比例给出读取线程数建议"""
+    images, elapsed = stats['images'], stats['elapsed_s']
+    print(f"YOLO推理: 共 {images} 张, 检测框 {stats['boxes']} 个, 用时 {elapsed:.2f} s, "
+          f"{images / elapsed if elapsed > 0 else float('inf'):.1f} 张/秒")
+    if stats.get('server'):
+        print(f"  推理服务 {stats['server']}: 等待结果 {stats['wait_s']:.2f} s, "
+              f"候选框筛选与写出 {stats['write_s']:.2f} s")
+        return
+    readers = stats.get('readers', 0)
+    kind = '读取子进程' if stats.get('reader_processes') else '读取线程'
+    print(f"  读取({kind + ' ' + str(readers) + ' 个，累计' if readers else '后台线程，不含letterbox'}): "
+          f"解码 {stats.get('decode_s', 0.0):.2f} s, letterbox {stats.get('letterbox_s', 0.0):.2f} s, "
+          f"队列满阻塞 {stats.get('reader_blocked_s', 0.0):.2f} s")
+    print(f"  推理循环: 等待数据 {stats.get('wait_s', 0.0):.2f} s, 推理 {stats.get('infer_s', 0.0):.2f} s, "
+          f"后处理与写出 {stats.get('write_s', 0.0):.2f} s")
+    # 读取线程很少阻塞而推理循环常等待数据时读取是瓶颈；读取线程大部分时间阻塞时线程过多
+    blocked = stats.get('reader_blocked_s', 0.0) / max(readers, 1)
+    if elapsed > 0 and stats.get('wait_s', 0.0) > 0.1 * elapsed and blocked < 0.1 * elapsed:
+        print("  推理循环有较多时间在等待数据，可增加 --readers")
+    elif readers > 1 and blocked > 0.5 * elapsed:
+        print("  读取线程大部分时间在等待队列空位，可减少 --readers")
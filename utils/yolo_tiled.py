@@ -0,0 +1,183 @@
+import time
+import numpy as np
+from tqdm import tqdm
+from utils.yolo_predict import iter_in_background, result_arrays, candidate_predictor
+from utils.yolo_candidates import NO_NMS_IOU, clip_boxes, select_detections
+"""
+YOLO滑窗推理：直接在原始大图上按窗口读取（可重叠），组批推理，检测框映射到地理坐标，
+跨窗口去重后写入一个图层。替代 裁剪瓦片 → 逐瓦片推理 → txt转shp → 合并shp 四个步骤，不产生中间文件。
+
+窗口在后台线程中读取，与推理重叠；全为0的空白窗口跳过（与 utils/cutting.py 一致）。
+相邻窗口重叠区域内的同一目标会被检测两次，其中一个常被窗口边缘截断，
+因此跨窗口去重使用 交集/较小框面积（IoS）而不是IoU。
+"""
+
+
+def window_offsets(length, tile_size, stride):
+    """一维上的窗口起点；最后一个窗口贴齐边缘，保证覆盖全图"""
+    if length <= tile_size:
+        return [0]
+    offsets = list(range(0, length - tile_size + 1, stride))
+    if offsets[-1] != length - tile_size:
+        offsets.append(length - tile_size)
+    return offsets
+
+
+def iter_windows(width, height, tile_size=640, overlap=64):
+    """按行依次产出覆盖全图的窗口 (col_off, row_off, width, height)"""
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError(f"重叠像素 {overlap} 必须小于窗口大小 {tile_size}")
+    for row in window_offsets(height, tile_size, stride):
+        for col in window_offsets(width, tile_size, stride):
+            yield col, row, min(tile_size, width - col), min(tile_size, height - row)
+
+
+def iter_window_batches(raster_path, tile_size, overlap, batch_size):
+    """
+    读取窗口并组批，产出 (窗口左上角 (col, row) 列表, BGR图像列表, 本批扫描的窗口数)。
+    数据集在迭代所在的线程内打开（predict_mosaic 中为后台读取线程）。
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(raster_path) as src:
+        bands = [1, 2, 3] if src.count >= 3 else [1, 1, 1]
+        windows, images, scanned = [], [], 0
+        for col, row, width, height in iter_windows(src.width, src.height, tile_size, overlap):
+            scanned += 1
+            data = src.read(bands, window=Window(col, row, width, height))
+            if not data.any():
+                continue
+            windows.append((col, row))
+            # (C, H, W) RGB -> (H, W, C) BGR，与ultralytics读取图像文件的通道顺序一致
+            images.append(np.ascontiguousarray(data.transpose(1, 2, 0)[:, :, ::-1]))
+            if len(images) == batch_size:
+                yield windows, images, scanned
+                windows, images, scanned = [], [], 0
+        if images or scanned:
+            yield windows, images, scanned
+
+
+def count_windows(width, height, tile_size=640, overlap=64):
+    stride = tile_size - overlap
+    return len(window_offsets(width, tile_size, stride)) * len(window_offsets(height, tile_size, stride))
+
+
+def cross_window_nms(boxes, scores, classes, window_ids, threshold=0.5):
+    """
+    跨窗口去重：来自不同窗口、同一类别、IoS（交集/较小框面积）大于 threshold 的检测框中只保留置信度最高的。
+    boxes 为全图像素坐标 xyxy，返回保留的下标（按置信度降序）。
+    用 STRtree 只比较相交的框对，检测框数量很多时也不会两两比较。
+    """
+    import shapely
+
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    tree = shapely.STRtree(shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]))
+    i, j = tree.query(tree.geometries, predicate='intersects')
+    mask = (i < j) & (classes[i] == classes[j]) & (window_ids[i] != window_ids[j])
+    i, j = i[mask], j[mask]
+
+    inter_w = np.minimum(boxes[i, 2], boxes[j, 2]) - np.maximum(boxes[i, 0], boxes[j, 0])
+    inter_h = np.minimum(boxes[i, 3], boxes[j, 3]) - np.maximum(boxes[i, 1], boxes[j, 1])
+    inter = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ios = inter / np.maximum(np.minimum(areas[i], areas[j]), 1e-9)
+    i, j = i[ios > threshold], j[ios > threshold]
+
+    # 重叠框对整理为邻接表（双向）
+    src = np.concatenate([i, j])
+    dst = np.concatenate([j, i])
+    order = np.argsort(src, kind='stable')
+    src, dst = src[order], dst[order]
+    starts = np.searchsorted(src, np.arange(len(boxes)))
+    ends = np.searchsorted(src, np.arange(len(boxes)), side='right')
+
+    # 按置信度从高到低贪心保留
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for idx in np.argsort(-scores, kind='stable'):
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        suppressed[dst[starts[idx]:ends[idx]]] = True
+    return np.asarray(keep, dtype=np.int64)
+
+
+def pixel_boxes_to_rings(boxes, transform):
+    """全图像素坐标 xyxy 经仿射变换映射为地理坐标下的闭合外环，形状 (N, 5, 2)"""
+    px = boxes[:, [0, 2, 2, 0, 0]]
+    py = boxes[:, [1, 1, 3, 3, 1]]
+    xs = transform.a * px + transform.b * py + transform.c
+    ys = transform.d * px + transform.e * py + transform.f
+    return np.stack([xs, ys], axis=-1)
+
+
+def predict_mosaic(model, raster_path, writer, tile_size=640, overlap=64, imgsz=640, batch_size=16, conf=0.3,
+                   iou=0.01, merge_threshold=0.5, prefetch=2, store=None):
+    """
+    在大图上滑窗推理，检测框跨窗口去重后通过 writer（GeoLayerWriter）写出。
+    给定 store（CandidateStore）时每个窗口的NMS前候选框存入 store，再按 conf/iou 筛选。
+    返回统计字典：窗口数、跳过的空白窗口数、去重前后的检测框数与各阶段耗时。
+    """
+    import rasterio
+
+    with rasterio.open(raster_path) as src:
+        width, height, transform = src.width, src.height, src.transform
+    total = count_windows(width, height, tile_size, overlap)
+    predict_conf, predict_iou, max_det = (store.conf, NO_NMS_IOU, store.max_det) if store else (conf, iou, 300)
+    if store:
+        store.meta.update(transform=list(transform)[:6], merge_threshold=merge_threshold)
+    print(f"滑窗推理: {width}x{height}, 窗口 {tile_size}px, 重叠 {overlap}px, 共 {total} 个窗口")
+
+    all_boxes, all_scores, all_classes, all_windows, window_names = [], [], [], [], []
+    stats = {'windows': 0, 'skipped': 0, 'raw_boxes': 0, 'boxes': 0,
+             'read_wait_s': 0.0, 'infer_s': 0.0, 'merge_s': 0.0}
+    with tqdm(total=total, desc="YOLO滑窗推理") as progress:
+        start = time.perf_counter()
+        for windows, images, scanned in iter_in_background(
+                iter_window_batches(raster_path, tile_size, overlap, batch_size), prefetch):
+            loaded = time.perf_counter()
+            stats['read_wait_s'] += loaded - start
+            if images:
+                results = model.predict(source=images, stream=True, batch=len(images), conf=predict_conf,
+                                        iou=predict_iou, max_det=max_det, imgsz=imgsz, verbose=False,
+                                        predictor=candidate_predictor())
+                for (col, row), image, result in zip(windows, images, results):
+                    xyxy, scores, classes = result_arrays(result)
+                    if store:
+                        size = (image.shape[1], image.shape[0])
+                        store.add(f'{col}_{row}', size, xyxy, scores, classes, (col, row))
+                        keep = select_detections(xyxy, scores, classes, conf, iou)
+                        xyxy, scores, classes = clip_boxes(xyxy[keep], size), scores[keep], classes[keep]
+                    if len(xyxy) == 0:
+                        continue
+                    all_boxes.append(xyxy.astype(np.float64) + np.array([col, row, col, row]))
+                    all_scores.append(scores)
+                    all_classes.append(classes)
+                    all_windows.append(np.full(len(xyxy), len(window_names)))
+                    window_names.append(f'{col}_{row}')
+            stats['windows'] += len(images)
+            stats['skipped'] += scanned - len(images)
+            stats['infer_s'] += time.perf_counter() - loaded
+            progress.update(scanned)
+            start = time.perf_counter()
+
+    start = time.perf_counter()
+    if all_boxes:
+        boxes, scores = np.concatenate(all_boxes), np.concatenate(all_scores)
+        classes, window_ids = np.concatenate(all_classes), np.concatenate(all_windows)
+        keep = cross_window_nms(boxes, scores, classes, window_ids, merge_threshold)
+        rings = pixel_boxes_to_rings(boxes[keep], transform)
+        writer.write_rings(rings, classes[keep], scores[keep], [window_names[w] for w in window_ids[keep]])
+        stats['raw_boxes'], stats['boxes'] = len(boxes), len(keep)
+    stats['merge_s'] = time.perf_counter() - start
+    return stats
+
+
+def print_mosaic_stats(stats):
+    print(f"滑窗推理: 推理窗口 {stats['windows']} 个, 跳过空白窗口 {stats['skipped']} 个, "
+          f"检测框 {stats['raw_boxes']} -> 跨窗口去重后 {stats['boxes']}")
+    print(f"  读取等待: {stats['read_wait_s']:.2f} s, 推理: {stats['infer_s']:.2f} s, "
+          f"去重与写出: {stats['merge_s']:.2f} s")